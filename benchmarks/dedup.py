@@ -0,0 +1,44 @@
+"""
+Measures the memory, false positive rate and speed of the Bloom filters in
+tor_core.dedup against the plain set of fullnames they replace.
+
+    python -m benchmarks.dedup [items]
+"""
+import sys
+import timeit
+
+from tor_core.dedup import BloomFilter
+from tor_core.dedup import RotatingBloomFilter
+
+
+def set_nbytes(seen):
+    return sys.getsizeof(seen) + sum(sys.getsizeof(item) for item in seen)
+
+
+def main(items=1000000):
+    fullnames = [f't3_{i:x}' for i in range(items)]
+    unseen = [f't1_{i:x}' for i in range(items)]
+
+    for name, seen, nbytes in (
+        ('set', set(), set_nbytes),
+        ('bloom', BloomFilter(items), lambda bloom: bloom.nbytes),
+        ('rotating', RotatingBloomFilter(items // 4),
+         lambda bloom: bloom.nbytes),
+    ):
+        added = timeit.timeit(
+            lambda: [seen.add(item) for item in fullnames], number=1
+        )
+        checked = timeit.timeit(
+            lambda: [item in seen for item in unseen], number=1
+        )
+        false_positives = sum(item in seen for item in unseen)
+        print(
+            f'{name:<20} {items} items: {nbytes(seen) / 2 ** 20:7.1f} MB, '
+            f'add {added / items * 1e6:5.2f} us, '
+            f'check {checked / items * 1e6:5.2f} us, '
+            f'false positives {false_positives / items:.5f}'
+        )
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
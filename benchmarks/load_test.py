@@ -0,0 +1,30 @@
+"""
+Runs a sample bot's main loop against a fake Reddit generating new posts and
+inbox replies, and reports whether it keeps up: items handled per minute,
+how long they waited (in seconds), API calls per item and peak memory. The
+fake quota is Reddit's unless given, in requests per 600 seconds.
+
+    python -m benchmarks.load_test [posts_per_minute] [comments_per_minute]
+        [seconds] [quota]
+"""
+import json
+import logging
+import sys
+
+from tor_core.load_test import run_load_test
+
+
+def main(posts_per_minute=120, comments_per_minute=60, seconds=30,
+         quota=600):
+    logging.basicConfig(level=logging.WARNING)
+    report = run_load_test(
+        posts_per_minute=posts_per_minute,
+        comments_per_minute=comments_per_minute,
+        seconds=seconds,
+        ratelimit_requests=quota,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,63 @@
+"""
+Times building post bodies for a large batch of submissions with
+PostBodyBuilder, next to working each one out from the config as it comes.
+
+    python -m benchmarks.post_builder [posts]
+"""
+import re
+import sys
+import timeit
+
+from tor_core.config import Config
+from tor_core.helpers import _
+from tor_core.post_builder import PostBodyBuilder
+
+
+def old_render(config, subreddit, url):
+    header = config.header if config.perform_header_check else ''
+    if subreddit in config.no_link_header_subs:
+        header = re.sub(r'\[([^\]]*)\]\([^)]*\)', r'\1', header)
+
+    formatting = config.other_formatting
+    for content_type, domains in (
+        ('video', config.video_domains),
+        ('audio', config.audio_domains),
+        ('image', config.image_domains),
+    ):
+        if any(domain in url for domain in domains):
+            formatting = getattr(config, f'{content_type}_formatting')
+            break
+
+    return _(header + '\n\n' + formatting)
+
+
+def main(posts=100000):
+    config = Config()
+    config.replace(
+        header='This post is in need of a [transcription](https://redd.it/x)!'
+               ' Please read [the guide](https://redd.it/y) first.',
+        video_formatting='*Video Transcription*',
+        audio_formatting='*Audio Transcription*',
+        image_formatting='*Image Transcription*',
+        other_formatting='*Transcription*',
+        video_domains=[f'video{i}.com' for i in range(50)],
+        audio_domains=[f'audio{i}.com' for i in range(50)],
+        image_domains=[f'image{i}.com' for i in range(50)],
+        no_link_header_subs=[f'nolinks{i}' for i in range(50)],
+    )
+    batch = [
+        (f'nolinks{i % 100}', f'https://i.image{i % 60}.com/{i}.png')
+        for i in range(posts)
+    ]
+    builder = PostBodyBuilder(config)
+
+    for name, func in (
+        ('render (old)', lambda: [old_render(config, *p) for p in batch]),
+        ('render_batch', lambda: builder.render_batch(batch)),
+    ):
+        best = min(timeit.repeat(func, number=1, repeat=5))
+        print(f'{name:<20} {posts} posts: {best * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
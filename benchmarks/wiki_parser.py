@@ -0,0 +1,51 @@
+"""
+Times the wiki config parsers against generated pages far larger than the
+real ones, next to the split-based parsing they replaced.
+
+    python -m benchmarks.wiki_parser [lines]
+"""
+import sys
+import timeit
+
+from tor_core.wiki_parser import parse_domains
+from tor_core.wiki_parser import parse_thresholds
+
+
+def old_parse_thresholds(page):
+    thresholds = {}
+    for line in page.splitlines():
+        if ',' in line:
+            sub, threshold = line.split(',')
+            thresholds[sub] = int(threshold)
+    return thresholds
+
+
+def old_parse_domains(page):
+    domains = {}
+    for domainset in ''.join(page.splitlines()).split('---'):
+        name = domainset[:domainset.index(':')]
+        domains[name] = domainset[domainset.index('['):].strip('[]').split(', ')
+    return domains
+
+
+def main(lines=100000):
+    thresholds_page = '\r\n'.join(f'subreddit{i},{i}' for i in range(lines))
+    domains_page = '\r\n---\r\n'.join(
+        f'section{s}: [' + ',\r\n'.join(
+            f'domain{i}.com' for i in range(lines // 10)
+        ) + ']'
+        for s in range(10)
+    )
+
+    for name, func, page in (
+        ('thresholds (old)', old_parse_thresholds, thresholds_page),
+        ('thresholds', parse_thresholds, thresholds_page),
+        ('domains (old)', old_parse_domains, domains_page),
+        ('domains', parse_domains, domains_page),
+    ):
+        best = min(timeit.repeat(lambda: func(page), number=1, repeat=5))
+        print(f'{name:<20} {lines} lines: {best * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
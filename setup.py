@@ -43,6 +43,9 @@ def long_description():
 test_deps = [
     'pytest',
     'pytest-cov',
+    # fakeredis 1.0 needs redis 3, and lupa runs its Lua scripts
+    'fakeredis<1.0',
+    'lupa',
 ]
 dev_helper_deps = [
     'better-exceptions',
@@ -0,0 +1,18 @@
+import fakeredis
+import pytest
+
+
+class ScriptingRedis(fakeredis.FakeStrictRedis):
+    # this fakeredis has EVAL but not the script registry built on EVALSHA
+    def register_script(self, script):
+        def run(keys=(), args=()):
+            return self.eval(script, len(keys), *keys, *args)
+        return run
+
+
+@pytest.fixture
+def scripting_redis():
+    """A fakeredis client that runs `register_script()` scripts."""
+    redis = ScriptingRedis()
+    redis.flushall()
+    return redis
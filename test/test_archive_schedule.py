@@ -0,0 +1,91 @@
+from tor_core.archive_schedule import ARCHIVE_TIME_UNIT
+from tor_core.archive_schedule import HeapArchiveSchedule
+from tor_core.archive_schedule import RedisArchiveSchedule
+from tor_core.archive_schedule import archive_due
+from tor_core.archive_schedule import due_time
+from tor_core.config import Config
+from tor_core.helpers import Object
+
+
+def test_due_time_uses_subreddit_override():
+    """Archive time falls back to the default for unlisted subreddits
+    """
+    config = Config()
+    config.archive_time_default = 2
+    config.archive_time_subreddits = {'comics': 10}
+
+    assert due_time('Comics', 100, config) == 100 + 10 * ARCHIVE_TIME_UNIT
+    assert due_time('pics', 100, config) == 100 + 2 * ARCHIVE_TIME_UNIT
+
+
+def test_heap_schedule_pops_only_due_posts_in_order():
+    schedule = HeapArchiveSchedule()
+    schedule.add('t3_c', 30)
+    schedule.add('t3_a', 10)
+    schedule.add('t3_b', 20)
+
+    assert schedule.pop_due(now=25) == ['t3_a', 't3_b']
+    assert schedule.pop_due(now=25) == []
+    assert len(schedule) == 1
+
+
+def test_heap_schedule_reschedule_and_remove():
+    schedule = HeapArchiveSchedule()
+    schedule.add('t3_a', 10)
+    schedule.add('t3_b', 10)
+    schedule.add('t3_a', 50)
+    schedule.remove('t3_b')
+
+    assert schedule.pop_due(now=20) == []
+    assert schedule.pop_due(now=60) == ['t3_a']
+    assert len(schedule) == 0
+
+
+def test_heap_schedule_respects_limit():
+    schedule = HeapArchiveSchedule()
+    for i in range(5):
+        schedule.add(f't3_{i}', i)
+
+    assert schedule.pop_due(now=10, limit=2) == ['t3_0', 't3_1']
+    assert len(schedule) == 3
+
+
+def _redis_schedule(redis):
+    config = Object()
+    config.redis = redis
+    return RedisArchiveSchedule(config, name='test')
+
+
+def test_redis_schedule_pops_due_posts_in_order(scripting_redis):
+    schedule = _redis_schedule(scripting_redis)
+    schedule.add('t3_c', 30)
+    schedule.add('t3_a', 10)
+    schedule.add('t3_b', 20)
+    schedule.add('t3_d', 15)
+    schedule.add('t3_d', 40)
+    schedule.add('t3_e', 12)
+    schedule.remove('t3_e')
+
+    assert len(schedule) == 4
+    assert schedule.pop_due(now=25, limit=1) == ['t3_a']
+    assert schedule.pop_due(now=25) == ['t3_b']
+    assert schedule.pop_due(now=25) == []
+    assert schedule.pop_due(now=100) == ['t3_c', 't3_d']
+    assert len(schedule) == 0
+
+
+def test_failed_posts_are_rescheduled(scripting_redis):
+    schedule = _redis_schedule(scripting_redis)
+    for i in range(3):
+        schedule.add(f't3_{i}', i)
+    archived = []
+
+    def archive(config, fullname):
+        if fullname == 't3_1':
+            raise ValueError('Reddit is down')
+        archived.append(fullname)
+
+    assert archive_due(schedule, archive, None, now=10, retry_delay=60) == 2
+    assert archived == ['t3_0', 't3_2']
+    assert schedule.pop_due(now=69) == []
+    assert schedule.pop_due(now=70) == ['t3_1']
@@ -0,0 +1,25 @@
+from tor_core.assets import AssetPool
+
+
+def test_no_repeats_within_recent_window():
+    urls = tuple(f'https://i.imgur.com/{i}.gif' for i in range(20))
+    pool = AssetPool(urls, recent=10)
+
+    picks = [pool.choice() for _ in range(200)]
+
+    for i in range(len(picks) - 10):
+        assert len(set(picks[i:i + 11])) == 11
+
+
+def test_update_keeps_recent_picks():
+    pool = AssetPool(('a', 'b', 'c', 'd'), recent=2)
+    first = pool.choice()
+
+    pool.update(('a', 'b', 'c', 'd', 'e'))
+
+    assert pool.choice() != first
+    assert len(pool) == 5
+
+
+def test_empty_pool():
+    assert AssetPool(()).choice() is None
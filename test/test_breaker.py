@@ -0,0 +1,48 @@
+import pytest
+
+from tor_core.breaker import CLOSED
+from tor_core.breaker import HALF_OPEN
+from tor_core.breaker import OPEN
+from tor_core.breaker import CircuitBreaker
+from tor_core.breaker import CircuitOpenError
+
+
+def fail(breaker):
+    with pytest.raises(OSError):
+        with breaker.guard((OSError,)):
+            raise OSError('connection refused')
+
+
+def test_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+    fail(breaker)
+    assert breaker.state == CLOSED
+    fail(breaker)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        with breaker.guard():
+            pytest.fail('called while open')
+    assert breaker.rejected == 1
+
+
+def test_half_open_probe():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0)
+    fail(breaker)
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    breaker.failure()
+    assert breaker.state == OPEN
+
+    with breaker.guard():
+        pass
+    assert breaker.state == CLOSED
+
+
+def test_other_errors_count_as_success():
+    breaker = CircuitBreaker('test', failure_threshold=1)
+    with pytest.raises(KeyError):
+        with breaker.guard((OSError,)):
+            raise KeyError('not found')
+    assert breaker.state == CLOSED
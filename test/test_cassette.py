@@ -0,0 +1,52 @@
+import json
+
+import requests
+from requests.adapters import BaseAdapter
+
+from tor_core.cassette import RecordingSession
+from tor_core.cassette import ReplaySession
+
+
+class StubAdapter(BaseAdapter):
+    """Answers every request with the query string it was sent."""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = 0
+
+    def send(self, request, **kwargs):
+        self.sent += 1
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(
+            {'url': request.url, 'sent': self.sent}
+        ).encode()
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def test_record_then_replay(tmpdir):
+    path = str(tmpdir.join('cassette.jsonl'))
+    adapter = StubAdapter()
+    recorder = RecordingSession(path, adapter=adapter)
+    url = 'https://oauth.reddit.com/r/TranscribersOfReddit/new'
+
+    first = recorder.get(url, params={'limit': 1, 'raw_json': 1}).json()
+    second = recorder.get(url, params={'limit': 2, 'raw_json': 1}).json()
+
+    replay = ReplaySession(path, speed=0, adapter=adapter)
+    # matched on the parameters too, in whatever order they come
+    assert replay.get(url, params={'raw_json': 1, 'limit': 2}).json() == \
+        second
+    assert replay.get(url, params={'limit': 1, 'raw_json': 1}).json() == \
+        first
+    # unknown parameters fall back to the endpoint
+    assert replay.get(url, params={'after': 't3_x'}).status_code == 200
+    assert replay.get('https://oauth.reddit.com/api/v1/me').status_code == 404
+
+    assert adapter.sent == 2
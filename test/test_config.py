@@ -1,7 +1,10 @@
+from collections.abc import Mapping
+
 import pytest
 
 import redis.exceptions
 
+from tor_core.config import Config
 from tor_core.config import config as SITE_CONFIG
 
 
@@ -16,9 +19,9 @@ def test_read_secrets_from_filesystem():
 def test_config_structure():
     """Config singleton is structured as expected
     """
-    assert isinstance(SITE_CONFIG.video_domains, list)
-    assert isinstance(SITE_CONFIG.audio_domains, list)
-    assert isinstance(SITE_CONFIG.image_domains, list)
+    assert isinstance(SITE_CONFIG.video_domains, tuple)
+    assert isinstance(SITE_CONFIG.audio_domains, tuple)
+    assert isinstance(SITE_CONFIG.image_domains, tuple)
 
     assert isinstance(SITE_CONFIG.video_formatting, str)
     assert isinstance(SITE_CONFIG.audio_formatting, str)
@@ -26,16 +29,16 @@ def test_config_structure():
 
     assert isinstance(SITE_CONFIG.header, str)
 
-    assert isinstance(SITE_CONFIG.subreddits_to_check, list)
-    assert isinstance(SITE_CONFIG.upvote_filter_subs, dict)
-    assert isinstance(SITE_CONFIG.no_link_header_subs, list)
+    assert isinstance(SITE_CONFIG.subreddits_to_check, tuple)
+    assert isinstance(SITE_CONFIG.upvote_filter_subs, Mapping)
+    assert isinstance(SITE_CONFIG.no_link_header_subs, tuple)
 
-    assert isinstance(SITE_CONFIG.tor_mods, list)
+    assert isinstance(SITE_CONFIG.tor_mods, tuple)
 
     assert isinstance(SITE_CONFIG.perform_header_check, bool)
     assert isinstance(SITE_CONFIG.debug_mode, bool)
 
-    assert isinstance(SITE_CONFIG.no_gifs, list)
+    assert isinstance(SITE_CONFIG.no_gifs, tuple)
 
     assert isinstance(SITE_CONFIG.OCR, bool)
 
@@ -46,15 +49,46 @@ def test_config_structure():
            SITE_CONFIG.modchat_api_url is None
 
 
-def test_redis_config_property():
+def test_snapshot_swap_and_rollback():
+    """Changing config swaps in a new, immutable snapshot
+    """
+    before = SITE_CONFIG.snapshot
+
+    SITE_CONFIG.replace(video_domains=['youtube.com'], upvote_filter_subs={})
+    after = SITE_CONFIG.snapshot
+
+    assert after.version == before.version + 1
+    assert SITE_CONFIG.video_domains == ('youtube.com',)
+    with pytest.raises(TypeError):
+        SITE_CONFIG.upvote_filter_subs['pics'] = 10
+
+    assert SITE_CONFIG.rollback() is before
+    assert SITE_CONFIG.snapshot is before
+
+
+def test_shared_snapshots():
+    """Bots sharing a process see each other's reloads
+    """
+    first, second = Config(), Config()
+    second.share_snapshots(first)
+
+    first.replace(header='shared')
+
+    assert second.header == 'shared'
+    assert second.snapshot is first.snapshot
+    assert second.flair_queue is not first.flair_queue
+
+
+def test_redis_config_property(monkeypatch):
     try:
         assert SITE_CONFIG.redis, 'Does not observe lazy loader'
     except redis.exceptions.ConnectionError:
         pass
 
     # Check stubbing with derivations of BaseException
-    type(SITE_CONFIG).redis = property(lambda x: (_ for _ in ()).throw(
-        NotImplementedError('Redis was disabled')))
+    monkeypatch.setattr(type(SITE_CONFIG), 'redis', property(
+        lambda x: (_ for _ in ()).throw(
+            NotImplementedError('Redis was disabled'))))
 
     with pytest.raises(NotImplementedError):
         SITE_CONFIG.redis.ping()
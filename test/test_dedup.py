@@ -0,0 +1,62 @@
+from collections import namedtuple
+
+import fakeredis
+
+from tor_core.dedup import BloomFilter
+from tor_core.dedup import RedisBloomFilter
+from tor_core.dedup import RotatingBloomFilter
+from tor_core.dedup import unseen
+from tor_core.helpers import Object
+
+Post = namedtuple('Post', ['fullname'])
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    fullnames = [f't3_{i}' for i in range(1000)]
+
+    # a false positive can make a new fullname look seen, but never the
+    # other way round
+    assert sum(bloom.add(fullname) for fullname in fullnames) > 980
+    assert all(fullname in bloom for fullname in fullnames)
+    assert not bloom.add('t3_0')
+
+    false_positives = sum(f't1_{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_rotating_filter_forgets_old_generations():
+    seen = RotatingBloomFilter(capacity=10, generations=2)
+    for i in range(10):
+        seen.add(f't3_{i}')
+    nbytes = seen.nbytes
+
+    seen.add('t3_new')
+    assert 't3_0' in seen
+    assert not seen.add('t3_0')
+
+    # fills the second generation and starts a third
+    for i in range(10):
+        seen.add(f't1_{i}')
+    assert 't3_0' not in seen
+    assert 't3_new' in seen
+    assert seen.nbytes == 2 * nbytes
+
+
+def test_redis_filter_rotates_by_period():
+    config = Object()
+    config.redis = fakeredis.FakeStrictRedis()
+    config.redis.flushall()
+    seen = RedisBloomFilter('test', config, capacity=100, period=60)
+
+    assert seen.add('t3_a', now=30)
+    assert not seen.add('t3_a', now=90)
+    assert not seen.add('t3_a', now=150)
+    assert seen.add('t3_a', now=250)
+
+
+def test_unseen_marks_things_seen():
+    seen = RotatingBloomFilter(capacity=100)
+    posts = [Post(f't3_{i % 3}') for i in range(6)]
+
+    assert [p.fullname for p in unseen(posts, seen)] == ['t3_0', 't3_1', 't3_2']
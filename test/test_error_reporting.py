@@ -0,0 +1,71 @@
+import json
+import logging
+import sys
+
+from tor_core.error_reporting import ErrorReporter
+from tor_core.error_reporting import FileSink
+from tor_core.error_reporting import ReportingHandler
+from tor_core.error_reporting import fingerprint
+
+
+def _record(msg, *args, exc_info=None, name='tor'):
+    return logging.LogRecord(
+        name, logging.ERROR, __file__, 1, msg, args, exc_info
+    )
+
+
+def _raise():
+    try:
+        raise ValueError('broken')
+    except ValueError:
+        return sys.exc_info()
+
+
+def test_fingerprint_ignores_formatted_message():
+    assert fingerprint(_record('post %s', 'a')) == \
+        fingerprint(_record('post %s', 'b'))
+    assert fingerprint(_record('post %s', 'a')) != \
+        fingerprint(_record('comment %s', 'a'))
+    assert fingerprint(_record('x', exc_info=_raise())).startswith(
+        'ValueError at '
+    )
+
+
+def test_repeats_are_aggregated_into_the_file(tmpdir):
+    path = str(tmpdir.join('errors.jsonl'))
+    reporter = ErrorReporter([FileSink(path)], flush_interval=60)
+    handler = ReportingHandler(reporter)
+
+    for i in range(1000):
+        handler.handle(_record('post %s', i, exc_info=_raise()))
+    handler.handle(_record('something else'))
+    handler.handle(_record('from raven', name='raven.base'))
+    reporter.close()
+
+    with open(path) as error_file:
+        reports = [json.loads(line) for line in error_file]
+    assert sorted(report['count'] for report in reports) == [1, 1000]
+    first = max(reports, key=lambda report: report['count'])
+    assert first['message'] == 'post 0'
+    assert 'ValueError: broken' in first['traceback']
+
+
+def test_sampling_and_fingerprint_cap():
+    sent = []
+
+    class Sink(object):
+        def send(self, reports):
+            sent.extend(reports)
+
+    reporter = ErrorReporter([Sink()], sample_rate=0, flush_interval=60)
+    reporter.report(_record('never counted'))
+    assert reporter.flush() == 0
+
+    reporter = ErrorReporter([Sink()], flush_interval=60, max_fingerprints=2)
+    for msg in ('a', 'b', 'c', 'a'):
+        reporter.report(_record(msg))
+    assert reporter.dropped == 1
+    assert reporter.flush() == 2
+    assert {report['message']: report['count'] for report in sent} == \
+        {'a': 2, 'b': 1}
+    reporter.close()
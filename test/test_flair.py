@@ -0,0 +1,92 @@
+from tor_core.config import Config
+from tor_core.flair import _templates_by_text
+from tor_core.flair import flush_flair_queue
+from tor_core.flair import get_flair_template_id
+from tor_core.flair import queue_flair
+from tor_core.helpers import Object
+from tor_core.helpers import flair
+
+
+class StubReddit(object):
+    def __init__(self, remaining):
+        self._core = Object()
+        self._core._rate_limiter = Object()
+        self._core._rate_limiter.remaining = remaining
+        self.posts = []
+
+    def post(self, path, data):
+        self.posts.append(data['link'])
+        self._core._rate_limiter.remaining -= 1
+
+
+def _post(fullname, link_flair_text=None):
+    post = Object()
+    post.fullname = fullname
+    post.subreddit = 'TranscribersOfReddit'
+    if link_flair_text is not None:
+        post.link_flair_text = link_flair_text
+    return post
+
+
+def test_templates_found_by_css_class():
+    assert _templates_by_text([
+        # renamed by the mods, but still the same css class
+        {'flair_text': 'Done!', 'flair_template_id': 'done',
+         'flair_css_class': 'transcriptioncomplete'},
+        {'text': 'Unclaimed', 'id': 'unclaimed', 'css_class': 'unclaimed'},
+        {'flair_text': 'No ID'},
+    ]) == {
+        'Done!': 'done',
+        flair.completed: 'done',
+        flair.unclaimed: 'unclaimed',
+    }
+
+
+def test_learning_a_template_leaves_the_snapshot_alone():
+    config = Config()
+    config.replace(header='good')
+    config.replace(header='bad reload')
+    version = config.snapshot.version
+
+    post = _post('t3_a')
+    post.flair = Object()
+    post.flair.choices = lambda: [
+        {'flair_text': 'Meta', 'flair_template_id': 'meta'},
+    ]
+    assert get_flair_template_id(flair.meta, config, post=post) == 'meta'
+    assert get_flair_template_id(flair.meta, config) == 'meta'
+
+    assert config.snapshot.version == version
+    assert config.rollback().header == 'good'
+
+
+def test_requeue_replaces_pending_change():
+    config = Config()
+
+    queue_flair(_post('t3_a'), flair.in_progress, config)
+    queue_flair(_post('t3_b'), flair.in_progress, config)
+    queue_flair(_post('t3_a'), flair.completed, config)
+    assert [
+        (fullname, text) for fullname, (post, text)
+        in config.flair_queue.items()
+    ] == [('t3_b', flair.in_progress), ('t3_a', flair.completed)]
+
+    # already has that flair, so there's nothing left to send for it
+    queue_flair(_post('t3_b', flair.unclaimed), flair.unclaimed, config)
+    assert list(config.flair_queue) == ['t3_a']
+
+
+def test_flush_stops_at_reserve():
+    config = Config()
+    config.flair_templates = {flair.completed: 'done'}
+    config.r = StubReddit(remaining=13)
+    for i in range(5):
+        queue_flair(_post(f't3_{i}'), flair.completed, config)
+
+    assert flush_flair_queue(config, reserve=10) == 3
+    assert config.r.posts == ['t3_0', 't3_1', 't3_2']
+    assert list(config.flair_queue) == ['t3_3', 't3_4']
+
+    config.r._core._rate_limiter.remaining = 600
+    assert flush_flair_queue(config, reserve=10, limit=1) == 1
+    assert list(config.flair_queue) == ['t3_4']
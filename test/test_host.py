@@ -0,0 +1,86 @@
+import signal
+
+import pytest
+from praw import Reddit
+
+from tor_core import helpers
+from tor_core import host
+from tor_core.config import Config
+from tor_core.host import BotHost
+from tor_core.load_test import FakeReddit
+from tor_core.load_test import TrafficGenerator
+from tor_core.shutdown import ShutdownCoordinator
+
+
+@pytest.fixture
+def coordinator(monkeypatch):
+    reddit = FakeReddit(TrafficGenerator(0, 0), ratelimit_requests=100000)
+    reddit.start()
+
+    def fake_reddit(name, **kwargs):
+        return Reddit(
+            client_id=name, client_secret=name, username=name,
+            password=name, user_agent=name, oauth_url=reddit.url,
+            reddit_url=reddit.url, check_for_updates=False, **kwargs
+        )
+
+    coordinator = ShutdownCoordinator()
+    monkeypatch.setattr(host, 'shutdown', coordinator)
+    monkeypatch.setattr(helpers, 'shutdown', coordinator)
+    monkeypatch.setattr(host, 'host_config', Config())
+    monkeypatch.setattr(host, 'hosted_bots', [])
+    monkeypatch.setattr(host, 'Reddit', fake_reddit)
+    # signal handlers are the test runner's business
+    monkeypatch.setattr(signal, 'signal', lambda signum, handler: None)
+
+    yield coordinator
+    reddit.stop()
+
+
+def _run(bot_host):
+    with pytest.raises(SystemExit) as exit:
+        bot_host.run()
+    return exit.value.code
+
+
+def test_bots_run_side_by_side(coordinator):
+    bot_host = BotHost(require_redis=False)
+    iterations = {'tor': 0, 'tor_ocr': 0}
+
+    def job(config):
+        iterations[config.name] += 1
+        assert config.subreddits_to_check
+        if config.name == 'tor' and iterations['tor'] == 5:
+            coordinator.request('test')
+        coordinator.wait(0.01)
+
+    first = bot_host.add_bot('tor', '1.0', job)
+    second = bot_host.add_bot('tor_ocr', '1.0', job)
+
+    assert _run(bot_host) == 0
+    assert iterations['tor'] == 5
+    assert iterations['tor_ocr'] > 0
+    # the wiki was read once, for both of them
+    assert second.snapshot is first.snapshot
+    assert first.r is not second.r
+    assert host.hosted_bots == [first, second]
+
+
+def test_crash_stops_every_bot(coordinator):
+    bot_host = BotHost(require_redis=False)
+    flushed = []
+    coordinator.register(lambda: flushed.append(True))
+
+    def steady(config):
+        coordinator.wait(0.01)
+
+    def crashing(config):
+        raise ValueError('broken')
+
+    bot_host.add_bot('tor', '1.0', steady)
+    bot_host.add_bot('tor_ocr', '1.0', crashing)
+
+    assert _run(bot_host) == 1
+    assert bot_host.failed
+    assert coordinator.reason == 'tor_ocr crashed'
+    assert flushed == [True]
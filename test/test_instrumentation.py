@@ -0,0 +1,27 @@
+from tor_core.instrumentation import ApiStats
+from tor_core.instrumentation import calling_function
+
+
+def test_calling_function():
+    def get_wiki_page():
+        return calling_function(depth=1)
+
+    assert get_wiki_page() == f'{__name__}.get_wiki_page'
+
+
+def test_report_by_endpoint_and_caller():
+    stats = ApiStats()
+    stats.record('GET /api/info', 'bot.check_score', 0.1, size=100)
+    stats.record('GET /api/info', 'bot.archive', 0.3, failed=True, size=50)
+    stats.record('POST /api/selectflair', 'bot.archive', 0.2,
+                 headers={'x-ratelimit-remaining': '42.0'})
+
+    report = stats.report()
+
+    assert report['by_endpoint']['GET /api/info']['count'] == 2
+    assert report['by_endpoint']['GET /api/info']['errors'] == 1
+    assert report['by_endpoint']['GET /api/info']['bytes'] == 150
+    assert report['by_caller']['bot.archive']['count'] == 2
+    assert report['by_caller']['bot.archive']['max'] == 0.3
+    assert len(report['calls']) == 3
+    assert report['ratelimit']['remaining'] == 42.0
@@ -0,0 +1,83 @@
+import pytest
+
+from tor_core import lease as lease_module
+from tor_core.helpers import Object
+from tor_core.lease import Lease
+from tor_core.lease import singleton_job
+from tor_core.shutdown import ShutdownCoordinator
+
+
+@pytest.fixture(autouse=True)
+def fresh_shutdown(monkeypatch):
+    monkeypatch.setattr(lease_module, 'shutdown', ShutdownCoordinator())
+
+
+def _config(name, redis):
+    config = Object()
+    config.name = name
+    config.redis = redis
+    return config
+
+
+def test_one_holder_at_a_time(scripting_redis):
+    redis = scripting_redis
+    first = Lease('archiver', _config('tor', redis))
+    second = Lease('archiver', _config('tor', redis))
+
+    assert first.acquire()
+    assert first.acquire()
+    assert not second.acquire()
+    assert first.is_current()
+    assert first.renew()
+
+    first.release()
+    assert not first.held
+    assert second.acquire()
+    second.release()
+
+
+def test_fencing_token_increases_on_handover(scripting_redis):
+    redis = scripting_redis
+    first = Lease('archiver', _config('tor', redis))
+    second = Lease('archiver', _config('tor', redis))
+
+    assert first.acquire()
+    old_token = first.token
+    # the lease expires under us, e.g. after a long pause
+    redis.delete('tor_lease:archiver')
+
+    assert second.acquire()
+    assert second.token > old_token
+    assert second.is_current()
+    assert not first.is_current()
+    assert not second.is_current(old_token)
+
+    # we find out on the next renewal, and so does the renewer thread
+    assert not first.renew()
+    assert not first.held
+    first.release()
+    assert redis.get('tor_lease:archiver') is not None
+    second.release()
+
+
+def test_standby_instances_skip_the_job(scripting_redis):
+    redis = scripting_redis
+    runs = []
+
+    def job(config):
+        runs.append(config.name)
+        return config.name
+
+    active = singleton_job('archiver', standby_sleep=0)(job)
+    standby = singleton_job('archiver', standby_sleep=0)(job)
+
+    assert active(_config('active', redis)) == 'active'
+    assert standby(_config('standby', redis)) is None
+    assert active(_config('active', redis)) == 'active'
+    assert runs == ['active', 'active']
+
+    # released on shutdown, so the standby takes over straight away
+    lease_module.shutdown.run_hooks()
+    assert standby(_config('standby', redis)) == 'standby'
+    assert runs == ['active', 'active', 'standby']
+    standby.lease.release()
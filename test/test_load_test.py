@@ -0,0 +1,64 @@
+import time
+
+from tor_core.initialize import initialize
+from tor_core.load_test import FakeReddit
+from tor_core.load_test import SampleBot
+from tor_core.load_test import TrafficGenerator
+from tor_core.load_test import make_config
+from tor_core.load_test import peak_rss
+
+
+def test_sample_bot_handles_generated_traffic():
+    # the clock stands still, so only the items due when the bot starts are
+    # ever generated: ten posts and five replies
+    now = time.time()
+    traffic = TrafficGenerator(
+        posts_per_minute=600, comments_per_minute=300, clock=lambda: now
+    )
+    traffic.started = now - 1
+
+    # a quota that prawcore won't pace the bot by
+    reddit = FakeReddit(traffic, ratelimit_requests=100000)
+    reddit.start()
+    try:
+        config = make_config(reddit.url)
+        initialize(config)
+        assert config.subreddits_to_check
+        assert 'imgur.com' in config.image_domains
+
+        bot = SampleBot()
+        bot(config)
+        # nothing is handled twice
+        bot(config)
+    finally:
+        reddit.stop()
+
+    assert traffic.generated_posts == 10
+    assert traffic.generated_comments == 5
+    assert traffic.handled == 15
+    assert traffic.backlog == 0
+    assert not traffic.unread
+
+
+def test_traffic_stops_counting_once_stopped():
+    clock = [1000.0]
+    traffic = TrafficGenerator(
+        posts_per_minute=60, comments_per_minute=0, clock=lambda: clock[0]
+    )
+    clock[0] += 3
+    traffic.new_posts(100)
+    traffic.handle(['t3_0'])
+
+    assert traffic.stop() == 1003.0
+    clock[0] += 10
+    traffic.new_posts(100)
+    traffic.handle(['t3_1', 't3_2'])
+
+    assert traffic.generated_posts == 3
+    assert traffic.handled == 1
+    assert traffic.backlog == 2
+
+
+def test_peak_rss_is_in_bytes():
+    # any Python process uses more than a megabyte
+    assert peak_rss() > 1024 * 1024
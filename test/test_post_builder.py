@@ -0,0 +1,46 @@
+from tor_core.config import Config
+from tor_core.helpers import _
+from tor_core.post_builder import PostBodyBuilder
+
+
+def make_config():
+    config = Config()
+    config.replace(
+        header='Transcribe [this post](https://redd.it/x)',
+        image_formatting='*Image Transcription*',
+        other_formatting='*Transcription*',
+        image_domains=['imgur.com'],
+        no_link_header_subs=['NoLinks'],
+    )
+    return config
+
+
+def test_render_picks_header_and_formatting():
+    builder = PostBodyBuilder(make_config())
+
+    image, other, no_links = builder.render_batch([
+        ('pics', 'https://i.imgur.com/a.png'),
+        ('pics', 'https://example.com/a'),
+        ('nolinks', 'https://imgur.com/a.png'),
+    ])
+
+    assert image == _(
+        'Transcribe [this post](https://redd.it/x)\n\n*Image Transcription*'
+    )
+    assert other == _(
+        'Transcribe [this post](https://redd.it/x)\n\n*Transcription*'
+    )
+    assert no_links == _('Transcribe this post\n\n*Image Transcription*')
+
+
+def test_rebuilds_on_new_config_version():
+    config = make_config()
+    builder = PostBodyBuilder(config)
+    before = builder.render('pics', 'https://imgur.com/a.png')
+
+    config.header = 'New header'
+
+    after = builder.render('pics', 'https://imgur.com/a.png')
+    assert after != before
+    assert after.startswith('New header')
+    assert builder.render('pics', 'https://imgur.com/b.png') is after
@@ -0,0 +1,72 @@
+import os
+import pstats
+import time
+
+from tor_core.profiling import LoopProfiler
+from tor_core.profiling import profiler_from_env
+
+
+def _slow(profiler, seconds=0.05):
+    with profiler.iteration():
+        time.sleep(seconds)
+
+
+def test_slow_iterations_are_dumped_with_a_rate_limit(tmpdir):
+    profiler = LoopProfiler(
+        dump_dir=str(tmpdir), slow_threshold=0.02, sample_interval=0.005,
+        slow_dump_interval=60,
+    )
+    profiler.start()
+    try:
+        with profiler.iteration():
+            pass
+        assert tmpdir.listdir() == []
+
+        _slow(profiler)
+        _slow(profiler)
+    finally:
+        profiler.stop()
+
+    # the second slow iteration came too soon after the first
+    dumps = tmpdir.listdir()
+    assert len(dumps) == 1
+    assert '-slow-' in dumps[0].basename
+    assert 'test_profiling.py' in dumps[0].read()
+
+
+def test_dump_without_samples(tmpdir):
+    profiler = LoopProfiler(dump_dir=str(tmpdir), mode='cprofile')
+    profiler.start()
+
+    assert profiler.dump() is None
+    assert tmpdir.listdir() == []
+
+
+def test_cprofile_dump_is_loadable(tmpdir):
+    profiler = LoopProfiler(dump_dir=str(tmpdir), mode='cprofile')
+    profiler.start()
+    _slow(profiler, 0.01)
+    _slow(profiler, 0.01)
+
+    path = profiler.dump('test')
+    assert path.endswith('.pstats')
+    assert os.path.exists(path)
+
+    stats = pstats.Stats(path)
+    assert any('sleep' in name for _, _, name in stats.stats)
+    assert profiler.dump() is None
+
+
+def test_profiler_from_env(tmpdir, monkeypatch):
+    monkeypatch.delenv('TOR_PROFILE_DIR', raising=False)
+    assert profiler_from_env() is None
+
+    monkeypatch.setenv('TOR_PROFILE_DIR', str(tmpdir))
+    monkeypatch.setenv('TOR_PROFILE_SLOW_THRESHOLD', '2.5')
+    monkeypatch.setenv('TOR_PROFILE_MODE', 'cprofile')
+    profiler = profiler_from_env('tor')
+
+    assert profiler.dump_dir == str(tmpdir)
+    assert profiler.slow_threshold == 2.5
+    assert profiler.snapshot_interval is None
+    assert profiler.mode == 'cprofile'
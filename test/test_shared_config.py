@@ -0,0 +1,119 @@
+import time
+
+import fakeredis
+import pytest
+
+from tor_core.config import Config
+from tor_core.shared_config import CHANNEL
+from tor_core.shared_config import LOCK_PREFIX
+from tor_core.shared_config import listen_for_config_updates
+from tor_core.shared_config import load_section
+from tor_core.shared_config import populate_shared_section
+
+ATTRIBUTES = ('no_gifs', 'tor_mods')
+
+
+@pytest.fixture
+def redis():
+    redis = fakeredis.FakeStrictRedis()
+    redis.flushall()
+    return redis
+
+
+def _config(name, redis):
+    config = Config()
+    config.name = name
+    config.redis = redis
+    return config
+
+
+def test_store_then_load(redis):
+    first = _config('tor', redis)
+    second = _config('tor_ocr', redis)
+    calls = []
+
+    def populate(config):
+        calls.append(config.name)
+        config.replace(no_gifs=('https://i.imgur.com/no.gif',),
+                       tor_mods=('mod_one', 'mod_two'))
+
+    populate_shared_section('gifs', populate, ATTRIBUTES, first)
+    populate_shared_section('gifs', populate, ATTRIBUTES, second)
+
+    # only the first bot went to the wiki
+    assert calls == ['tor']
+    assert list(second.no_gifs) == ['https://i.imgur.com/no.gif']
+    assert list(second.tor_mods) == ['mod_one', 'mod_two']
+    assert second.shared_config_versions == first.shared_config_versions
+    assert not redis.exists(LOCK_PREFIX + 'gifs')
+
+
+def test_lock_taken_over_is_left_alone(redis):
+    config = _config('tor', redis)
+
+    def populate(config):
+        # our lock timed out and another bot took it while we worked
+        redis.set(LOCK_PREFIX + 'gifs', 'tor_ocr:1234')
+
+    populate_shared_section('gifs', populate, ATTRIBUTES, config)
+
+    assert redis.get(LOCK_PREFIX + 'gifs') == b'tor_ocr:1234'
+
+
+def test_own_updates_are_skipped(redis):
+    config = _config('tor', redis)
+    config.replace(no_gifs=('a',), tor_mods=())
+    populate_shared_section('gifs', lambda config: None, ATTRIBUTES, config)
+    version = config.shared_config_versions['gifs']
+
+    thread = listen_for_config_updates(
+        config, {'gifs': (None, ATTRIBUTES)}
+    )
+    try:
+        # somebody else's newer copy is picked up...
+        redis.hset('tor_config:gifs', 'no_gifs', '["b"]')
+        redis.hset('tor_config:gifs', '__version__', version + 1)
+        redis.publish(CHANNEL, f'gifs:{version + 1}')
+        deadline = time.time() + 5
+        while config.no_gifs != ('b',) and time.time() < deadline:
+            time.sleep(0.05)
+        assert list(config.no_gifs) == ['b']
+
+        # ...but a version we already have isn't loaded again
+        redis.hset('tor_config:gifs', 'no_gifs', '["c"]')
+        redis.publish(CHANNEL, f'gifs:{version + 1}')
+        time.sleep(0.5)
+        assert list(config.no_gifs) == ['b']
+    finally:
+        thread.stop()
+
+
+def test_section_from_another_version_is_not_loaded(redis):
+    config = _config('tor', redis)
+    redis.hmset('tor_config:gifs', {
+        'no_gifs': '["a"]', '__version__': 1, '__updated__': time.time(),
+    })
+
+    assert not load_section('gifs', ATTRIBUTES, config)
+    assert config.no_gifs == ()
+
+
+def test_bad_update_keeps_listening(redis):
+    config = _config('tor', redis)
+    config.replace(no_gifs=('a',), tor_mods=())
+    populate_shared_section('gifs', lambda config: None, ATTRIBUTES, config)
+
+    thread = listen_for_config_updates(
+        config, {'gifs': (None, ATTRIBUTES)}
+    )
+    try:
+        redis.publish(CHANNEL, 'gifs:not-a-version')
+        redis.hset('tor_config:gifs', 'no_gifs', '["b"]')
+        redis.hset('tor_config:gifs', '__version__', 1000)
+        redis.publish(CHANNEL, 'gifs:1000')
+        deadline = time.time() + 5
+        while config.no_gifs != ('b',) and time.time() < deadline:
+            time.sleep(0.05)
+        assert list(config.no_gifs) == ['b']
+    finally:
+        thread.stop()
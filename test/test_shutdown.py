@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+from praw.exceptions import APIException
+
+from tor_core import helpers
+from tor_core.helpers import rate_limit_delay
+from tor_core.helpers import signal_handler
+from tor_core.shutdown import LAST
+from tor_core.shutdown import ShutdownCoordinator
+
+
+def test_wait_wakes_up_on_request():
+    coordinator = ShutdownCoordinator()
+    threading.Timer(0.05, coordinator.request).start()
+
+    started = time.monotonic()
+    assert coordinator.wait(5)
+    assert time.monotonic() - started < 1
+
+
+def test_hooks_run_once_in_order():
+    coordinator = ShutdownCoordinator()
+    calls = []
+    coordinator.register(lambda: calls.append('heartbeat'), order=LAST)
+    coordinator.register(lambda: calls.append('flair'))
+    coordinator.register(lambda: 1 / 0)
+    coordinator.register(lambda: calls.append('cache'))
+
+    coordinator.finish(0)
+    coordinator.finish(0)
+
+    assert calls == ['flair', 'cache', 'heartbeat']
+
+
+def test_drain_gives_up_at_deadline():
+    coordinator = ShutdownCoordinator()
+    with coordinator.in_flight():
+        assert not coordinator.drain(0.01)
+    assert coordinator.drain(0)
+
+
+def test_rate_limit_delay():
+    def ratelimit(message):
+        return APIException('RATELIMIT', message, None)
+
+    assert rate_limit_delay(ratelimit(
+        'you are doing that too much. try again in 9 minutes.'
+    )) == 540
+    assert rate_limit_delay(ratelimit(
+        'you are doing that too much. try again in 1 second.'
+    )) == 1
+    assert rate_limit_delay(ratelimit('slow down')) == 60
+
+
+def test_second_signal_skips_the_drain_but_not_the_hooks(monkeypatch):
+    coordinator = ShutdownCoordinator()
+    monkeypatch.setattr(helpers, 'shutdown', coordinator)
+    calls = []
+    coordinator.register(lambda: calls.append('flair'))
+    stuck = threading.Event()
+
+    def work():
+        with coordinator.in_flight():
+            stuck.wait(10)
+
+    threading.Thread(target=work, daemon=True).start()
+    signal_handler(None, None)
+    finisher = threading.Thread(target=coordinator.finish, args=(30,))
+    finisher.start()
+    while not coordinator.finishing:
+        time.sleep(0.01)
+
+    started = time.monotonic()
+    signal_handler(None, None)
+    finisher.join(5)
+    stuck.set()
+
+    assert not finisher.is_alive()
+    assert time.monotonic() - started < 1
+    assert calls == ['flair']
+
+
+def test_running_follows_shutdown(monkeypatch):
+    coordinator = ShutdownCoordinator()
+    monkeypatch.setattr(helpers, 'shutdown', coordinator)
+
+    with pytest.warns(DeprecationWarning):
+        assert helpers.running
+    with pytest.warns(DeprecationWarning):
+        helpers.running = False
+    assert coordinator.requested
+    with pytest.warns(DeprecationWarning):
+        assert not helpers.running
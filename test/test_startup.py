@@ -0,0 +1,88 @@
+import datetime
+import json
+import threading
+
+from tor_core import helpers
+from tor_core.config import Config
+from tor_core.shutdown import ShutdownCoordinator
+from tor_core.startup import load_handoff
+from tor_core.startup import register_warm_state
+from tor_core.startup import write_handoff
+
+
+def make_config(path):
+    config = Config()
+    config.handoff_file = path
+    return config
+
+
+def test_handoff_carries_warm_state(tmp_path):
+    path = str(tmp_path / 'handoff.json')
+    scanned = datetime.datetime(2018, 6, 1, 12, 30, 5)
+
+    outgoing = make_config(path)
+    outgoing.replace(
+        image_domains=['imgur.com'],
+        upvote_filter_subs={'pics': 100},
+        gifs={'no': ('https://i.imgur.com/a.gif',)},
+    )
+    outgoing.last_post_scan_time = scanned
+    register_warm_state(outgoing, 'seen', lambda: {'t3_a'}, None)
+    write_handoff(outgoing)
+
+    incoming = make_config(path)
+    assert load_handoff(incoming)
+    assert incoming.image_domains == ('imgur.com',)
+    assert incoming.upvote_filter_subs == {'pics': 100}
+    assert incoming.gifs['no'] == ('https://i.imgur.com/a.gif',)
+    assert incoming.last_post_scan_time == scanned
+
+    restored = []
+    register_warm_state(incoming, 'seen', None, restored.append)
+    assert restored == [['t3_a']]
+
+
+def test_stale_or_missing_handoff_is_ignored(tmp_path):
+    path = str(tmp_path / 'handoff.json')
+    config = make_config(path)
+    assert not load_handoff(config)
+
+    write_handoff(config)
+    with open(path) as handoff_file:
+        handoff = json.load(handoff_file)
+    handoff['written'] -= 60 * 60
+    with open(path, 'w') as handoff_file:
+        json.dump(handoff, handoff_file)
+
+    assert not load_handoff(config)
+
+
+def test_handoff_without_file_or_redis_does_nothing():
+    config = Config()
+    config.require_redis = False
+
+    write_handoff(config)
+    assert not load_handoff(config)
+
+
+def test_warm_start_refreshes_on_the_main_loop(monkeypatch):
+    monkeypatch.setattr(helpers, 'shutdown', ShutdownCoordinator())
+    config = Config()
+    config.profiler = None
+    calls = []
+
+    def refresh():
+        calls.append(('refresh', threading.current_thread()))
+
+    def iteration(config):
+        calls.append(('iteration', threading.current_thread()))
+        if len(calls) == 3:
+            helpers.shutdown.request('test')
+
+    config.pending_refresh = refresh
+    helpers.run_loop(iteration, config)
+
+    main = threading.current_thread()
+    assert calls == [('iteration', main), ('refresh', main),
+                     ('iteration', main)]
+    assert config.pending_refresh is None
@@ -0,0 +1,36 @@
+import datetime
+
+from tor_core.state_store import StateStore
+
+
+def test_state_survives_reopening(tmp_path):
+    path = str(tmp_path / 'state.db')
+    scanned = datetime.datetime(2018, 6, 1, 12, 30, 5, 42)
+
+    store = StateStore(path, flush_interval=60)
+    store.set('last_post_scan_time', scanned)
+    store.set('claimed', {'t3_b', 't3_a'})
+    store.set('gone', 1)
+    store.delete('gone')
+    store.close()
+
+    store = StateStore(path)
+    assert store.get('last_post_scan_time') == scanned
+    assert store.get('claimed') == ['t3_a', 't3_b']
+    assert 'gone' not in store
+    store.close()
+
+
+def test_flushed_state_survives_a_crash(tmp_path):
+    path = str(tmp_path / 'state.db')
+
+    store = StateStore(path, flush_interval=60)
+    store.set('flushed', True)
+    assert store.flush() == 1
+    store.set('pending', True)
+    # no close(): the process dies here
+
+    recovered = StateStore(path)
+    assert recovered.get('flushed') is True
+    assert 'pending' not in recovered
+    recovered.close()
@@ -0,0 +1,71 @@
+import fakeredis
+import pytest
+
+from tor_core.config import Config
+from tor_core.throttle import _TAKE
+from tor_core.throttle import RedditThrottle
+
+ARGS = dict(cost=1, rate=1.0, burst=4, window=60)
+
+
+def take(redis, bot, now, weight=1, **kwargs):
+    args = dict(ARGS, **kwargs)
+    return redis.eval(
+        _TAKE, 2, 'tor_throttle:test', 'tor_throttle:test:active',
+        bot, weight, args['cost'], args['rate'], args['burst'], now,
+        args['window'],
+    )
+
+
+@pytest.fixture
+def redis():
+    redis = fakeredis.FakeStrictRedis()
+    redis.flushall()
+    return redis
+
+
+def test_bucket_refills_at_rate(redis):
+    for _ in range(4):
+        assert take(redis, 'tor', 100.0) == 0
+    assert take(redis, 'tor', 100.0) == 1000
+    assert take(redis, 'tor', 101.0) == 0
+
+
+def test_bots_split_rate_by_weight(redis):
+    granted = {'tor_archivist': 0, 'ocr': 0}
+    for step in range(400):
+        now = 100 + step / 10
+        for bot, weight in (('tor_archivist', 3), ('ocr', 1)):
+            if take(redis, bot, now, weight=weight) == 0:
+                granted[bot] += 1
+
+    # 40 seconds at one request a second, plus the burst
+    assert sum(granted.values()) == 43
+    assert 2.5 < granted['tor_archivist'] / granted['ocr'] < 3.5
+
+
+def test_unused_share_can_be_borrowed(redis):
+    granted = 0
+    for step in range(400):
+        now = 100 + step / 10
+        if step % 50 == 0:
+            assert take(redis, 'ocr', now) == 0
+        if take(redis, 'tor_archivist', now) == 0:
+            granted += 1
+    assert granted > 30
+
+
+def test_idle_bots_stop_counting(redis):
+    take(redis, 'ocr', 100.0)
+    take(redis, 'tor_archivist', 200.0)
+    assert redis.zrange('tor_throttle:test:active', 0, -1) == [
+        b'tor_archivist'
+    ]
+
+
+def test_disabled_without_redis():
+    config = Config()
+    config.require_redis = False
+    throttle = RedditThrottle(config)
+    throttle.acquire()
+    assert throttle.as_dict()['granted'] == 0
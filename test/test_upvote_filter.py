@@ -0,0 +1,100 @@
+from tor_core.config import Config
+from tor_core.helpers import Object
+from tor_core.upvote_filter import MIN_INTERVAL
+from tor_core.upvote_filter import PendingPosts
+
+
+def _post(fullname, score, created_utc=0):
+    post = Object()
+    post.fullname = fullname
+    post.subreddit = 'pics'
+    post.score = score
+    post.created_utc = created_utc
+    return post
+
+
+class StubReddit(object):
+    def __init__(self, posts):
+        self.posts = {post.fullname: post for post in posts}
+        self.requests = []
+
+    def info(self, fullnames):
+        self.requests.append(list(fullnames))
+        return [self.posts[f] for f in fullnames if f in self.posts]
+
+
+def _tracking(posts, max_age=1000):
+    config = Config()
+    config.upvote_filter_subs = {'pics': 10}
+    pending = PendingPosts(max_age=max_age)
+    for post in posts:
+        assert pending.track(post, config, now=0)
+    return config, pending
+
+
+def test_refresh_checks_in_batches_of_100():
+    posts = [_post(f't3_{i}', 0) for i in range(250)]
+    config, pending = _tracking(posts)
+    config.r = StubReddit(posts)
+
+    assert pending.refresh(config, now=MIN_INTERVAL) == []
+    assert [len(batch) for batch in config.r.requests] == [100, 100, 50]
+    assert len(pending) == 250
+
+
+def test_refresh_passes_drops_and_reschedules():
+    posts = [_post('t3_up', 0), _post('t3_gone', 0), _post('t3_low', 0)]
+    config, pending = _tracking(posts)
+    config.r = StubReddit([_post('t3_up', 50), _post('t3_low', 1)])
+
+    # nothing is due before the first check
+    assert pending.refresh(config, now=1) == []
+    assert config.r.requests == []
+
+    passed = pending.refresh(config, now=MIN_INTERVAL)
+    assert [post.fullname for post in passed] == ['t3_up']
+    # deleted posts aren't returned by Reddit and are forgotten
+    assert 't3_gone' not in pending
+    assert 't3_low' in pending
+
+    # rescheduled, so not checked again straight away
+    assert pending.refresh(config, now=MIN_INTERVAL + 1) == []
+    assert len(config.r.requests) == 1
+
+
+def test_refresh_expires_old_posts():
+    posts = [_post('t3_low', 0)]
+    config, pending = _tracking(posts, max_age=100)
+    config.r = StubReddit([_post('t3_low', 1)])
+
+    pending.refresh(config, now=MIN_INTERVAL)
+    assert 't3_low' in pending
+
+    pending.refresh(config, now=1000)
+    assert 't3_low' not in pending
+    assert len(pending) == 0
+
+
+def test_refresh_reschedules_when_reddit_fails():
+    posts = [_post(f't3_{i}', 0) for i in range(150)]
+    config, pending = _tracking(posts)
+    reddit = StubReddit([_post(f't3_{i}', 50) for i in range(150)])
+    calls = []
+
+    def info(fullnames):
+        calls.append(fullnames)
+        if len(calls) == 2:
+            raise ConnectionError('Reddit is down')
+        return reddit.info(fullnames)
+
+    config.r = Object()
+    config.r.info = info
+
+    # the first batch passed; the second is kept for the next check
+    assert len(pending.refresh(config, now=MIN_INTERVAL)) == 100
+    assert len(pending) == 50
+    assert pending.refresh(config, now=MIN_INTERVAL + 1) == []
+
+    passed = pending.refresh(config, now=2 * MIN_INTERVAL)
+    assert len(passed) == 50
+    assert len(pending) == 0
@@ -0,0 +1,89 @@
+from tor_core.wiki_parser import ArchiveTimes
+from tor_core.wiki_parser import parse_archive_times
+from tor_core.wiki_parser import parse_domains
+from tor_core.wiki_parser import parse_list
+from tor_core.wiki_parser import parse_thresholds
+from tor_core.wiki_parser import parse_urls
+
+
+def test_parse_list_handles_any_line_endings():
+    """Blank lines and both kinds of line endings are handled alike
+    """
+    page = 'pics\r\n\r\n  comics  \ngifs\n'
+
+    assert parse_list(page) == ['pics', 'comics', 'gifs']
+    assert parse_list(None) == []
+
+
+def test_parse_thresholds_skips_bad_lines():
+    errors = []
+    page = 'pics,10\r\ncomics, 20\nbroken\nfunny,lots\n'
+
+    assert parse_thresholds(page, errors) == {'pics': 10, 'comics': 20}
+    assert [e.lineno for e in errors] == [3, 4]
+
+
+def test_parse_archive_times():
+    errors = []
+    page = '18\nPics,10\nnope\n'
+
+    assert parse_archive_times(page, errors) == ArchiveTimes(18, {'pics': 10})
+    assert [e.lineno for e in errors] == [3]
+
+
+def test_parse_archive_times_without_default():
+    errors = []
+
+    assert parse_archive_times('soon\npics,10', errors) == \
+        ArchiveTimes(None, {'pics': 10})
+    assert len(errors) == 1
+    assert parse_archive_times('') == ArchiveTimes(None, {})
+
+
+def test_parse_domains():
+    errors = []
+    page = (
+        'video: [youtube.com, youtu.be,\r\n'
+        '        vimeo.com]\r\n'
+        '---\r\n'
+        'audio: [soundcloud.com]\r\n'
+        '---\r\n'
+        'garbage\r\n'
+        '---\r\n'
+        'images: [imgur.com, i.redd.it]\r\n'
+    )
+
+    assert parse_domains(page, errors) == {
+        'video': ['youtube.com', 'youtu.be', 'vimeo.com'],
+        'audio': ['soundcloud.com'],
+        'images': ['imgur.com', 'i.redd.it'],
+    }
+    assert [e.lineno for e in errors] == [6]
+
+
+def test_parse_domains_unclosed_list():
+    errors = []
+
+    assert parse_domains('video: [youtube.com,\nvimeo.com', errors) == {
+        'video': ['youtube.com', 'vimeo.com'],
+    }
+    assert len(errors) == 1
+
+
+def test_parse_urls():
+    page = (
+        '# Useful GIFs\r\n'
+        'https://i.imgur.com/a.gif\r\n'
+        '* [nope](https://i.imgur.com/b.gif)\r\n'
+        '- <https://i.imgur.com/c.gif>\r\n'
+        'https://i.imgur.com/a.gif\r\n'
+        'not a gif\r\n'
+    )
+    errors = []
+
+    assert parse_urls(page, errors) == [
+        'https://i.imgur.com/a.gif',
+        'https://i.imgur.com/b.gif',
+        'https://i.imgur.com/c.gif',
+    ]
+    assert [e.lineno for e in errors] == [6]
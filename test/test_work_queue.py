@@ -0,0 +1,140 @@
+import uuid
+
+import pytest
+import redis
+
+from tor_core import work_queue
+from tor_core.config import Config
+from tor_core.helpers import Object
+from tor_core.shutdown import ShutdownCoordinator
+from tor_core.work_queue import WorkQueue
+from tor_core.work_queue import _parse_entries
+from tor_core.work_queue import queue_worker
+
+
+@pytest.fixture(autouse=True)
+def fresh_shutdown(monkeypatch):
+    # other tests may have asked the global coordinator to shut down
+    monkeypatch.setattr(work_queue, 'shutdown', ShutdownCoordinator())
+
+
+class StubQueue(object):
+    instances = []
+
+    def __init__(self, name, config, **kwargs):
+        self.pending = [(b'1-0', 't3_a')]
+        self.new = [(b'2-0', 't3_b'), (b'3-0', 't3_c')]
+        self.acked = []
+        StubQueue.instances.append(self)
+
+    def reclaim(self, count):
+        pending, self.pending = self.pending, []
+        return pending
+
+    def claim(self, count):
+        new, self.new = self.new, []
+        return new
+
+    def ack(self, *entry_ids):
+        self.acked.extend(entry_ids)
+
+
+def test_worker_acks_only_what_was_handled(monkeypatch):
+    monkeypatch.setattr(work_queue, 'WorkQueue', StubQueue)
+    handled = []
+
+    def handler(config, fullname):
+        if fullname == 't3_b':
+            raise ValueError('try again later')
+        handled.append(fullname)
+
+    work = queue_worker('test', handler)
+    work(None)
+    work(None)
+    work(None)
+
+    queue, = StubQueue.instances
+    # abandoned entries go first; the failing one is left pending
+    assert handled == ['t3_a', 't3_c']
+    assert queue.acked == [b'1-0', b'3-0']
+
+
+def test_parse_entries():
+    assert _parse_entries([
+        (b'1-0', [b'fullname', b't3_a']),
+        (b'2-0', None),
+        (b'3-0', [b'other', b'x', b'fullname', b't3_c']),
+    ]) == [(b'1-0', 't3_a'), (b'3-0', 't3_c')]
+    assert _parse_entries(None) == []
+
+
+class StubRedis(object):
+    def __init__(self, pending):
+        self.pending = pending
+        self.commands = []
+
+    def execute_command(self, *args):
+        self.commands.append(args)
+        if args[0] == 'XPENDING':
+            return self.pending
+        if args[0] == 'XCLAIM':
+            return [(entry_id, [b'fullname', b't3_' + entry_id])
+                    for entry_id in args[5:]]
+
+
+def test_reclaim_buries_entries_out_of_retries(monkeypatch):
+    config = Object()
+    config.name = 'tor'
+    config.redis = StubRedis([
+        (b'1', b'other', 120000, 5),  # out of retries
+        (b'2', b'other', 120000, 2),
+        (b'3', b'other', 1000, 9),  # not idle for long enough yet
+    ])
+    queue = WorkQueue('test', config, claim_idle=60, max_retries=5)
+    queue._group_created = True
+    buried = []
+    monkeypatch.setattr(queue, '_bury', buried.extend)
+
+    assert queue.reclaim() == [(b'2', 't3_2')]
+    assert buried == [b'1']
+    assert config.redis.commands[-1] == (
+        'XCLAIM', 'tor_queue:test', 'workers', queue.consumer, 60000, b'2'
+    )
+
+
+@pytest.fixture
+def real_redis():
+    client = redis.StrictRedis()
+    try:
+        version = client.info()['redis_version']
+    except redis.exceptions.ConnectionError:
+        pytest.skip('no Redis server to test against')
+    if int(version.split('.')[0]) < 5:
+        pytest.skip('Redis streams need Redis 5.0')
+    return client
+
+
+def test_round_trip_through_redis(real_redis):
+    config = Config()
+    config.name = 'tor'
+    config.redis = real_redis
+    name = f'test-{uuid.uuid4().hex}'
+    queue = WorkQueue(name, config, claim_idle=0, max_retries=2)
+
+    try:
+        queue.push('t3_a', 't3_b')
+        (first, a), (second, b) = queue.claim(block=None)
+        assert (a, b) == ('t3_a', 't3_b')
+        queue.ack(first)
+
+        # never acknowledged, so handed out again and then given up on
+        assert queue.reclaim() == [(second, 't3_b')]
+        assert queue.reclaim() == []
+        assert [
+            fullname for _, fullname in
+            _parse_entries(
+                real_redis.execute_command('XRANGE', queue.dead_key, '-', '+')
+            )
+        ] == ['t3_b']
+    finally:
+        real_redis.delete(queue.key, queue.dead_key)
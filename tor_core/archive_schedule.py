@@ -0,0 +1,198 @@
+import heapq
+import logging
+import time
+
+from tor_core.helpers import subreddit_from_url
+
+# `archive_time_default` and `archive_time_subreddits` are kept in hours on
+# the wiki
+ARCHIVE_TIME_UNIT = 60 * 60
+
+KEY_PREFIX = 'tor_archive:'
+
+# Pops the members scored up to ARGV[1], at most ARGV[2] of them, lowest
+# score first, in one go so that two archivers never get handed the same
+# post. The members due are the first `count` by rank.
+# KEYS: the sorted set; ARGV: now, limit
+_POP_DUE = """
+local count = math.min(redis.call('zcount', KEYS[1], '-inf', ARGV[1]),
+                       tonumber(ARGV[2]))
+if count == 0 then
+    return {}
+end
+local due = redis.call('zrange', KEYS[1], 0, count - 1)
+redis.call('zremrangebyrank', KEYS[1], 0, count - 1)
+return due
+"""
+
+# How long a post whose archiving failed waits before it's tried again
+RETRY_DELAY = 5 * 60
+
+
+def archive_time(subreddit, config):
+    """
+    Looks up how long posts from a subreddit are kept before archiving.
+
+    :param subreddit: String. The name of the partner subreddit.
+    :param config: the global config object.
+    :return: int; the number of seconds to keep the post around.
+    """
+    hours = config.archive_time_subreddits.get(
+        subreddit.lower(), config.archive_time_default
+    )
+    return hours * ARCHIVE_TIME_UNIT
+
+
+def due_time(subreddit, created_utc, config):
+    """
+    Works out when a post should be archived.
+
+    :param subreddit: String. The name of the partner subreddit.
+    :param created_utc: float; the post's creation time (epoch seconds).
+    :param config: the global config object.
+    :return: float; the epoch time at which the post is due for archiving.
+    """
+    return created_utc + archive_time(subreddit, config)
+
+
+class HeapArchiveSchedule(object):
+    """
+    In-process archive schedule, for bots that don't share the work with
+    other instances. Rescheduling or removing a post leaves its old heap entry
+    in place; stale entries are skipped when they reach the top.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._due = {}
+
+    def __len__(self):
+        return len(self._due)
+
+    def add(self, fullname, due):
+        """
+        Schedules a post, replacing any earlier due time for it.
+
+        :param fullname: String. The fullname of the post.
+        :param due: float; the epoch time when the post is due.
+        :return: None.
+        """
+        self._due[fullname] = due
+        heapq.heappush(self._heap, (due, fullname))
+
+    def remove(self, fullname):
+        """
+        Drops a post from the schedule, e.g. because it got claimed.
+
+        :param fullname: String. The fullname of the post.
+        :return: None.
+        """
+        self._due.pop(fullname, None)
+
+    def pop_due(self, now=None, limit=100):
+        """
+        Takes the posts whose due time has passed off the schedule, the oldest
+        ones first.
+
+        :param now: float; the current epoch time. Defaults to time.time().
+        :param limit: int; the maximum number of posts to return.
+        :return: list of fullnames.
+        """
+        now = time.time() if now is None else now
+        due = []
+
+        while self._heap and len(due) < limit:
+            when, fullname = self._heap[0]
+            if when > now:
+                break
+
+            heapq.heappop(self._heap)
+            if self._due.get(fullname) == when:
+                del self._due[fullname]
+                due.append(fullname)
+
+        return due
+
+
+class RedisArchiveSchedule(object):
+    """
+    Archive schedule kept in a Redis sorted set scored by due time, so that
+    it survives restarts and can be shared between instances. Works the same
+    way as HeapArchiveSchedule.
+
+    Posts leave the set as they're popped, before anything is done with
+    them: each post is handed out at most once, but the ones an archiver
+    has popped are lost if it dies before getting to them. `archive_due()`
+    puts back the ones that fail.
+    """
+
+    def __init__(self, config, name='default'):
+        """
+        :param config: the global config object.
+        :param name: String. Which schedule to use, if there are several.
+        """
+        self.redis = config.redis
+        self.key = KEY_PREFIX + name
+        self._pop_due = self.redis.register_script(_POP_DUE)
+
+    def __len__(self):
+        return self.redis.zcard(self.key)
+
+    def add(self, fullname, due):
+        self.redis.zadd(self.key, due, fullname)
+
+    def remove(self, fullname):
+        self.redis.zrem(self.key, fullname)
+
+    def pop_due(self, now=None, limit=100):
+        now = time.time() if now is None else now
+        return [
+            fullname.decode()
+            for fullname in self._pop_due(keys=[self.key], args=[now, limit])
+        ]
+
+
+def archive_due(schedule, archive, config, now=None, limit=100,
+                retry_delay=RETRY_DELAY):
+    """
+    Archives the posts which are due, putting any that fail back on the
+    schedule to be tried again `retry_delay` seconds later.
+
+    :param schedule: a HeapArchiveSchedule or RedisArchiveSchedule.
+    :param archive: function; called with the config object and the
+        fullname of every post that is due.
+    :param config: the global config object.
+    :param now: float; the current epoch time. Defaults to time.time().
+    :param limit: int; the maximum number of posts to archive.
+    :param retry_delay: float; seconds to wait before retrying a post.
+    :return: int; the number of posts archived.
+    """
+    now = time.time() if now is None else now
+    archived = 0
+
+    for fullname in schedule.pop_due(now=now, limit=limit):
+        try:
+            archive(config, fullname)
+        except Exception as e:
+            logging.error(f'Failed to archive {fullname}: {e}')
+            schedule.add(fullname, now + retry_delay)
+            continue
+        archived += 1
+
+    return archived
+
+
+def schedule_post(post, schedule, config):
+    """
+    Adds a freshly ingested r/ToR post to an archive schedule, based on the
+    archive time of the partner subreddit it links to.
+
+    :param post: the submission object on r/ToR.
+    :param schedule: a HeapArchiveSchedule or RedisArchiveSchedule.
+    :param config: the global config object.
+    :return: float; the due time given to the post.
+    """
+    subreddit = subreddit_from_url(post.url) or ''
+    due = due_time(subreddit, post.created_utc, config)
+    schedule.add(post.fullname, due)
+    return due
@@ -0,0 +1,151 @@
+import logging
+import random
+import threading
+from collections import deque
+
+from tor_core.helpers import get_wiki_page
+from tor_core.wiki_parser import parse_urls
+
+# How many of the latest picks from a pool are kept out of the running, at
+# most; pools with few entries hold back fewer so there's always a choice.
+RECENT = 10
+
+
+class AssetPool(object):
+    """
+    A list of assets (e.g. GIF URLs) to pick from at random without showing
+    the same one twice in a short span. Picking is O(1) on average: a random
+    index is drawn until it lands on something that wasn't picked recently,
+    and since at most half of the pool is ever held back, that takes fewer
+    than two draws on average.
+    """
+
+    def __init__(self, urls, recent=RECENT):
+        self.recent_limit = recent
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=0)
+        self._recent_set = set()
+        self.source = None
+        self.urls = ()
+        self.update(urls)
+
+    def __len__(self):
+        return len(self.urls)
+
+    def update(self, urls):
+        """
+        Swaps in a new list of assets, remembering which of the recent picks
+        are still in it. Does nothing if the list hasn't changed.
+
+        :param urls: sequence of strings.
+        :return: None.
+        """
+        with self._lock:
+            if urls is self.source:
+                return
+            self.source = urls
+            if tuple(urls) == self.urls:
+                # a new snapshot hands us a new tuple even if nothing changed
+                return
+
+            self.urls = tuple(urls)
+            present = set(self.urls)
+            window = min(self.recent_limit, len(self.urls) // 2)
+
+            recent = [url for url in self._recent if url in present]
+            self._recent = deque(recent[-window:] if window else (),
+                                 maxlen=window)
+            self._recent_set = set(self._recent)
+
+    def choice(self):
+        """
+        :return: String or None. A random asset that wasn't picked recently,
+            or None if the pool is empty.
+        """
+        with self._lock:
+            if not self.urls:
+                return None
+
+            url = random.choice(self.urls)
+            while url in self._recent_set:
+                url = random.choice(self.urls)
+
+            if self._recent.maxlen:
+                if len(self._recent) == self._recent.maxlen:
+                    self._recent_set.discard(self._recent[0])
+                self._recent.append(url)
+                self._recent_set.add(url)
+            return url
+
+
+class AssetCatalogue(object):
+    """
+    The AssetPools for every set of assets in the configuration, kept in step
+    with the config snapshot: a pool is only rebuilt when its list of assets
+    has changed, and keeps its recent picks when it is.
+    """
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool(self, name, urls):
+        """
+        :param name: String. The name of the set of assets.
+        :param urls: sequence of strings; the assets currently configured.
+        :return: AssetPool.
+        """
+        with self._lock:
+            pool = self._pools.get(name)
+            if pool is None:
+                pool = self._pools[name] = AssetPool(urls)
+                return pool
+
+        pool.update(urls)
+        return pool
+
+
+# shared by every bot in the process, like the snapshot it follows
+catalogue = AssetCatalogue()
+
+
+def random_gif(config, name='no'):
+    """
+    Picks a GIF from one of the usefulgifs wiki pages, avoiding the ones
+    picked most recently.
+
+    :param config: the global config object.
+    :param name: String. The page under usefulgifs/, e.g. `no`.
+    :return: String or None. The URL of the GIF, or None if the page has no
+        usable URLs.
+    """
+    return catalogue.pool(name, config.gifs.get(name, ())).choice()
+
+
+def load_gif_pages(config, names=None):
+    """
+    Fetches the usefulgifs wiki pages one after another and parses them
+    into lists of unique, valid URLs. The pages are fetched on the calling
+    thread, since `config.r` can't be shared between threads.
+
+    :param config: the global config object.
+    :param names: Iterable of strings; the pages under usefulgifs/ to load.
+        Defaults to `config.gif_pages`.
+    :return: dict mapping the page name to a tuple of URLs.
+    """
+    names = tuple(names or config.gif_pages)
+
+    pages = {
+        name: get_wiki_page(f'usefulgifs/{name}', config) for name in names
+    }
+
+    gifs = {}
+    for name, text in pages.items():
+        errors = []
+        gifs[name] = tuple(parse_urls(text, errors))
+        for error in errors:
+            logging.warning(
+                f'Skipped bad entry on wiki page usefulgifs/{name}: {error}'
+            )
+
+    return gifs
@@ -0,0 +1,211 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import redis
+import redis.exceptions
+import requests.exceptions
+from raven import Client
+
+# A breaker opens after this many failures in a row, then fails every call
+# straight away for `RESET_TIMEOUT` seconds before letting a single probe
+# through to see whether the dependency has recovered.
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency whose breaker is open.
+    """
+
+    def __init__(self, name):
+        super().__init__(f'Circuit breaker for {name} is open')
+        self.name = name
+
+
+# not a ConnectionError, which prawcore would retry after sleeping a bit
+class HTTPCircuitOpen(CircuitOpenError, requests.exceptions.RequestException):
+    pass
+
+
+class RedisCircuitOpen(CircuitOpenError, redis.exceptions.ConnectionError):
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Tracks the health of one external dependency: closed while it works,
+    open (failing fast) after `failure_threshold` failures in a row, and half
+    open once `reset_timeout` seconds have passed, when one call is let
+    through as a probe. A successful probe closes the breaker again; a failed
+    one opens it for another `reset_timeout`. A probe that never reports back
+    is given up on after `reset_timeout` as well.
+    """
+
+    def __init__(
+        self,
+        name,
+        failure_threshold=FAILURE_THRESHOLD,
+        reset_timeout=RESET_TIMEOUT,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self.opened_at = None
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        :return: bool; whether a call to the dependency may go ahead.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN:
+                if now - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probe_started = None
+
+            if self.state == HALF_OPEN:
+                probe = self._probe_started
+                if probe is not None and now - probe < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self._probe_started = now
+
+            return True
+
+    def success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logging.info(f'{self.name} recovered; closing its breaker')
+            self.state = CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            tripped = self.failures >= self.failure_threshold
+            if self.state == HALF_OPEN or (self.state == CLOSED and tripped):
+                logging.warning(
+                    f'{self.name} failed {self.failures} times in a row; '
+                    f'failing fast for {self.reset_timeout}s'
+                )
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.trips += 1
+
+    @contextmanager
+    def guard(self, failures=(Exception,), error=CircuitOpenError):
+        """
+        Context manager around a call to the dependency. Raises `error`
+        without running the block while the breaker is open, and counts the
+        exceptions in `failures` raised from the block as failures.
+
+        :param failures: tuple of exception classes meaning the dependency
+            is in trouble. Anything else still shows that it answered.
+        :param error: the CircuitOpenError subclass to raise.
+        """
+        if not self.allow():
+            raise error(self.name)
+
+        failed = False
+        try:
+            yield
+        except failures:
+            failed = True
+            raise
+        finally:
+            if failed:
+                self.failure()
+            else:
+                self.success()
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
+
+
+# one breaker per dependency, shared by everything in the process
+breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, **kwargs):
+    """
+    Returns the breaker of a dependency, creating it the first time.
+
+    :param name: String. The name of the dependency, e.g. `redis`.
+    :param kwargs: passed to CircuitBreaker when it is created.
+    :return: CircuitBreaker.
+    """
+    with _breakers_lock:
+        breaker = breakers.get(name)
+        if breaker is None:
+            breaker = breakers[name] = CircuitBreaker(name, **kwargs)
+        return breaker
+
+
+def breaker_report():
+    """
+    :return: dict; the state of every breaker, keyed by name.
+    """
+    with _breakers_lock:
+        current = list(breakers.values())
+    return {breaker.name: breaker.as_dict() for breaker in current}
+
+
+class GuardedRedis(redis.StrictRedis):
+    """
+    A Redis client whose commands fail fast while Redis is unreachable.
+    Commands sent through a pipeline aren't covered.
+    """
+
+    _failures = (
+        redis.exceptions.ConnectionError,
+        redis.exceptions.TimeoutError,
+    )
+
+    def execute_command(self, *args, **options):
+        breaker = get_breaker('redis')
+        with breaker.guard(self._failures, RedisCircuitOpen):
+            return super().execute_command(*args, **options)
+
+
+class GuardedSentryClient(Client):
+    """
+    A Sentry client which drops events instead of queueing them while Sentry
+    is failing. Sending happens on raven's background thread, so the breaker
+    is told about failures through raven's callbacks.
+    """
+
+    def send_remote(self, url, data, headers=None):
+        if not get_breaker('sentry').allow():
+            return None
+        return super().send_remote(url, data, headers=headers)
+
+    def _successful_send(self):
+        get_breaker('sentry').success()
+        super()._successful_send()
+
+    def _failed_send(self, exc, url, data):
+        get_breaker('sentry').failure()
+        super()._failed_send(exc, url, data)
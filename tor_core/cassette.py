@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from collections import deque
+from collections.abc import Mapping
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from tor_core.transport import TunedSession
+from tor_core.transport import endpoint_name
+
+# Where the cassette goes unless `TOR_CASSETTE` says otherwise
+CASSETTE_FILE = 'tor_cassette.jsonl'
+
+# these headers describe the encoding of the body on the wire, which we've
+# already undone by the time it is recorded
+_dropped_headers = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+_ratelimit_body = json.dumps({'json': {'errors': [[
+    'RATELIMIT',
+    'you are doing that too much. try again in 1 second.',
+    'ratelimit',
+]]}})
+
+
+def _normalize_url(url, params=None):
+    # PRAW passes most query parameters separately from the URL
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query)
+    if isinstance(params, Mapping):
+        query += [(k, str(v)) for k, v in params.items() if v is not None]
+    elif params:
+        query += [(k, str(v)) for k, v in params]
+    query = urlencode(sorted(query))
+    return parts._replace(query=query, fragment='').geturl()
+
+
+def _is_token_request(url):
+    return urlsplit(url).path.endswith('/api/v1/access_token')
+
+
+def _redact(interaction):
+    # OAuth responses carry the bearer token, and cassettes get passed around
+    if _is_token_request(interaction['url']):
+        try:
+            body = json.loads(interaction['content'])
+            body['access_token'] = 'REDACTED'
+            interaction['content'] = json.dumps(body)
+        except ValueError:
+            pass
+    return interaction
+
+
+class RecordingSession(TunedSession):
+    """
+    A session that makes real requests and appends every response to a
+    cassette file, one JSON object per line, for `ReplaySession` to serve
+    later. Request headers and bodies are not recorded, so credentials never
+    end up in the file.
+    """
+
+    def __init__(self, path=CASSETTE_FILE, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._file_lock = threading.Lock()
+
+    def request(self, method, url, *args, **kwargs):
+        started = time.monotonic()
+        response = super().request(method, url, *args, **kwargs)
+
+        interaction = _redact({
+            'method': method.upper(),
+            'url': _normalize_url(url, kwargs.get('params')),
+            'status': response.status_code,
+            'headers': {
+                k: v for k, v in response.headers.items()
+                if k.lower() not in _dropped_headers
+            },
+            'content': response.content.decode('utf-8', 'replace'),
+            'elapsed': time.monotonic() - started,
+        })
+
+        with self._file_lock, open(self.path, 'a') as cassette:
+            cassette.write(json.dumps(interaction) + '\n')
+
+        return response
+
+
+class ReplaySession(TunedSession):
+    """
+    A session that answers every request from a cassette recorded by
+    `RecordingSession`, for load testing bots offline.
+
+    Requests are matched on the method and full URL (query parameters
+    included, in any order) first, then on the endpoint alone (see
+    `tor_core.transport.endpoint_name`) so that listings fetched with
+    different `before`/`after` parameters still get an answer. Each match
+    hands out its recorded responses in order and starts over once it runs
+    out, so a short recording can drive a long test.
+    """
+
+    def __init__(
+        self,
+        path=CASSETTE_FILE,
+        speed=1,
+        latency=0,
+        ratelimit_rate=0,
+        **kwargs
+    ):
+        """
+        :param path: String. The cassette file.
+        :param speed: float; how fast to play back compared to the recorded
+            response times, or 0 for no delay at all.
+        :param latency: float; seconds added to every response.
+        :param ratelimit_rate: float; the chance of answering a POST with a
+            RATELIMIT error instead.
+        """
+        super().__init__(**kwargs)
+        self.speed = speed
+        self.added_latency = latency
+        self.ratelimit_rate = ratelimit_rate
+
+        self._by_url = defaultdict(deque)
+        self._by_endpoint = defaultdict(deque)
+        self._replay_lock = threading.Lock()
+
+        with open(path) as cassette:
+            for line in cassette:
+                interaction = json.loads(line)
+                method = interaction['method']
+                self._by_url[method, interaction['url']].append(interaction)
+                self._by_endpoint[
+                    endpoint_name(method, interaction['url'])
+                ].append(interaction)
+
+        logging.info(f'Replaying HTTP responses from {path}')
+
+    def _next_interaction(self, method, url, params=None):
+        with self._replay_lock:
+            for recorded in (
+                self._by_url.get((method, _normalize_url(url, params))),
+                self._by_endpoint.get(endpoint_name(method, url)),
+            ):
+                if recorded:
+                    interaction = recorded.popleft()
+                    recorded.append(interaction)
+                    return interaction
+        return None
+
+    def request(self, method, url, *args, **kwargs):
+        method = method.upper()
+        started = time.monotonic()
+        interaction = self._next_interaction(method, url,
+                                             kwargs.get('params'))
+
+        if interaction is None:
+            status, headers, content, elapsed = 404, {}, '{}', 0
+            logging.warning(f'No recorded response for {method} {url}')
+        else:
+            status = interaction['status']
+            headers = interaction['headers']
+            content = interaction['content']
+            elapsed = interaction['elapsed']
+
+        throttled = random.random() < self.ratelimit_rate
+        if method == 'POST' and throttled and not _is_token_request(url):
+            status, content = 200, _ratelimit_body
+
+        if self.speed:
+            time.sleep(elapsed / self.speed)
+        if self.added_latency:
+            time.sleep(self.added_latency)
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content.encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = url
+        response.request = requests.Request(method, url).prepare()
+
+        self._record(endpoint_name(method, url),
+                     time.monotonic() - started, status >= 500,
+                     len(response._content))
+        return response
+
+
+def configure_cassette(config):
+    """
+    Swaps the shared HTTP session for a recording or replaying one when
+    `TOR_CASSETTE_MODE` is set to `record` or `replay`, using the cassette
+    file in `TOR_CASSETTE`. Replays are tuned with `TOR_REPLAY_SPEED`,
+    `TOR_REPLAY_LATENCY` and `TOR_REPLAY_RATELIMIT_RATE`, as for
+    `ReplaySession`. Must run before the Reddit instance is created.
+
+    :param config: the global config object.
+    :return: None.
+    """
+    mode = os.getenv('TOR_CASSETTE_MODE')
+    if not mode:
+        return
+
+    path = os.getenv('TOR_CASSETTE', CASSETTE_FILE)
+    settings = {
+        'connect_timeout': config.http_connect_timeout,
+        'read_timeout': config.http_read_timeout,
+        'pool_size': config.http_pool_size,
+    }
+
+    if mode == 'record':
+        config.http = RecordingSession(path, **settings)
+        logging.info(f'Recording HTTP responses to {path}')
+    elif mode == 'replay':
+        config.http = ReplaySession(
+            path,
+            speed=float(os.getenv('TOR_REPLAY_SPEED', '1')),
+            latency=float(os.getenv('TOR_REPLAY_LATENCY', '0')),
+            ratelimit_rate=float(os.getenv('TOR_REPLAY_RATELIMIT_RATE', '0')),
+            **settings
+        )
+    else:
+        logging.error(f'Unknown TOR_CASSETTE_MODE {mode}, ignoring')
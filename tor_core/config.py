@@ -2,6 +2,11 @@ import logging
 import os
 import random
 import datetime
+import threading
+from collections import OrderedDict
+from collections import namedtuple
+from collections.abc import Mapping
+from types import MappingProxyType
 
 # Load configuration regardless of if bugsnag is setup correctly
 try:
@@ -79,7 +84,7 @@ class BaseConfig:
     """
 
     # Whitelisted domains
-    domains = []
+    domains = ()
 
     formatting = ''
 
@@ -151,49 +156,207 @@ class DefaultSubreddit(Subreddit):
     """
 
 
+# Everything the bots load from Reddit, as one immutable value. Reloading the
+# configuration builds a new snapshot and swaps it in with a single reference
+# assignment, so a reader holding on to `config.snapshot` always sees a
+# consistent version of it without any locking.
+ConfigSnapshot = namedtuple('ConfigSnapshot', [
+    'version',
+    'video_domains',
+    'audio_domains',
+    'image_domains',
+    'video_formatting',
+    'audio_formatting',
+    'image_formatting',
+    'other_formatting',
+    'header',
+    'subreddits_to_check',
+    'subreddits_domain_filter_bypass',
+    'upvote_filter_subs',
+    'no_link_header_subs',
+    'archive_time_default',
+    'archive_time_subreddits',
+    'tor_mods',
+    'no_gifs',
+    'gifs',
+    'flair_templates',
+])
+
+empty_snapshot = ConfigSnapshot(
+    version=0,
+    video_domains=(),
+    audio_domains=(),
+    image_domains=(),
+    video_formatting='',
+    audio_formatting='',
+    image_formatting='',
+    other_formatting='',
+    header='',
+    subreddits_to_check=(),
+    subreddits_domain_filter_bypass=(),
+    upvote_filter_subs=MappingProxyType({}),
+    no_link_header_subs=(),
+    archive_time_default=0,
+    archive_time_subreddits=MappingProxyType({}),
+    tor_mods=(),
+    no_gifs=(),
+    gifs=MappingProxyType({}),
+    flair_templates=MappingProxyType({}),
+)
+
+
+def freeze(value):
+    """
+    Turns lists and dicts into their read-only counterparts for use in a
+    ConfigSnapshot. Anything else is assumed to be immutable already.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    if isinstance(value, dict):
+        return MappingProxyType(
+            {key: freeze(item) for key, item in value.items()}
+        )
+    return value
+
+
+def thaw(value):
+    """
+    Turns a ConfigSnapshot value back into plain lists, dicts and strings,
+    e.g. to store it as JSON.
+    """
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(thaw(item) for item in value)
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    # the mod list holds Redditor objects; their names are all we need, and
+    # Redditor objects still compare equal to them
+    return str(value)
+
+
+class SnapshotCell(object):
+    """
+    Holds the ConfigSnapshot in use and the one it replaced. Config objects
+    sharing a cell (see `Config.share_snapshots()`) keep a single copy of the
+    configuration between them and all see every reload.
+    """
+
+    def __init__(self):
+        self.current = empty_snapshot
+        self.previous = None
+        # only writers take the lock; readers just grab `current`
+        self.lock = threading.Lock()
+
+
+def _snapshot_property(name):
+    def getter(self):
+        return getattr(self.snapshot, name)
+
+    def setter(self, value):
+        self.replace(**{name: value})
+
+    return property(getter, setter, doc=f'`{name}` of the current snapshot')
+
+
+class ConfigStaging(object):
+    """
+    Collects the values set while the configuration is being reloaded, so
+    that they can be swapped in all at once with `Config.replace()`.
+    Everything that isn't set is read from the config object.
+    """
+
+    def __init__(self, config):
+        self.__dict__['_config'] = config
+        self.__dict__['changes'] = {}
+
+    def __getattr__(self, name):
+        try:
+            return self.changes[name]
+        except KeyError:
+            return getattr(self._config, name)
+
+    def __setattr__(self, name, value):
+        self.changes[name] = value
+
+    def replace(self, **changes):
+        self.changes.update(changes)
+
+
 class Config(object):
     """
-    A singleton object for checking global configuration from
-    anywhere in the application
+    An object for checking global configuration from anywhere in the
+    application. Every bot has one: the `config` singleton below, or its own
+    when several bots share a process (see `tor_core.host`).
     """
 
     # Media-specific rules, which are fetchable by a dict key. These
     # are intended to be programmatically accessible based on a
     # parameter given instead of hardcoding the media type in a
     # switch-case style of control structure
-    media = {
+    media = MappingProxyType({
         'audio': AudioConfig(),
         'video': VideoConfig(),
         'image': ImageConfig(),
         'other': OtherContentConfig(),
-    }
+    })
 
     # List of mods of ToR, fetched later using PRAW
-    mods = []
+    mods = ()
 
     # A collection of Subreddit objects, injected later based on
     # subreddit-specific rules
-    subreddits = []
-    subreddits_to_check = []
-    subreddits_domain_filter_bypass = []
+    subreddits = ()
+
+    video_domains = _snapshot_property('video_domains')
+    audio_domains = _snapshot_property('audio_domains')
+    image_domains = _snapshot_property('image_domains')
+    video_formatting = _snapshot_property('video_formatting')
+    audio_formatting = _snapshot_property('audio_formatting')
+    image_formatting = _snapshot_property('image_formatting')
+    other_formatting = _snapshot_property('other_formatting')
+    subreddits_to_check = _snapshot_property('subreddits_to_check')
+    subreddits_domain_filter_bypass = _snapshot_property(
+        'subreddits_domain_filter_bypass'
+    )
+    upvote_filter_subs = _snapshot_property('upvote_filter_subs')
+    no_link_header_subs = _snapshot_property('no_link_header_subs')
+    tor_mods = _snapshot_property('tor_mods')
+    flair_templates = _snapshot_property('flair_templates')
 
     # API keys for later overwriting based on contents of filesystem
     bugsnag_api_key = None
     sentry_api_url = None
 
+    # Where errors are reported, see tor_core.error_reporting: `sentry`,
+    # `bugsnag`, `file` or `none`; None picks whichever has a key
+    error_backend = None
+    error_sample_rate = 1.0
+    error_file = 'errors.jsonl'
+    error_reporter = None
+
     # Templating string for the header of the bot post
-    header = ''
+    header = _snapshot_property('header')
     modchat_api_url = None
     modchat = None  # the actual modchat instance
 
-    no_gifs = []
+    no_gifs = _snapshot_property('no_gifs')
+
+    # The pages under usefulgifs/ on the wiki to load into `gifs`, which maps
+    # the page name to its URLs; see tor_core.assets
+    gif_pages = ('no',)
+    gifs = _snapshot_property('gifs')
 
     perform_header_check = True
     debug_mode = False
 
     # delay times for removing posts; these are used by u/ToR_archivist
-    archive_time_default = None
-    archive_time_subreddits = {}
+    archive_time_default = _snapshot_property('archive_time_default')
+    archive_time_subreddits = _snapshot_property('archive_time_subreddits')
 
     # Global flag to enable/disable placing the triggers
     # for the OCR bot
@@ -202,22 +365,160 @@ class Config(object):
     # Name of the bot
     name = None
     bot_version = '0.0.0'  # this should get overwritten by the bot process
+    core_version = __version__
     heartbeat_logging = False
 
-    last_post_scan_time = datetime.datetime(1970, 1, 1, 1, 1, 1)
+    # Whether to share the wiki-derived configuration with other bots
+    # through Redis, and how many seconds a shared copy stays usable; wiki
+    # edits show up that late unless reloaded with `initialize(refresh=True)`
+    shared_config = False
+    shared_config_max_age = 60 * 60
+
+    # Settings for the HTTP session shared by PRAW and modchat; see
+    # tor_core.transport
+    http_connect_timeout = 3.05
+    http_read_timeout = 16
+    http_pool_size = 10
+
+    # Requests per second (and how many may go out back to back) that every
+    # bot sharing this bot's Reddit OAuth client may make between them, and
+    # this bot's weight (above zero) when splitting them; see
+    # tor_core.throttle
+    reddit_rate_limit = 1.0
+    reddit_burst = 10
+    throttle_weight = 1
+    throttle = None
+
+    # Seconds that in-flight work gets to finish once the bot is asked to stop;
+    # see tor_core.shutdown
+    shutdown_timeout = 10
+
+    # Whether this bot may use Redis; see build_bot()
+    require_redis = True
+
+    # Where the warm state is handed over to the next process on restarts, if
+    # not through Redis; see tor_core.startup
+    handoff_file = None
+
+    def __init__(self):
+        self._snapshots = SnapshotCell()
+
+        # the tor_core.state_store.StateStore keeping state across restarts,
+        # if the bot has one
+        self.state = None
+        self._last_post_scan_time = datetime.datetime(1970, 1, 1, 1, 1, 1)
+
+        # flair changes waiting to be sent, and flair templates found while
+        # running that weren't in `flair_templates`; see tor_core.flair
+        self.flair_queue = OrderedDict()
+        self.learned_flair_templates = {}
+        self.flair_template_lock = threading.Lock()
+
+        # the HTTP session shared by PRAW and modchat, set up by build_bot()
+        self.http = None
+
+        # the tor_core.profiling.LoopProfiler watching run_until_dead(), if
+        # any
+        self.profiler = None
+
+        # version stamps of the config sections shared through Redis
+        self.shared_config_versions = {}
+
+        # how far along starting up the bot is, and when it got to each
+        # phase; see tor_core.startup
+        self.startup_phase = None
+        self.startup_phases = []
+
+        # state kept across restarts by the handoff: the functions dumping
+        # and restoring it, and what was handed over that hasn't been
+        # restored yet
+        self.warm_state = {}
+        self.handoff_state = {}
+
+        # called once by run_loop() after the first iteration: reloads the
+        # configuration from Reddit when the bot started from a handoff
+        self.pending_refresh = None
+
+    @property
+    def snapshot(self):
+        """
+        The configuration loaded from Reddit.
+        """
+        return self._snapshots.current
+
+    @property
+    def previous_snapshot(self):
+        """
+        The snapshot replaced by the last reload, so that a bad reload can be
+        rolled back.
+        """
+        return self._snapshots.previous
+
+    @property
+    def last_post_scan_time(self):
+        return self._last_post_scan_time
+
+    @last_post_scan_time.setter
+    def last_post_scan_time(self, value):
+        self._last_post_scan_time = value
+        if self.state is not None:
+            self.state.set('last_post_scan_time', value)
+
+    def share_snapshots(self, other):
+        """
+        Makes this config use the same configuration loaded from Reddit as
+        `other`, including any later reloads by either of them.
+
+        :param other: Config.
+        :return: None.
+        """
+        self._snapshots = other._snapshots
+
+    def replace(self, **changes):
+        """
+        Swaps in a new snapshot with the given values changed and the version
+        bumped. The current snapshot is kept for `rollback()`.
+
+        :param changes: new values for fields of ConfigSnapshot.
+        :return: ConfigSnapshot; the new snapshot.
+        """
+        frozen = {name: freeze(value) for name, value in changes.items()}
+
+        cell = self._snapshots
+        with cell.lock:
+            cell.previous = cell.current
+            cell.current = cell.current._replace(
+                version=cell.current.version + 1, **frozen
+            )
+            return cell.current
+
+    def rollback(self):
+        """
+        Goes back to the snapshot in use before the last `replace()`.
+
+        :return: ConfigSnapshot; the snapshot now in use.
+        """
+        cell = self._snapshots
+        with cell.lock:
+            if cell.previous is not None:
+                cell.current, cell.previous = cell.previous, cell.current
+            return cell.current
 
     @cached_property
     def redis(self):
         """
         Lazy-loaded redis connection
         """
-        from redis import StrictRedis
+        from tor_core.breaker import GuardedRedis
         import redis.exceptions
 
+        if not self.require_redis:
+            raise NotImplementedError('Redis was disabled during building!')
+
         try:
             url = os.environ.get('REDIS_CONNECTION_URL',
                                  'redis://localhost:6379/0')
-            conn = StrictRedis.from_url(url)
+            conn = GuardedRedis.from_url(url)
             conn.ping()
         except redis.exceptions.ConnectionError:
             logging.fatal("Redis server is not running")
@@ -277,26 +578,6 @@ except OSError:
 
 # ----- Compatibility -----
 config = Config()
-config.core_version = __version__
-config.video_domains = []
-config.audio_domains = []
-config.image_domains = []
-
-config.video_formatting = ''
-config.audio_formatting = ''
-config.image_formatting = ''
-
-config.subreddits_to_check = []
-config.upvote_filter_subs = {}
-config.no_link_header_subs = []
-
-config.archive_time_default = 0
-config.archive_time_subreddits = {}
-
-config.tor_mods = []
-
-# section for gifs
-config.no_gifs = []
 
 # enables debug information for the cherrypy heartbeat server
 config.heartbeat_logging = False
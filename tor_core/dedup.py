@@ -0,0 +1,253 @@
+import hashlib
+import math
+import threading
+import time
+
+# Defaults sized for a bot remembering the posts and comments it has handled:
+# at most a million of them per generation, one in 10,000 of the new ones
+# mistaken for one already handled, forgotten after one to two days.
+CAPACITY = 1000000
+ERROR_RATE = 0.0001
+PERIOD = 24 * 60 * 60
+GENERATIONS = 2
+
+KEY_PREFIX = 'tor_seen:'
+
+
+def _parameters(capacity, error_rate):
+    # the classic optimum: bits per item and the number of hash functions
+    # giving the lowest false positive rate
+    size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    hashes = max(1, round(size / capacity * math.log(2)))
+    return size, hashes
+
+
+def _positions(item, size, hashes):
+    # Kirsch and Mitzenmacher: two hashes are as good as `hashes` of them
+    digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], 'little')
+    second = int.from_bytes(digest[8:], 'little') | 1
+    return [(first + i * second) % size for i in range(hashes)]
+
+
+class BloomFilter(object):
+    """
+    A set of strings in a fixed amount of memory, which can answer that it
+    holds a string it doesn't (with probability `error_rate` once it's full)
+    but never that it doesn't hold one it does. A million reddit IDs at one
+    in 10,000 false positives take 2.3MB, against around 85MB as a set.
+
+    The bits are laid out like a Redis bitmap, most significant bit first.
+    """
+
+    def __init__(self, capacity=CAPACITY, error_rate=ERROR_RATE):
+        """
+        :param capacity: int; how many strings it holds before false
+            positives get more common than `error_rate`.
+        :param error_rate: float; the chance of a false positive when full.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size, self.hashes = _parameters(capacity, error_rate)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (0x80 >> (position & 7))
+            for position in _positions(item, self.size, self.hashes)
+        )
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+    def add(self, item):
+        """
+        :param item: String.
+        :return: bool; True if the item wasn't in the filter before.
+        """
+        bits = self.bits
+        new = False
+        for position in _positions(item, self.size, self.hashes):
+            mask = 0x80 >> (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+
+class RotatingBloomFilter(object):
+    """
+    Bloom filters over time: adds go into the current generation, which is
+    retired every `period` seconds or as soon as it holds `capacity` items,
+    whichever comes first, and only the last `generations` are kept. Memory
+    stays fixed however long the bot runs, and anything added is remembered
+    for at least `period * (generations - 1)` seconds unless the bot sees
+    more than `capacity` new items in that time.
+    """
+
+    def __init__(
+        self,
+        capacity=CAPACITY,
+        error_rate=ERROR_RATE,
+        period=PERIOD,
+        generations=GENERATIONS,
+    ):
+        """
+        :param capacity: int; items per generation.
+        :param error_rate: float; the false positive rate of a full
+            generation. Checking against all of them adds up, so the rate
+            of the whole is at most `error_rate * generations`.
+        :param period: float; seconds a generation takes new items for.
+        :param generations: int; how many generations are kept, at least 2.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.period = period
+        self.generations = max(2, generations)
+
+        self._lock = threading.Lock()
+        self._filters = [self._new_filter()]
+        self._started = time.monotonic()
+
+    def _new_filter(self):
+        return BloomFilter(self.capacity, self.error_rate)
+
+    def _rotate_if_due(self):
+        current = self._filters[-1]
+        if current.full or time.monotonic() - self._started >= self.period:
+            self._filters = (
+                self._filters[-(self.generations - 1):] + [self._new_filter()]
+            )
+            self._started = time.monotonic()
+
+    def __contains__(self, item):
+        filters = self._filters
+        return any(item in bloom for bloom in reversed(filters))
+
+    def __len__(self):
+        return sum(len(bloom) for bloom in self._filters)
+
+    @property
+    def nbytes(self):
+        return sum(bloom.nbytes for bloom in self._filters)
+
+    def add(self, item):
+        """
+        :param item: String.
+        :return: bool; True if the item wasn't seen in any generation kept.
+        """
+        with self._lock:
+            self._rotate_if_due()
+            if any(item in bloom for bloom in self._filters[:-1]):
+                return False
+            return self._filters[-1].add(item)
+
+
+class RedisBloomFilter(object):
+    """
+    A RotatingBloomFilter kept in Redis bitmaps, so that what the bot has
+    seen survives restarts and can be shared by several instances of it.
+
+    Each generation is a bitmap under its own key, named after the period
+    it covers, which expires by itself once it's no longer needed; rotating
+    on a count isn't possible without coordination, so `capacity` should
+    allow for the busiest period.
+    """
+
+    def __init__(
+        self,
+        name,
+        config,
+        capacity=CAPACITY,
+        error_rate=ERROR_RATE,
+        period=PERIOD,
+        generations=GENERATIONS,
+    ):
+        """
+        :param name: String. What's being remembered, e.g. `seen_posts`.
+        :param config: the global config object.
+        :param capacity, error_rate, period, generations: as for
+            RotatingBloomFilter.
+        """
+        self.config = config
+        self.key = KEY_PREFIX + name
+        self.period = period
+        self.generations = max(2, generations)
+        self.size, self.hashes = _parameters(capacity, error_rate)
+
+    def _keys(self, now=None):
+        current = int((time.time() if now is None else now) // self.period)
+        return [
+            f'{self.key}:{generation}'
+            for generation in range(current - self.generations + 1,
+                                    current + 1)
+        ]
+
+    def __contains__(self, item):
+        positions = _positions(item, self.size, self.hashes)
+        pipe = self.config.redis.pipeline(transaction=False)
+        keys = self._keys()
+        for key in keys:
+            for position in positions:
+                pipe.getbit(key, position)
+        bits = pipe.execute()
+
+        return any(
+            all(bits[i:i + self.hashes])
+            for i in range(0, len(bits), self.hashes)
+        )
+
+    def add(self, item, now=None):
+        """
+        :param item: String.
+        :param now: float; the current epoch time. Defaults to time.time().
+        :return: bool; True if the item wasn't seen in any generation kept.
+        """
+        positions = _positions(item, self.size, self.hashes)
+        keys = self._keys(now)
+        *older, current = keys
+
+        pipe = self.config.redis.pipeline(transaction=False)
+        for key in older:
+            for position in positions:
+                pipe.getbit(key, position)
+        for position in positions:
+            pipe.setbit(current, position, 1)
+        pipe.expire(current, int(self.period * self.generations))
+        bits = pipe.execute()[:-1]
+
+        return not any(
+            all(bits[i:i + self.hashes])
+            for i in range(0, len(bits), self.hashes)
+        )
+
+
+def unseen(things, seen):
+    """
+    Filters a listing down to the posts or comments not seen before, marking
+    them as seen. For example:
+
+        seen_posts = RotatingBloomFilter()
+        ...
+        for post in unseen(subreddit.new(limit=100), seen_posts):
+            process(post)
+
+    :param things: iterable of PRAW objects with a `fullname`.
+    :param seen: one of the filters above.
+    :return: generator of the things that are new.
+    """
+    for thing in things:
+        if seen.add(thing.fullname):
+            yield thing
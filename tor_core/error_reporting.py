@@ -0,0 +1,301 @@
+import json
+import logging
+import os
+import random
+import threading
+import traceback
+
+from tor_core.breaker import GuardedSentryClient
+from tor_core.shutdown import LAST
+from tor_core.shutdown import shutdown
+
+try:
+    import bugsnag
+except ImportError:
+    bugsnag = None
+
+# How often the errors collected so far are sent off, and how many different
+# ones are collected in between; anything new past that is only counted.
+FLUSH_INTERVAL = 10
+MAX_FINGERPRINTS = 1000
+
+# Records from the reporting libraries themselves are never reported, or a
+# failing backend would keep reporting its own failures.
+_ignored_loggers = ('sentry', 'raven', 'bugsnag', __name__)
+
+# Not the root logger, which our handler is attached to.
+log = logging.getLogger(__name__)
+
+
+def fingerprint(record):
+    """
+    Works out which errors are the same error: the exception type and the
+    line it was raised on, or the unformatted message for errors logged
+    without an exception.
+
+    :param record: logging.LogRecord.
+    :return: String.
+    """
+    if record.exc_info and record.exc_info[1] is not None:
+        exc_type, exc, tb = record.exc_info
+        # the innermost frame, without building the whole stack
+        while tb is not None and tb.tb_next is not None:
+            tb = tb.tb_next
+        where = (
+            f'{tb.tb_frame.f_code.co_filename}:{tb.tb_lineno}'
+            if tb is not None else record.name
+        )
+        return f'{exc_type.__name__} at {where}'
+    return f'{record.name}: {record.msg}'
+
+
+class FileSink(object):
+    """
+    Appends reports to a local file, one JSON object per line, e.g. for
+    running without any error tracking service or in tests.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, reports):
+        with open(self.path, 'a') as error_file:
+            for report in reports:
+                error_file.write(json.dumps(report) + '\n')
+
+
+class SentrySink(object):
+    """
+    Sends each report to Sentry as one event, carrying the number of times
+    the error happened.
+    """
+
+    def __init__(self, dsn):
+        # sending already happens off the bot's thread, and sending
+        # synchronously means flush() has really sent everything
+        from raven.transport.http import HTTPTransport
+        self.client = GuardedSentryClient(
+            dsn, transport=HTTPTransport, install_sys_hook=False
+        )
+
+    def send(self, reports):
+        for report in reports:
+            self.client.captureMessage(
+                report['message'],
+                level=report['level'].lower(),
+                data={'fingerprint': [report['fingerprint']]},
+                extra=report,
+            )
+
+
+class BugsnagSink(object):
+    """
+    Sends each report to Bugsnag, carrying the number of times the error
+    happened. Bugsnag is set up from `bugsnag.key` by tor_core.config.
+    """
+
+    def __init__(self):
+        bugsnag.configure(asynchronous=False)
+
+    def send(self, reports):
+        for report in reports:
+            bugsnag.notify(
+                Exception(report['message']),
+                grouping_hash=report['fingerprint'],
+                meta_data={'report': report},
+            )
+
+
+class ErrorReporter(object):
+    """
+    Collects errors and sends them off in the background.
+
+    Errors are grouped by `fingerprint()` until the next flush, which sends
+    each group once with its count and the traceback of its first
+    occurrence. Only the first occurrence in a flush interval is formatted,
+    and the rest just increment its count, so an error repeating thousands
+    of times a second costs next to nothing on the thread it happens on and
+    one event per interval downstream. With a `sample_rate` below 1, only
+    that fraction of errors is counted at all.
+    """
+
+    def __init__(
+        self,
+        sinks,
+        sample_rate=1.0,
+        flush_interval=FLUSH_INTERVAL,
+        max_fingerprints=MAX_FINGERPRINTS,
+    ):
+        """
+        :param sinks: list of objects with a `send(reports)` method, such as
+            FileSink.
+        :param sample_rate: float between 0 and 1.
+        :param flush_interval: float; seconds between flushes.
+        :param max_fingerprints: int; the most different errors held
+            between flushes.
+        """
+        self.sinks = sinks
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.max_fingerprints = max_fingerprints
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.dropped = 0
+
+        self._wake = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(
+            target=self._flush_periodically,
+            name='error-reporter',
+            daemon=True,
+        )
+        self._flusher.start()
+
+    def report(self, record):
+        """
+        :param record: logging.LogRecord.
+        :return: None.
+        """
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+
+        key = fingerprint(record)
+        with self._lock:
+            report = self._pending.get(key)
+            if report is not None:
+                report['count'] += 1
+                report['last_seen'] = record.created
+                return
+            if len(self._pending) >= self.max_fingerprints:
+                self.dropped += 1
+                return
+            self._pending[key] = {
+                'fingerprint': key,
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage(),
+                'traceback': (
+                    ''.join(traceback.format_exception(*record.exc_info))
+                    if record.exc_info else None
+                ),
+                'count': 1,
+                'first_seen': record.created,
+                'last_seen': record.created,
+                'sample_rate': self.sample_rate,
+            }
+
+    def flush(self):
+        """
+        Sends everything collected since the last flush.
+
+        :return: int; the number of reports sent.
+        """
+        with self._lock:
+            reports = list(self._pending.values())
+            self._pending = {}
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            log.warning(f'Dropped {dropped} errors past {len(reports)} kinds')
+        if not reports:
+            return 0
+
+        for sink in self.sinks:
+            try:
+                sink.send(reports)
+            except Exception as e:
+                log.warning(
+                    f'Failed to send {len(reports)} error reports to '
+                    f'{type(sink).__name__}: {e}'
+                )
+        return len(reports)
+
+    def _flush_periodically(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """
+        Sends what's left and stops the background thread.
+
+        :return: None.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._flusher.join()
+        self.flush()
+
+
+class ReportingHandler(logging.Handler):
+    """
+    Passes error records logged anywhere in the bot on to an ErrorReporter.
+    """
+
+    def __init__(self, reporter, level=logging.ERROR):
+        super().__init__(level)
+        self.reporter = reporter
+
+    def emit(self, record):
+        if record.name.startswith(_ignored_loggers):
+            return
+        try:
+            self.reporter.report(record)
+        except Exception:
+            self.handleError(record)
+
+
+def make_sinks(config, backend):
+    """
+    :param config: the global config object.
+    :param backend: String. `sentry`, `bugsnag`, `file` or `none`.
+    :return: list of sinks.
+    """
+    if backend == 'sentry' and config.sentry_api_url:
+        return [SentrySink(config.sentry_api_url)]
+    if backend == 'bugsnag' and bugsnag and config.bugsnag_api_key:
+        return [BugsnagSink()]
+    if backend == 'file':
+        return [FileSink(config.error_file)]
+    return []
+
+
+def configure_error_reporting(config):
+    """
+    Sets up `config.error_reporter` with the backend chosen by
+    `config.error_backend` (or `TOR_ERROR_BACKEND`): `sentry`, `bugsnag`,
+    `file` or `none`. By default that's Sentry if it's set up, otherwise
+    Bugsnag if it's set up. The sample rate can be set with
+    `TOR_ERROR_SAMPLE_RATE`. Whatever is pending is sent on shutdown.
+
+    :param config: the global config object.
+    :return: ErrorReporter, or None if there is nowhere to send errors.
+    """
+    backend = os.environ.get('TOR_ERROR_BACKEND', config.error_backend)
+    if backend is None:
+        if config.sentry_api_url:
+            backend = 'sentry'
+        elif config.bugsnag_api_key:
+            backend = 'bugsnag'
+
+    sinks = make_sinks(config, backend)
+    if not sinks:
+        logging.info('Not reporting errors anywhere!')
+        return None
+
+    sample_rate = float(
+        os.environ.get('TOR_ERROR_SAMPLE_RATE', config.error_sample_rate)
+    )
+    config.error_reporter = ErrorReporter(sinks, sample_rate=sample_rate)
+    logging.getLogger('').addHandler(
+        ReportingHandler(config.error_reporter)
+    )
+    # after everything else, which may still report errors itself
+    shutdown.register(
+        config.error_reporter.close, order=LAST, name='flush error reports'
+    )
+    logging.info(f'Reporting errors to {backend}!')
+    return config.error_reporter
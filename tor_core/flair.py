@@ -0,0 +1,183 @@
+import logging
+
+import prawcore
+from praw.const import API_PATH
+
+from tor_core.helpers import css_flair
+from tor_core.helpers import flair
+
+# how many requests we leave untouched in the current rate limit window when
+# working through the flair queue, so the bot's main loop never starves
+DEFAULT_RESERVE = 10
+
+
+def _template_text(template):
+    # /api/link_flair and /api/flairselector don't agree on key names
+    return template.get('flair_text', template.get('text'))
+
+
+def _template_id(template):
+    return template.get('flair_template_id', template.get('id'))
+
+
+def _template_css(template):
+    return template.get('flair_css_class', template.get('css_class'))
+
+
+def _templates_by_text(templates):
+    # map the css classes back onto the `flair` constants by attribute name
+    # so that a template is still found if the mods change the visible text
+    css_to_text = {
+        getattr(css_flair, name): getattr(flair, name)
+        for name in vars(css_flair)
+        if hasattr(flair, name)
+    }
+
+    found = {}
+    for template in templates:
+        text = _template_text(template)
+        template_id = _template_id(template)
+        if not text or not template_id:
+            continue
+
+        found[text] = template_id
+
+        css_class = _template_css(template)
+        if css_class in css_to_text:
+            found.setdefault(css_to_text[css_class], template_id)
+
+    return found
+
+
+def populate_flair_templates(config):
+    """
+    Caches the link flair templates of r/ToR so that setting flair on a post
+    only costs one request instead of the `choices()` + `select()` pair.
+
+    :param config: the global config object.
+    :return: None.
+    """
+    try:
+        config.flair_templates = _templates_by_text(
+            config.tor.flair.link_templates
+        )
+    except prawcore.exceptions.Forbidden:
+        # we'll pick them up from the first post we flair instead
+        logging.warning('Not allowed to list link flair templates.')
+        config.flair_templates = {}
+
+    logging.debug(f'Flair templates loaded: {config.flair_templates}')
+
+
+def get_flair_template_id(flair_text, config, post=None):
+    """
+    Returns the template ID for one of the `tor_core.helpers.flair` values.
+
+    :param flair_text: String. One of the values of `flair`.
+    :param config: the global config object.
+    :param post: Object. A submission to ask for the flair choices if the
+        template isn't cached yet.
+    :return: String or None. The template ID if known.
+    """
+    template_id = config.flair_templates.get(flair_text)
+    if template_id is not None:
+        return template_id
+
+    # templates picked up while running are kept out of the snapshot, so
+    # that learning one doesn't count as a reload of the configuration
+    with config.flair_template_lock:
+        template_id = config.learned_flair_templates.get(flair_text)
+    if template_id is None and post is not None:
+        learned = _templates_by_text(post.flair.choices())
+        with config.flair_template_lock:
+            config.learned_flair_templates.update(learned)
+        template_id = learned.get(flair_text)
+
+    return template_id
+
+
+def flair_post(post, flair_text, config):
+    """
+    Sets the flair on a single post using the cached template IDs.
+
+    :param post: the submission object to flair.
+    :param flair_text: String. One of the values of `flair`.
+    :param config: the global config object.
+    :return: None.
+    """
+    template_id = get_flair_template_id(flair_text, config, post=post)
+    if template_id is None:
+        logging.error(f'No flair template found for {flair_text}!')
+        return
+
+    post.flair.select(template_id)
+
+
+def queue_flair(post, flair_text, config):
+    """
+    Schedules a flair change to be sent by `flush_flair_queue()`. Queuing the
+    same post again replaces the pending change, so only the final state of a
+    post gets sent to Reddit.
+
+    :param post: the submission object to flair.
+    :param flair_text: String. One of the values of `flair`.
+    :param config: the global config object.
+    :return: None.
+    """
+    config.flair_queue.pop(post.fullname, None)
+
+    # only look at data we already have -- getattr() on a lazy PRAW object
+    # would cost us the very request we're trying to save
+    if vars(post).get('link_flair_text') == flair_text:
+        return
+
+    config.flair_queue[post.fullname] = (post, flair_text)
+
+
+def _remaining_requests(config):
+    try:
+        return config.r._core._rate_limiter.remaining
+    except AttributeError:
+        return None
+
+
+def flush_flair_queue(config, reserve=DEFAULT_RESERVE, limit=None):
+    """
+    Sends queued flair changes to Reddit in the order they were queued.
+
+    Reddit has no endpoint for flairing several posts at once, so instead we
+    stop once the current rate limit window is down to `reserve` requests;
+    whatever is left stays queued for the next call.
+
+    :param config: the global config object.
+    :param reserve: int; the number of requests to leave for everything else.
+    :param limit: int; the maximum number of posts to flair in this call.
+    :return: int; the number of posts flaired.
+    """
+    sent = 0
+
+    while config.flair_queue:
+        if limit is not None and sent >= limit:
+            break
+
+        remaining = _remaining_requests(config)
+        if remaining is not None and remaining <= reserve:
+            logging.debug(
+                f'Rate limit budget reached with {len(config.flair_queue)} '
+                f'flair changes still queued.'
+            )
+            break
+
+        fullname, (post, flair_text) = config.flair_queue.popitem(last=False)
+        template_id = get_flair_template_id(flair_text, config, post=post)
+        if template_id is None:
+            logging.error(f'No flair template found for {flair_text}!')
+            continue
+
+        config.r.post(
+            API_PATH['select_flair'].format(subreddit=post.subreddit),
+            data={'flair_template_id': template_id, 'link': fullname}
+        )
+        sent += 1
+
+    return sent
@@ -2,7 +2,11 @@ import logging
 
 import cherrypy
 
+from tor_core.breaker import breaker_report
 from tor_core.config import config
+from tor_core.instrumentation import api_stats
+from tor_core.shutdown import shutdown
+from tor_core.startup import STOPPING
 
 conf = {
     '/': {
@@ -14,6 +18,10 @@ conf = {
     }
 }
 
+# the config objects of the bots run together in this process, if there are
+# several; see tor_core.host
+hosted_bots = []
+
 
 def configure_heartbeat(config):
     """
@@ -26,7 +34,9 @@ def configure_heartbeat(config):
     {
         'bot_name': 'this_is_an_awesome_bot',
         'bot_version': '9001',
-        'core_version': '0.2.0'
+        'core_version': '0.2.0',
+        'phase': 'ready',
+        ...
     }
 
     :param config: the global config object
@@ -52,15 +62,48 @@ def configure_heartbeat(config):
     start_heartbeat_server()
 
 
+def bot_status(config):
+    """
+    :param config: the config object of a bot.
+    :return: dict; what the heartbeat reports about the bot.
+    """
+    return {
+        'bot_name': config.name,
+        'bot_version': config.bot_version,
+        'core_version': config.core_version,
+        'phase': STOPPING if shutdown.requested else config.startup_phase,
+        'http_latency': (
+            config.http.latency_report() if config.http else {}
+        ),
+        'reddit_throttle': (
+            config.throttle.as_dict() if config.throttle else {}
+        ),
+    }
+
+
 @cherrypy.expose
 class heartbeat(object):
     @cherrypy.tools.json_out()
     def GET(self):
-        return {
-            'bot_name': config.name,
-            'bot_version': config.bot_version,
-            'core_version': config.core_version,
-        }
+        status = bot_status(config)
+        status['reddit_api'] = api_stats.report()
+        status['breakers'] = breaker_report()
+        if hosted_bots:
+            status['bots'] = [bot_status(bot) for bot in hosted_bots]
+        return status
+
+
+@cherrypy.expose
+class profile(object):
+    @cherrypy.tools.json_out()
+    def POST(self):
+        """
+        Writes out the profile of the main loop collected so far, if it's
+        being profiled.
+        """
+        if not config.profiler:
+            raise cherrypy.HTTPError(404, 'Profiling is not enabled')
+        return {'path': config.profiler.dump('heartbeat')}
 
 
 def start_heartbeat_server():
@@ -71,6 +114,7 @@ def start_heartbeat_server():
     :return: None
     """
     cherrypy.tree.mount(heartbeat(), '/', conf)
+    cherrypy.tree.mount(profile(), '/profile', conf)
     cherrypy.server.socket_host = "127.0.0.1"
     cherrypy.engine.start()
     logging.info('Cherrypy heartbeat started!')
@@ -2,15 +2,19 @@ import logging
 import re
 import sys
 import signal
-import time
+import types
+import warnings
 
 import praw
 import prawcore
-import requests
 
 from tor_core import __version__
+from tor_core.breaker import CircuitOpenError
 from tor_core.config import config
 from tor_core.heartbeat import stop_heartbeat_server
+from tor_core.profiling import profile_iteration
+from tor_core.profiling import profiler_from_env
+from tor_core.shutdown import shutdown
 from tor_core.strings import bot_footer
 
 
@@ -53,12 +57,9 @@ reports.no_bot_accounts = 'No bot accounts but our own'
 reports.post_violates_rules = 'Post Violates Rules on Partner Subreddit'
 
 # error message for an API timeout
-_pattern = re.compile('again in (?P<number>[0-9]+) (?P<unit>\w+)s?\.$',
+_pattern = re.compile(r'again in (?P<number>[0-9]+) (?P<unit>\w+?)s?\.$',
                       re.IGNORECASE)
 
-# CTRL+C handler variable
-running = True
-
 
 def _(message):
     """
@@ -108,6 +109,9 @@ def send_to_modchat(message, config, channel='general'):
                 channel=channel,
                 text=message
             )
+        except CircuitOpenError:
+            # Slack is down and we already said so when its breaker opened
+            logging.debug(f'Modchat unavailable, dropped: \'{message}\'')
         except Exception as e:
             logging.error(f'Failed to send message to modchat #{channel}: '
                           f'\'{message}\'')
@@ -125,6 +129,9 @@ def explode_gracefully(error, config):
     :return: Nothing. Everything dies here.
     """
     logging.error(error)
+    # the reporter sends in the background, which ends with the process
+    if config.error_reporter:
+        config.error_reporter.close()
     sys.exit(1)
 
 
@@ -237,9 +244,10 @@ def deactivate_heartbeat_port(port):
 def stop_heartbeat(config):
     """
     Any logic that goes along with stopping the cherrypy heartbeat server goes
-    here. This is called on exit of `run_until_dead()`, either through keyboard
-    or crash. The heartbeat server will terminate if the process dies anyway,
-    but this allows for a clean shutdown.
+    here. `build_bot()` registers this as the last shutdown hook, so it is
+    called on exit of `run_until_dead()`, either through keyboard or crash.
+    The heartbeat server will terminate if the process dies anyway, but this
+    allows for a clean shutdown.
 
     :param config: the global config object
     :return: None
@@ -248,48 +256,120 @@ def stop_heartbeat(config):
     logging.info('Stopped heartbeat!')
 
 
-def handle_rate_limit(exc):
+def rate_limit_delay(exc, default=60):
+    """
+    Works out how long Reddit wants us to wait from a RATELIMIT error.
+
+    :param exc: the praw APIException.
+    :param default: int; seconds to wait if the message can't be understood.
+    :return: int; the number of seconds to wait.
+    """
     time_map = {
         'second': 1,
         'minute': 60,
         'hour': 60 * 60,
     }
-    matches = re.search(_pattern, exc.message)
-    delay = matches[0] * time_map[matches[1]]
-    time.sleep(delay + 1)
+    matches = _pattern.search(exc.message or '')
+    if matches is None or matches.group('unit').lower() not in time_map:
+        logging.warning(f'Unrecognised rate limit message: {exc.message}')
+        return default
+    return int(matches.group('number')) * time_map[
+        matches.group('unit').lower()
+    ]
+
+
+def handle_rate_limit(exc):
+    shutdown.wait(rate_limit_delay(exc) + 1)
 
 
 def signal_handler(signal, frame):
     """
-    This is the SIGINT handler that allows us to intercept CTRL+C.
-    When this is triggered, it will wait until the primary loop ends
-    the current iteration before ending. Press CTRL+C twice to kill
-    immediately.
+    This is the SIGINT and SIGTERM handler that allows us to intercept CTRL+C.
+    When this is triggered, any sleep the bot is in ends right away and the
+    bot stops after the current iteration of the primary loop. Press CTRL+C
+    twice to interrupt the current iteration as well, or to stop waiting for
+    in-flight work if the bot is already shutting down.
 
     :param signal: Unused.
     :param frame: Unused.
     :return: None.
     """
-    global running
-
-    if not running:
+    if shutdown.finishing:
+        logging.critical('User pressed CTRL+C twice!!! Skipping the wait!')
+        # the cleanup hooks still run; interrupting them would leave them
+        # half done with no way to run them again
+        shutdown.hurry()
+        return
+
+    if shutdown.requested:
         logging.critical('User pressed CTRL+C twice!!! Killing!')
-        stop_heartbeat(config)
-        sys.exit(1)
+        # unwinds whatever the main loop is in the middle of; run_until_dead()
+        # still runs the cleanup hooks on the way out
+        raise KeyboardInterrupt
 
     logging.info(
         '\rUser triggered command line shutdown. Will terminate after current '
         'loop.'
     )
-    running = False
+    shutdown.request('signal')
+
 
+def dump_profile_handler(signal, frame):
+    """
+    SIGUSR1 handler which writes out the profile collected so far, if the
+    main loop is being profiled.
 
-def run_until_dead(func, exceptions=default_exceptions):
+    :param signal: Unused.
+    :param frame: Unused.
+    :return: None.
+    """
+    if config.profiler:
+        path = config.profiler.dump('signal')
+        logging.info(f'Profile saved to {path}')
+
+
+def run_loop(func, config, exceptions=default_exceptions):
+    """
+    Calls `func(config)` over and over until a shutdown is requested, riding
+    out rate limits and communication issues with Reddit. A bot started from
+    a handoff reloads its configuration after the first call. Used by
+    `run_until_dead()`, and by `tor_core.host` for every bot in the process.
+
+    :param func: The function that you want to run.
+    :param config: the config object of the bot.
+    :param exceptions: A tuple of exception classes to guard against.
+    :return: None.
+    """
+    while not shutdown.requested:
+        try:
+            with shutdown.in_flight(), profile_iteration(config.profiler):
+                func(config)
+        except praw.exceptions.APIException as e:
+            if e.error_type == 'RATELIMIT':
+                logging.warning(
+                    'Ratelimit - artificially limited by Reddit. Sleeping'
+                    ' for requested time!'
+                )
+                handle_rate_limit(e)
+        except exceptions as e:
+            logging.warning(
+                f'{e} - Issue communicating with Reddit. Sleeping for 60s!'
+            )
+            shutdown.wait(60)
+
+        if config.pending_refresh:
+            refresh, config.pending_refresh = config.pending_refresh, None
+            refresh()
+
+
+def run_until_dead(func, exceptions=default_exceptions, profiler=None):
     """
     The official method that replaces all that ugly boilerplate required to
     start up a bot under the TranscribersOfReddit umbrella. This method handles
-    communication issues with Reddit, timeouts, and handles CTRL+C and
-    unexpected crashes.
+    communication issues with Reddit, timeouts, and handles CTRL+C, SIGTERM
+    and unexpected crashes. However the loop ends, in-flight work gets
+    `config.shutdown_timeout` seconds to finish and the shutdown hooks run
+    (see `tor_core.shutdown`).
 
     :param func: The function that you want to run; this will automatically be
         passed the config object. Historically, this is the only thing needed
@@ -297,32 +377,60 @@ def run_until_dead(func, exceptions=default_exceptions):
     :param exceptions: A tuple of exception classes to guard against. These are
         a set of PRAW connection errors (timeouts and general connection
         issues) but they can be overridden with a passed-in set.
+    :param profiler: a tor_core.profiling.LoopProfiler to profile the loop
+        with. If not given, one is set up from the `TOR_PROFILE_*`
+        environment variables if they are set.
     :return: None.
     """
-    # handler for CTRL+C
+    # handler for CTRL+C, and for process managers stopping us
     signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
 
-    try:
-        while running:
-            try:
-                func(config)
-            except praw.exceptions.APIException as e:
-                if e.error_type == 'RATELIMIT':
-                    logging.warning(
-                        'Ratelimit - artificially limited by Reddit. Sleeping'
-                        ' for requested time!'
-                    )
-                    handle_rate_limit(e)
-            except exceptions as e:
-                logging.warning(
-                    f'{e} - Issue communicating with Reddit. Sleeping for 60s!'
-                )
-                time.sleep(60)
+    config.profiler = profiler or profiler_from_env(config.name or 'bot')
+    if config.profiler:
+        config.profiler.start()
+        shutdown.register(config.profiler.stop, name='stop profiler')
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, dump_profile_handler)
 
+    try:
+        run_loop(func, config, exceptions)
         logging.info('User triggered shutdown. Shutting down.')
-        stop_heartbeat(config)
+        shutdown.finish(config.shutdown_timeout)
         sys.exit(0)
 
+    except KeyboardInterrupt:
+        shutdown.finish(0)
+        sys.exit(1)
+
     except Exception as e:
-        stop_heartbeat(config)
+        shutdown.finish(config.shutdown_timeout)
         explode_gracefully(e, config)
+
+
+class _HelpersModule(types.ModuleType):
+    # `running` was the module-level flag the signal handler cleared before
+    # tor_core.shutdown existed; bots still reading or clearing it keep
+    # working, following `shutdown.requested`
+
+    @property
+    def running(self):
+        warnings.warn(
+            'tor_core.helpers.running is deprecated; use '
+            'tor_core.shutdown.shutdown.requested instead',
+            DeprecationWarning, stacklevel=2,
+        )
+        return not shutdown.requested
+
+    @running.setter
+    def running(self, value):
+        warnings.warn(
+            'tor_core.helpers.running is deprecated; use '
+            'tor_core.shutdown.shutdown.request() instead',
+            DeprecationWarning, stacklevel=2,
+        )
+        if not value:
+            shutdown.request('helpers.running')
+
+
+sys.modules[__name__].__class__ = _HelpersModule
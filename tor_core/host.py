@@ -0,0 +1,202 @@
+import logging
+import signal
+import sys
+import threading
+from functools import partial
+
+from praw import Reddit
+
+from tor_core.config import Config
+from tor_core.config import config as host_config
+from tor_core.flair import flush_flair_queue
+from tor_core.heartbeat import configure_heartbeat
+from tor_core.heartbeat import hosted_bots
+from tor_core.helpers import default_exceptions
+from tor_core.helpers import run_loop
+from tor_core.helpers import signal_handler
+from tor_core.helpers import stop_heartbeat
+from tor_core.initialize import config_sections
+from tor_core.initialize import configure_logging
+from tor_core.initialize import configure_modchat
+from tor_core.initialize import configure_redis
+from tor_core.initialize import load_configuration
+from tor_core.instrumentation import InstrumentedRequestor
+from tor_core.shared_config import listen_for_config_updates
+from tor_core.shutdown import LAST
+from tor_core.shutdown import shutdown
+from tor_core.startup import READY
+from tor_core.startup import STARTING
+from tor_core.startup import set_phase
+from tor_core.state_store import open_state_store
+from tor_core.throttle import RedditThrottle
+from tor_core.transport import TunedSession
+from tor_core.transport import pooled_adapter
+
+
+class BotHost(object):
+    """
+    Runs several bots in one process, each in its own thread with its own
+    config object and Reddit session, instead of one interpreter per bot.
+
+    The bots share one Redis connection pool, one pool of HTTP connections,
+    one modchat client, one copy of the configuration loaded from the wiki
+    and one heartbeat server, which reports on every bot under `bots`. The
+    global `tor_core.config.config` describes the host itself.
+
+    Example:
+
+        host = BotHost('tor_host')
+        host.add_bot('tor_archivist', archivist_version, run_archivist)
+        host.add_bot('tor_ocr', ocr_version, run_ocr)
+        host.run()
+
+    Bots run this way must only use the config object passed to their job.
+    """
+
+    def __init__(
+        self,
+        name='tor_host',
+        log_name='tor_host.log',
+        require_redis=True,
+        heartbeat_logging=False,
+        shared_config=False,
+    ):
+        """
+        :param name: string; the name the heartbeat reports for the host.
+        :param log_name: string; the name to be used for the log file on disk.
+        :param require_redis: bool; as for `build_bot()`, for every bot.
+        :param heartbeat_logging: bool; log hits on the heartbeat server.
+        :param shared_config: bool; as for `build_bot()`, for every bot.
+        """
+        self.config = host_config
+        self.config.name = name
+        self.config.heartbeat_logging = heartbeat_logging
+        self.config.require_redis = require_redis
+        self.config.shared_config = shared_config and require_redis
+
+        self.bots = []
+        self.failed = False
+        self._adapter = pooled_adapter(self.config.http_pool_size)
+
+        configure_logging(self.config, log_name=log_name)
+        set_phase(self.config, STARTING)
+        self.config.http = self._session()
+        configure_modchat(self.config)
+
+        if require_redis:
+            self.config.redis = configure_redis()
+            configure_heartbeat(self.config)
+            shutdown.register(partial(stop_heartbeat, self.config),
+                              order=LAST, name='stop_heartbeat')
+
+    def _session(self):
+        # every bot gets a session of its own for its user agent and latency
+        # counters, but the connections underneath are shared
+        return TunedSession(
+            connect_timeout=self.config.http_connect_timeout,
+            read_timeout=self.config.http_read_timeout,
+            adapter=self._adapter,
+        )
+
+    def add_bot(
+        self, name, version, func, full_name=None,
+        exceptions=default_exceptions, state_file=None
+    ):
+        """
+        Sets up a bot to run in this process. The first bot added loads the
+        configuration from the wiki for everyone.
+
+        :param name: string; The name of the bot; this name must match the
+            settings in praw.ini
+        :param version: string; the version number of the bot.
+        :param func: The function to run over and over, as given to
+            `run_until_dead()`; it is passed the bot's config object.
+        :param full_name: string; the descriptive name of the bot, used for
+            the heartbeat and status.
+        :param exceptions: A tuple of exception classes to guard against, as
+            for `run_until_dead()`.
+        :param state_file: string; as for `build_bot()`. Every bot needs a
+            file of its own.
+        :return: the bot's config object.
+        """
+        bot = Config()
+        bot.name = full_name if full_name else name
+        bot.bot_version = version
+        bot.require_redis = self.config.require_redis
+        bot.shared_config = self.config.shared_config
+        if bot.require_redis:
+            bot.redis = self.config.redis
+
+        bot.http = self._session()
+        bot.throttle = RedditThrottle(bot)
+        bot.r = Reddit(
+            name,
+            requestor_class=InstrumentedRequestor,
+            requestor_kwargs={'session': bot.http, 'throttle': bot.throttle},
+        )
+        bot.modchat = self.config.modchat
+        bot.share_snapshots(self.config)
+        if state_file:
+            open_state_store(bot, state_file)
+
+        if not self.bots:
+            load_configuration(bot)
+            if bot.shared_config:
+                listen_for_config_updates(bot, config_sections)
+        else:
+            set_phase(bot, READY)
+
+        shutdown.register(partial(flush_flair_queue, bot),
+                          name=f'flush_flair_queue for {bot.name}')
+
+        self.bots.append((bot, func, exceptions))
+        hosted_bots.append(bot)
+        logging.info(f'{bot.name} built and initialized!')
+        return bot
+
+    def _run_bot(self, bot, func, exceptions):
+        try:
+            run_loop(func, bot, exceptions)
+        except Exception as e:
+            # the process manager restarts us as a whole, as it would a
+            # single bot that crashed
+            logging.error(f'{bot.name} crashed: {e}')
+            self.failed = True
+            shutdown.request(f'{bot.name} crashed')
+
+    def run(self):
+        """
+        Runs every bot until the process is asked to stop or one of them
+        crashes, then shuts down like `run_until_dead()` does.
+
+        :return: None. Exits the process.
+        """
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+        threads = [
+            threading.Thread(
+                target=self._run_bot,
+                args=(bot, func, exceptions),
+                name=f'bot-{bot.name}',
+                daemon=True,
+            )
+            for bot, func, exceptions in self.bots
+        ]
+        for thread in threads:
+            thread.start()
+        set_phase(self.config, READY)
+
+        try:
+            # joining with a timeout leaves the main thread free to handle
+            # signals
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(1)
+        except KeyboardInterrupt:
+            shutdown.finish(0)
+            sys.exit(1)
+
+        logging.info('All bots stopped. Shutting down.')
+        shutdown.finish(self.config.shutdown_timeout)
+        sys.exit(1 if self.failed else 0)
@@ -2,21 +2,46 @@ import logging
 import os
 import random
 import sys
+from collections import OrderedDict
+from functools import partial
 
 import redis
-from bugsnag.handlers import BugsnagHandler
 from praw import Reddit
-from raven import Client
-from raven.conf import setup_logging
-from raven.handlers.logging import SentryHandler
 from slackclient import SlackClient
 
 from tor_core import __HEARTBEAT_FILE__
+from tor_core.assets import load_gif_pages
+from tor_core.breaker import GuardedRedis
+from tor_core.cassette import configure_cassette
+from tor_core.config import ConfigStaging
 from tor_core.config import config
+from tor_core.error_reporting import configure_error_reporting
+from tor_core.flair import flush_flair_queue
+from tor_core.flair import populate_flair_templates
 from tor_core.heartbeat import configure_heartbeat
-from tor_core.helpers import clean_list
 from tor_core.helpers import get_wiki_page
 from tor_core.helpers import log_header
+from tor_core.helpers import stop_heartbeat
+from tor_core.instrumentation import InstrumentedRequestor
+from tor_core.shared_config import listen_for_config_updates
+from tor_core.shared_config import populate_shared_section
+from tor_core.shutdown import LAST
+from tor_core.shutdown import shutdown
+from tor_core.startup import LOADING_CONFIG
+from tor_core.startup import READY
+from tor_core.startup import STARTING
+from tor_core.startup import WARM
+from tor_core.startup import load_handoff
+from tor_core.startup import set_phase
+from tor_core.startup import write_handoff
+from tor_core.state_store import open_state_store
+from tor_core.throttle import RedditThrottle
+from tor_core.transport import configure_http
+from tor_core.transport import use_session_for_modchat
+from tor_core.wiki_parser import parse_archive_times
+from tor_core.wiki_parser import parse_domains
+from tor_core.wiki_parser import parse_list
+from tor_core.wiki_parser import parse_thresholds
 
 
 def configure_tor(config):
@@ -48,7 +73,7 @@ def configure_redis():
     """
     try:
         url = os.getenv('REDIS_CONNECTION_URL', 'redis://localhost:6379/0')
-        redis_server = redis.StrictRedis.from_url(url)
+        redis_server = GuardedRedis.from_url(url)
         redis_server.ping()
     except redis.exceptions.ConnectionError:
         logging.fatal("Redis server is not running! Exiting!")
@@ -65,23 +90,7 @@ def configure_logging(config, log_name='transcribersofreddit.log'):
     )
 
     # will intercept anything error level or above
-    if config.bugsnag_api_key:
-        bs_handler = BugsnagHandler()
-        bs_handler.setLevel(logging.ERROR)
-        logging.getLogger('').addHandler(bs_handler)
-        logging.info('Bugsnag enabled!')
-    else:
-        logging.info('Not running with Bugsnag!')
-
-    if config.sentry_api_url:
-        sentry_handler = SentryHandler(Client(config.sentry_api_url))
-        sentry_handler.setLevel(logging.ERROR)
-        # I don't know what this line does but it seems required by raven
-        setup_logging(sentry_handler)
-        logging.getLogger('').addHandler(sentry_handler)
-        logging.info('Sentry enabled!')
-    else:
-        logging.info('Not running with Sentry!')
+    configure_error_reporting(config)
 
     log_header('Starting!')
 
@@ -110,6 +119,11 @@ def populate_formatting(config):
     config.other_formatting = get_wiki_page('format/other', config)
 
 
+def _log_parse_errors(pagename, errors):
+    for error in errors:
+        logging.warning(f'Skipped bad entry on wiki page {pagename}: {error}')
+
+
 def populate_domain_lists(config):
     """
     Loads the approved content domains into the config object from the
@@ -117,27 +131,14 @@ def populate_domain_lists(config):
 
     :return: None.
     """
+    errors = []
+    domains = parse_domains(get_wiki_page('domains', config), errors)
+    _log_parse_errors('domains', errors)
 
-    config.video_domains = []
-    config.image_domains = []
-    config.audio_domains = []
-
-    domains = get_wiki_page('domains', config)
-    domains = ''.join(domains.splitlines()).split('---')
-
-    for domainset in domains:
-        domain_list = domainset[domainset.index('['):].strip('[]').split(', ')
-        current_domain_list = []
-        if domainset.startswith('video'):
-            current_domain_list = config.video_domains
-        elif domainset.startswith('audio'):
-            current_domain_list = config.audio_domains
-        elif domainset.startswith('images'):
-            current_domain_list = config.image_domains
-
-        current_domain_list += domain_list
-        # [current_domain_list.append(x) for x in domain_list]
-        logging.debug(f'Domain list populated: {current_domain_list}')
+    config.video_domains = domains.get('video', [])
+    config.image_domains = domains.get('images', [])
+    config.audio_domains = domains.get('audio', [])
+    logging.debug(f'Domain lists populated: {domains}')
 
 
 def populate_moderators(config):
@@ -158,78 +159,158 @@ def populate_subreddit_lists(config):
 
     :return: None.
     """
+    errors = []
 
-    config.subreddits_to_check = []
-    config.upvote_filter_subs = {}
-    config.no_link_header_subs = []
-
-    config.subreddits_to_check = get_wiki_page('subreddits',
-                                               config).splitlines()
-    config.subreddits_to_check = clean_list(config.subreddits_to_check)
+    config.subreddits_to_check = parse_list(
+        get_wiki_page('subreddits', config)
+    )
     logging.debug(
         f'Created list of subreddits from wiki: {config.subreddits_to_check}'
     )
 
-    for line in get_wiki_page(
-        'subreddits/upvote-filtered', config
-    ).splitlines():
-        if ',' in line:
-            sub, threshold = line.split(',')
-            config.upvote_filter_subs[sub] = int(threshold)
-
+    config.upvote_filter_subs = parse_thresholds(
+        get_wiki_page('subreddits/upvote-filtered', config), errors
+    )
+    _log_parse_errors('subreddits/upvote-filtered', errors)
     logging.debug(
         f'Retrieved subreddits subject to the upvote filter: '
         f'{config.upvote_filter_subs} '
     )
 
-    config.subreddits_domain_filter_bypass = get_wiki_page(
-        'subreddits/domain-filter-bypass', config
-    ).split('\r\n')
-    config.subreddits_domain_filter_bypass = clean_list(
-        config.subreddits_domain_filter_bypass
+    config.subreddits_domain_filter_bypass = parse_list(
+        get_wiki_page('subreddits/domain-filter-bypass', config)
     )
     logging.debug(
         f'Retrieved subreddits that bypass the domain filter: '
         f'{config.subreddits_domain_filter_bypass} '
     )
 
-    config.no_link_header_subs = get_wiki_page(
-        'subreddits/no-link-header', config
-    ).split('\r\n')
-    config.no_link_header_subs = clean_list(config.no_link_header_subs)
+    config.no_link_header_subs = parse_list(
+        get_wiki_page('subreddits/no-link-header', config)
+    )
     logging.debug(
         f'Retrieved subreddits subject to the upvote filter: '
         f'{config.no_link_header_subs} '
     )
 
-    lines = get_wiki_page('subreddits/archive-time', config).splitlines()
-    config.archive_time_default = int(lines[0])
-    config.archive_time_subreddits = {}
-    for line in lines[1:]:
-        if ',' in line:
-            sub, time = line.split(',')
-            config.archive_time_subreddits[sub.lower()] = int(time)
+    errors = []
+    archive_times = parse_archive_times(
+        get_wiki_page('subreddits/archive-time', config), errors
+    )
+    _log_parse_errors('subreddits/archive-time', errors)
+    if archive_times.default is None:
+        logging.error(
+            f'No default archive time on the wiki, keeping '
+            f'{config.archive_time_default}'
+        )
+    else:
+        config.archive_time_default = archive_times.default
+    config.archive_time_subreddits = archive_times.subreddits
 
 
 def populate_gifs(config):
-    # zero it out so we can load more
-    config.no_gifs = []
-    config.no_gifs = get_wiki_page('usefulgifs/no', config).split('\r\n')
-
-
-def initialize(config):
-    populate_domain_lists(config)
-    logging.debug('Domains loaded.')
-    populate_subreddit_lists(config)
-    logging.debug('Subreddits loaded.')
-    populate_formatting(config)
-    logging.debug('Formatting loaded.')
-    populate_header(config)
-    logging.debug('Header loaded.')
-    populate_moderators(config)
-    logging.debug('Mod list loaded.')
-    populate_gifs(config)
-    logging.debug('Gifs loaded.')
+    """
+    Loads the useful GIFs pages into `config.gifs`; see tor_core.assets.
+
+    :return: None.
+    """
+    config.gifs = load_gif_pages(config)
+    # kept for bots that read the list directly
+    config.no_gifs = config.gifs.get('no', ())
+
+
+# Every piece of configuration pulled from Reddit, grouped into the sections
+# shared between bots through Redis (see tor_core.shared_config). Values are
+# the function that populates the section and the config attributes it sets.
+config_sections = OrderedDict([
+    ('domains', (populate_domain_lists, (
+        'video_domains', 'image_domains', 'audio_domains',
+    ))),
+    ('subreddits', (populate_subreddit_lists, (
+        'subreddits_to_check', 'upvote_filter_subs',
+        'subreddits_domain_filter_bypass', 'no_link_header_subs',
+        'archive_time_default', 'archive_time_subreddits',
+    ))),
+    ('formatting', (populate_formatting, (
+        'audio_formatting', 'video_formatting', 'image_formatting',
+        'other_formatting',
+    ))),
+    ('header', (populate_header, ('header',))),
+    ('moderators', (populate_moderators, ('tor_mods',))),
+    ('gifs', (populate_gifs, ('gifs', 'no_gifs'))),
+    ('flair', (populate_flair_templates, ('flair_templates',))),
+])
+
+
+def initialize(config, refresh=False):
+    """
+    Loads all of the configuration kept on Reddit into the config object.
+
+    When sharing config through Redis, a section another bot stored in the
+    last `config.shared_config_max_age` seconds is used as it is, so a bot
+    reloading its configuration periodically only sees wiki edits once that
+    copy has aged out. Pass `refresh` to pick them up straight away.
+
+    :param config: the global config object.
+    :param refresh: bool; when sharing config through Redis, skip the copy
+        in Redis and fetch everything from Reddit again, passing it on to the
+        other bots.
+    :return: None.
+    """
+    # nothing is visible to the rest of the bot until every section has
+    # loaded, and then all of it changes at once
+    staging = ConfigStaging(config)
+
+    for name, (populate, attributes) in config_sections.items():
+        if config.shared_config:
+            populate_shared_section(
+                name, populate, attributes, staging, refresh=refresh
+            )
+        else:
+            populate(staging)
+        logging.debug(f'Section {name} loaded.')
+
+    snapshot = config.replace(**staging.changes)
+    logging.info(f'Config version {snapshot.version} loaded.')
+
+
+def load_configuration(config, handoff=False):
+    """
+    Loads the configuration kept on Reddit, reporting the startup phase in
+    the heartbeat as it goes. With `handoff`, a bot that finds recent warm
+    state from the process it replaces (see `tor_core.startup`) starts from
+    that straight away and reloads the configuration once the main loop has
+    been through its first iteration (see `tor_core.helpers.run_loop()`).
+
+    :param config: the global config object.
+    :param handoff: bool; look for warm state handed over by the previous
+        process, and leave some for the next one on shutdown.
+    :return: None.
+    """
+    if handoff:
+        shutdown.register(partial(write_handoff, config),
+                          name=f'write handoff for {config.name}')
+
+        if load_handoff(config):
+            set_phase(config, WARM)
+            # on the main loop's thread, which is the only one using
+            # config.r
+            config.pending_refresh = partial(_refresh_warm_config, config)
+            return
+
+    set_phase(config, LOADING_CONFIG)
+    initialize(config)
+    set_phase(config, READY)
+
+
+def _refresh_warm_config(config):
+    try:
+        initialize(config)
+    except Exception as e:
+        # the handed over configuration is still good to run on
+        logging.error(f'Failed to reload the configuration: {e}')
+        return
+    set_phase(config, READY)
 
 
 def get_heartbeat_port(config):
@@ -269,6 +350,7 @@ def configure_modchat(config):
     config.modchat = SlackClient(
         os.environ.get('SLACK_API_KEY', None)
     )
+    use_session_for_modchat(config)
 
 
 def build_bot(
@@ -277,7 +359,10 @@ def build_bot(
     full_name=None,
     log_name='transcribersofreddit.log',
     require_redis=True,
-    heartbeat_logging=False
+    heartbeat_logging=False,
+    shared_config=False,
+    state_file=None,
+    handoff=False
 ):
     """
     Shortcut for setting up a bot instance. Runs all configuration and returns
@@ -293,27 +378,58 @@ def build_bot(
     :param require_redis: bool; triggers the creation of the Redis instance.
         Any bot that does not require use of Redis can set this to False and
         not have it crash on start because Redis isn't running.
+    :param shared_config: bool; load the wiki-derived configuration from
+        Redis when another bot has already fetched it, and pick up changes
+        made by other bots as they happen. Requires Redis.
+    :param state_file: string; a local database to keep the bot's state in
+        across restarts (see `tor_core.state_store`). Off by default.
+    :param handoff: bool; start from the warm state left by the process this
+        one replaces, and leave it for the next one when shutting down (see
+        `tor_core.startup`). Uses Redis unless `config.handoff_file` is set.
     :return: None
     """
 
-    config.r = Reddit(name)
+    configure_http(config)
+    configure_cassette(config)
+    # draws on Redis lazily, so this is a no-op without it
+    config.throttle = RedditThrottle(config)
+    config.r = Reddit(
+        name,
+        requestor_class=InstrumentedRequestor,
+        requestor_kwargs={
+            'session': config.http,
+            'throttle': config.throttle,
+        },
+    )
     # this is used to power messages, so please add a full name if you can
     config.name = full_name if full_name else name
     config.bot_version = version
     config.heartbeat_logging = heartbeat_logging
+    config.shared_config = shared_config and require_redis
     configure_logging(config, log_name=log_name)
     configure_modchat(config)
 
-    if not require_redis:
-        # I'm sorry
-        type(config).redis = property(lambda x: (_ for _ in ()).throw(
-            NotImplementedError('Redis was disabled during building!')))
-
-    initialize(config)
+    # Redis is only set up when first used, and refuses if it's disabled
+    config.require_redis = require_redis
+    set_phase(config, STARTING)
 
     if require_redis:
-        # we want this to run after the config object is created
-        # and for this version, heartbeat requires db access
+        # the heartbeat comes up first so that the bot reports how far along
+        # it is instead of looking dead while it loads
         configure_heartbeat(config)
+        shutdown.register(partial(stop_heartbeat, config), order=LAST,
+                          name='stop_heartbeat')
+
+    if state_file:
+        open_state_store(config, state_file)
+
+    load_configuration(config, handoff=handoff)
+
+    if config.shared_config:
+        listen_for_config_updates(config, config_sections)
+
+    # don't lose flair changes that were queued but not sent yet
+    shutdown.register(partial(flush_flair_queue, config),
+                      name='flush_flair_queue')
 
     logging.info('Bot built and initialized!')
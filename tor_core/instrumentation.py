@@ -0,0 +1,151 @@
+import sys
+import threading
+import time
+
+import prawcore
+
+from tor_core.transport import LatencyCounter
+from tor_core.transport import endpoint_name
+
+# Frames from these packages are skipped when working out who made a request,
+# so that calls are attributed to the bot code that caused them rather than to
+# PRAW's internals.
+_library_prefixes = ('prawcore', 'praw', 'requests', 'urllib3', __name__)
+
+# Reddit reports what's left of the current rate limit window on every reply
+_ratelimit_headers = {
+    'remaining': 'x-ratelimit-remaining',
+    'used': 'x-ratelimit-used',
+    'reset': 'x-ratelimit-reset',
+}
+
+
+def calling_function(depth=2):
+    """
+    Works out which function outside of PRAW and its dependencies is making
+    the current request.
+
+    :param depth: int; the number of frames to skip before looking.
+    :return: String. `module.function`, or `unknown`.
+    """
+    frame = sys._getframe(depth)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if not module.startswith(_library_prefixes):
+            return f'{module}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+class ApiStats(object):
+    """
+    Counts, response sizes, response times and failures of every request made
+    to Reddit, broken down by endpoint and by the function that made it, plus
+    the rate limit headroom as of the latest response.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}
+            self.ratelimit = {}
+            self.started = time.time()
+
+    def record(self, endpoint, caller, seconds, failed=False, size=0,
+               headers=None):
+        """
+        Adds one request to the statistics.
+
+        :param endpoint: String. See `tor_core.transport.endpoint_name`.
+        :param caller: String. The function that made the request.
+        :param seconds: float; how long the request took.
+        :param failed: bool; whether it raised or got a 5xx back.
+        :param size: int; the size of the response body in bytes.
+        :param headers: the response headers, if there was a response.
+        :return: None.
+        """
+        with self._lock:
+            counter = self.calls.get((endpoint, caller))
+            if counter is None:
+                counter = self.calls[endpoint, caller] = LatencyCounter()
+            counter.add(seconds, failed, size)
+
+            if headers and _ratelimit_headers['remaining'] in headers:
+                self.ratelimit = {
+                    name: float(headers[header])
+                    for name, header in _ratelimit_headers.items()
+                    if header in headers
+                }
+                self.ratelimit['updated'] = time.time()
+
+    def _merge(self, key):
+        merged = {}
+        for pair, counter in self.calls.items():
+            totals = merged.setdefault(key(pair), LatencyCounter())
+            totals.count += counter.count
+            totals.errors += counter.errors
+            totals.bytes += counter.bytes
+            totals.total += counter.total
+            totals.max = max(totals.max, counter.max)
+            totals.recent.extend(counter.recent)
+        return {name: totals.as_dict() for name, totals in merged.items()}
+
+    def report(self):
+        """
+        :return: dict; the statistics by endpoint, by calling function and by
+            both, along with the rate limit headroom. Safe to serialise to
+            JSON.
+        """
+        with self._lock:
+            return {
+                'since': self.started,
+                'ratelimit': dict(self.ratelimit),
+                'by_endpoint': self._merge(lambda pair: pair[0]),
+                'by_caller': self._merge(lambda pair: pair[1]),
+                'calls': [
+                    dict(counter.as_dict(), endpoint=endpoint, caller=caller)
+                    for (endpoint, caller), counter in self.calls.items()
+                ],
+            }
+
+
+# shared by every Reddit instance in the process
+api_stats = ApiStats()
+
+
+class InstrumentedRequestor(prawcore.Requestor):
+    """
+    A prawcore Requestor that records every request it makes into
+    `api_stats`, and draws a token from a RedditThrottle before each if given
+    one as `throttle`. Pass it to PRAW as `requestor_class`.
+    """
+
+    stats = api_stats
+
+    def __init__(self, *args, throttle=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.throttle = throttle
+
+    def request(self, method, url, *args, **kwargs):
+        if self.throttle is not None:
+            self.throttle.acquire()
+
+        caller = calling_function()
+        started = time.monotonic()
+        response = None
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            return response
+        finally:
+            failed = response is None or response.status_code >= 500
+            self.stats.record(
+                endpoint_name(method, url),
+                caller,
+                time.monotonic() - started,
+                failed=failed,
+                size=0 if response is None else len(response.content),
+                headers=None if response is None else response.headers,
+            )
@@ -0,0 +1,212 @@
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from tor_core.shutdown import shutdown
+
+KEY_PREFIX = 'tor_lease:'
+
+# Grab the lease if nobody holds it, handing out the next fencing token.
+# KEYS: lease key, token counter key; ARGV: holder id, ttl in ms
+_ACQUIRE = """
+local ttl = tonumber(ARGV[2])
+-- scripts run atomically, so SETNX and PEXPIRE are as good as SET NX PX
+if redis.call('setnx', KEYS[1], ARGV[1]) == 1 then
+    redis.call('pexpire', KEYS[1], ttl)
+    local token = redis.call('incr', KEYS[2])
+    redis.call('set', KEYS[1] .. ':token', token)
+    redis.call('pexpire', KEYS[1] .. ':token', ttl)
+    return token
+end
+return false
+"""
+
+# Extend the lease, but only if we're still the one holding it.
+# KEYS: lease key; ARGV: holder id, ttl in ms
+_RENEW = """
+local ttl = tonumber(ARGV[2])
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('pexpire', KEYS[1] .. ':token', ttl)
+    return redis.call('pexpire', KEYS[1], ttl)
+end
+return 0
+"""
+
+# KEYS: lease key; ARGV: holder id
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('del', KEYS[1] .. ':token')
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class Lease(object):
+    """
+    A lease on a named job, held by at most one bot instance at a time.
+
+    The holder is handed a fencing token which increases every time the lease
+    changes hands. Anything acting on the result of a singleton job can
+    compare tokens and refuse to act on work from a previous holder that
+    didn't notice it lost the lease (e.g. after a long GC pause or network
+    partition).
+
+    While held, the lease is renewed from a background thread every third of
+    its time-to-live.
+    """
+
+    def __init__(self, name, config, ttl=30):
+        """
+        :param name: string; the name of the job this lease is for.
+        :param config: the global config object.
+        :param ttl: int; seconds the lease survives without being renewed.
+        """
+        self.name = name
+        self.config = config
+        self.ttl = ttl
+        self.key = KEY_PREFIX + name
+        self.holder = (
+            f'{config.name}:{socket.gethostname()}:{os.getpid()}:'
+            f'{uuid.uuid4().hex}'
+        )
+        self.token = None
+        self._expires = 0
+
+        self._acquire = config.redis.register_script(_ACQUIRE)
+        self._renew = config.redis.register_script(_RENEW)
+        self._release = config.redis.register_script(_RELEASE)
+        self._renewer = None
+        self._stop_renewing = threading.Event()
+
+    @property
+    def held(self):
+        # don't trust a lease past its expiry if renewals stopped getting
+        # through, even if nobody told us we lost it
+        return self.token is not None and time.monotonic() < self._expires
+
+    def acquire(self):
+        """
+        Tries to take the lease without waiting for it.
+
+        :return: bool; whether we hold the lease now.
+        """
+        if self.held:
+            return True
+
+        started = time.monotonic()
+        token = self._acquire(
+            keys=[self.key, self.key + ':fencing'],
+            args=[self.holder, int(self.ttl * 1000)]
+        )
+        if not token:
+            return False
+
+        self.token = int(token)
+        self._expires = started + self.ttl
+        logging.info(f'Acquired lease {self.name} with token {self.token}')
+        self._start_renewing()
+        return True
+
+    def renew(self):
+        """
+        Extends the lease by its time-to-live.
+
+        :return: bool; False if the lease was lost in the meantime.
+        """
+        if not self.held:
+            return False
+
+        started = time.monotonic()
+        if self._renew(keys=[self.key],
+                       args=[self.holder, int(self.ttl * 1000)]):
+            self._expires = started + self.ttl
+            return True
+
+        logging.warning(f'Lost lease {self.name} (token {self.token})')
+        self.token = None
+        return False
+
+    def release(self):
+        """
+        Gives up the lease so another instance can take over right away.
+
+        :return: None.
+        """
+        self._stop_renewing.set()
+        if self.token is not None:
+            self._release(keys=[self.key], args=[self.holder])
+            logging.info(f'Released lease {self.name}')
+        self.token = None
+
+    def is_current(self, token=None):
+        """
+        Checks a fencing token against the one currently handed out.
+
+        :param token: int; the token to check. Defaults to our own.
+        :return: bool; True if `token` belongs to the current holder.
+        """
+        token = self.token if token is None else token
+        current = self.config.redis.get(self.key + ':token')
+        return current is not None and int(current) == token
+
+    def _start_renewing(self):
+        if self._renewer is not None and self._renewer.is_alive():
+            return
+
+        self._stop_renewing.clear()
+        self._renewer = threading.Thread(
+            target=self._renew_until_lost,
+            name=f'lease-{self.name}',
+            daemon=True,
+        )
+        self._renewer.start()
+
+    def _renew_until_lost(self):
+        while not self._stop_renewing.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    return
+            except Exception as e:
+                # keep trying until the lease runs out; the next renewal
+                # will tell us if it already has
+                logging.error(f'Failed to renew lease {self.name}: {e}')
+
+
+def singleton_job(name, ttl=30, standby_sleep=5):
+    """
+    Decorator for a job function (called with the config object, like the
+    ones given to `run_until_dead()`) that must only run on one bot instance
+    at a time. Instances that don't hold the lease skip the job and sleep for
+    `standby_sleep` seconds so they don't spin while waiting to take over.
+
+    The lease is available as `func.lease` and is released on shutdown, so a
+    standby instance can take over without waiting for it to expire.
+
+    :param name: string; the name of the lease, shared by all instances.
+    :param ttl: int; seconds until an unrenewed lease expires.
+    :param standby_sleep: int; seconds to wait when not holding the lease.
+    :return: the decorator.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(config, *args, **kwargs):
+            if wrapper.lease is None:
+                wrapper.lease = Lease(name, config, ttl=ttl)
+                shutdown.register(wrapper.lease.release,
+                                  name=f'release lease {name}')
+
+            if not wrapper.lease.acquire():
+                shutdown.wait(standby_sleep)
+                return None
+
+            return func(config, *args, **kwargs)
+
+        wrapper.lease = None
+        return wrapper
+
+    return decorator
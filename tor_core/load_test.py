@@ -0,0 +1,537 @@
+import json
+import logging
+import random
+import resource
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections import deque
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+from praw import Reddit
+
+from tor_core.config import Config
+from tor_core.dedup import RotatingBloomFilter
+from tor_core.dedup import unseen
+from tor_core.helpers import run_loop
+from tor_core.initialize import initialize
+from tor_core.instrumentation import InstrumentedRequestor
+from tor_core.post_builder import PostBodyBuilder
+from tor_core.shutdown import shutdown
+from tor_core.transport import LatencyCounter
+from tor_core.transport import TunedSession
+
+# The partner subreddits the generated posts are spread over.
+SUBREDDITS = ('pics', 'funny', 'gaming', 'me_irl', 'tumblr')
+
+# Reddit's quota for an OAuth client: requests per window, in seconds.
+RATELIMIT_REQUESTS = 600
+RATELIMIT_WINDOW = 600
+
+# The newest posts a listing can reach back to, like on Reddit.
+LISTING_DEPTH = 1000
+
+_domains = ('i.imgur.com', 'i.redd.it', 'youtube.com', 'clyp.it', 'example.com')
+
+WIKI_PAGES = {
+    'format/header': (
+        'This post is in need of a [transcription](https://www.reddit.com/r/'
+        'TranscribersOfReddit/wiki/index)!'
+    ),
+    'format/images': '*Image Transcription*',
+    'format/video': '*Video Transcription*',
+    'format/audio': '*Audio Transcription*',
+    'format/other': '*Transcription*',
+    'domains': (
+        'video: [youtube.com]\n---\n'
+        'images: [imgur.com, i.redd.it]\n---\n'
+        'audio: [clyp.it]'
+    ),
+    'subreddits': '\n'.join(SUBREDDITS),
+    'subreddits/upvote-filtered': '',
+    'subreddits/domain-filter-bypass': '',
+    'subreddits/no-link-header': 'me_irl',
+    'subreddits/archive-time': '18',
+    'usefulgifs/no': '- https://i.imgur.com/no.gif',
+}
+
+
+def _base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    encoded = ''
+    while True:
+        number, digit = divmod(number, 36)
+        encoded = digits[digit] + encoded
+        if not number:
+            return encoded
+
+
+def _thing(kind, data):
+    return {'kind': kind, 'data': data}
+
+
+def _listing(children):
+    return _thing('Listing', {
+        'children': children, 'after': None, 'before': None,
+    })
+
+
+class TrafficGenerator(object):
+    """
+    Makes up new posts on the partner subreddits and replies in the bot's
+    inbox at a steady rate, and times how long each takes to be handled.
+
+    An item counts as handled the first time a bot sends a write request
+    naming it, such as a reply to a post or marking a comment read. Once
+    `stop()` is called, nothing new is made up and nothing more counts as
+    handled.
+    """
+
+    def __init__(
+        self,
+        posts_per_minute=60,
+        comments_per_minute=30,
+        subreddits=SUBREDDITS,
+        seed=0,
+        clock=time.time,
+    ):
+        """
+        :param posts_per_minute: int; new posts on the partner subreddits.
+        :param comments_per_minute: int; new replies in the bot's inbox.
+        :param subreddits: tuple of the partner subreddits' names.
+        :param seed: int; seeds the choice of subreddits and domains.
+        :param clock: function returning the current epoch time; items are
+            made up as it moves on.
+        """
+        self.clock = clock
+        self.posts_per_minute = posts_per_minute
+        self.comments_per_minute = comments_per_minute
+        self.subreddits = subreddits
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.started = clock()
+        self.stopped = None
+        self.posts = deque(maxlen=LISTING_DEPTH)
+        self.unread = OrderedDict()
+        self.generated_posts = 0
+        self.generated_comments = 0
+        self.handled = 0
+        self.latency = LatencyCounter(window=100000)
+        # creation time of everything not handled yet, by fullname
+        self._pending = {}
+
+    def _generate(self, now):
+        if self.stopped is not None:
+            now = min(now, self.stopped)
+        elapsed = now - self.started
+
+        due = int(elapsed * self.posts_per_minute / 60)
+        while self.generated_posts < due:
+            created = self.started + (
+                self.generated_posts * 60 / self.posts_per_minute
+            )
+            self.posts.append(self._post(self.generated_posts, created))
+            self.generated_posts += 1
+
+        due = int(elapsed * self.comments_per_minute / 60)
+        while self.generated_comments < due:
+            created = self.started + (
+                self.generated_comments * 60 / self.comments_per_minute
+            )
+            comment = self._comment(self.generated_comments, created)
+            self.unread[comment['data']['name']] = comment
+            self.generated_comments += 1
+
+    def _post(self, number, created):
+        post_id = _base36(number)
+        subreddit = self._random.choice(self.subreddits)
+        domain = self._random.choice(_domains)
+        self._pending['t3_' + post_id] = created
+        return _thing('t3', {
+            'id': post_id,
+            'name': 't3_' + post_id,
+            'title': f'Generated post {number}',
+            'subreddit': subreddit,
+            'subreddit_name_prefixed': f'r/{subreddit}',
+            'author': f'poster{number % 100}',
+            'url': f'https://{domain}/{post_id}',
+            'domain': domain,
+            'permalink': f'/r/{subreddit}/comments/{post_id}/generated/',
+            'created_utc': created,
+            'score': 1,
+            'num_comments': 0,
+            'is_self': False,
+            'selftext': '',
+            'link_flair_text': None,
+        })
+
+    def _comment(self, number, created):
+        comment_id = _base36(number)
+        self._pending['t1_' + comment_id] = created
+        return _thing('t1', {
+            'id': comment_id,
+            'name': 't1_' + comment_id,
+            'body': 'done',
+            'author': f'volunteer{number % 100}',
+            'subreddit': 'TranscribersOfReddit',
+            'parent_id': 't1_parent',
+            'link_id': 't3_parent',
+            'context': '/r/TranscribersOfReddit/comments/parent/',
+            'created_utc': created,
+            'was_comment': True,
+            'new': True,
+        })
+
+    def new_posts(self, limit):
+        with self._lock:
+            self._generate(self.clock())
+            return _listing(list(self.posts)[:-limit - 1:-1])
+
+    def unread_comments(self, limit):
+        with self._lock:
+            self._generate(self.clock())
+            return _listing(list(self.unread.values())[:-limit - 1:-1])
+
+    def handle(self, fullnames):
+        """
+        Marks items as handled by the bot.
+
+        :param fullnames: iterable of strings.
+        :return: None.
+        """
+        now = self.clock()
+        with self._lock:
+            if self.stopped is not None and now > self.stopped:
+                return
+            for fullname in fullnames:
+                self.unread.pop(fullname, None)
+                created = self._pending.pop(fullname, None)
+                if created is not None:
+                    self.handled += 1
+                    self.latency.add(now - created)
+
+    def stop(self):
+        """
+        Ends the traffic: whatever the bot handles from now on isn't counted.
+
+        :return: float; the time it stopped at.
+        """
+        with self._lock:
+            self.stopped = self.clock()
+        return self.stopped
+
+    @property
+    def backlog(self):
+        return len(self._pending)
+
+
+class _RateLimitWindow(object):
+    # Reddit counts requests per fixed window and reports what's left in the
+    # x-ratelimit-* headers, which prawcore paces itself by
+
+    def __init__(self, requests, window):
+        self.requests = requests
+        self.window = window
+        self._lock = threading.Lock()
+        self._current = None
+        self.used = 0
+
+    def headers(self):
+        now = time.time()
+        current = int(now // self.window)
+        with self._lock:
+            if current != self._current:
+                self._current = current
+                self.used = 0
+            self.used += 1
+            used = self.used
+        return {
+            'x-ratelimit-used': str(used),
+            'x-ratelimit-remaining': str(float(max(self.requests - used, 0))),
+            'x-ratelimit-reset': str(int((current + 1) * self.window - now)),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, body, status=200):
+        reddit = self.server.reddit
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in reddit.ratelimit.headers().items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+        with reddit.lock:
+            reddit.requests += 1
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = url.path.strip('/').split('/')
+        query = parse_qs(url.query)
+        limit = int(query.get('limit', ['25'])[0])
+        traffic = self.server.reddit.traffic
+
+        if path[0] == 'r' and path[2:] == ['new']:
+            return self._respond(traffic.new_posts(limit))
+        if path[:2] == ['message', 'unread']:
+            return self._respond(traffic.unread_comments(limit))
+        if path[0] == 'r' and path[2:4] == ['about', 'moderators']:
+            return self._respond(_thing('UserList', {'children': [{
+                'name': 'load_test_mod', 'id': 't2_1', 'date': 0,
+                'mod_permissions': ['all'],
+            }]}))
+        if path[0] == 'r' and path[2:4] == ['api', 'link_flair']:
+            return self._respond([])
+        if path[0] == 'r' and path[2:3] == ['wiki']:
+            page = '/'.join(path[3:])
+            if page in self.server.reddit.wiki_pages:
+                return self._respond(_thing('wikipage', {
+                    'content_md': self.server.reddit.wiki_pages[page],
+                    'may_revise': False,
+                    'revision_by': None,
+                    'revision_date': 0,
+                }))
+
+        self._respond({'message': 'Not Found', 'error': 404}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        form = parse_qs(self.rfile.read(length).decode())
+        path = urlsplit(self.path).path.strip('/')
+
+        if path == 'api/v1/access_token':
+            return self._respond({
+                'access_token': 'load_test',
+                'token_type': 'bearer',
+                'expires_in': 3600,
+                'scope': '*',
+            })
+
+        # anything the bot writes to counts as handled
+        fullnames = [
+            fullname
+            for field in ('thing_id', 'id', 'link', 'parent')
+            for value in form.get(field, ())
+            for fullname in value.split(',')
+        ]
+        self.server.reddit.traffic.handle(fullnames)
+
+        if path == 'api/comment':
+            parent = form.get('thing_id', ['t3_unknown'])[0]
+            return self._respond({'json': {'errors': [], 'data': {'things': [
+                _thing('t1', {
+                    'id': 'reply', 'name': 't1_reply',
+                    'body': form.get('text', [''])[0],
+                    'author': 'load_test', 'parent_id': parent,
+                    'link_id': parent, 'subreddit': 'TranscribersOfReddit',
+                }),
+            ]}}})
+        self._respond({'json': {'errors': []}})
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeReddit(object):
+    """
+    An in-process HTTP server standing in for both www.reddit.com and
+    oauth.reddit.com: it hands out tokens, serves wiki pages, the partner
+    subreddits' new posts and the bot's inbox from a TrafficGenerator, and
+    accepts any write. Every response carries the x-ratelimit-* headers.
+    """
+
+    def __init__(
+        self,
+        traffic,
+        wiki_pages=WIKI_PAGES,
+        ratelimit_requests=RATELIMIT_REQUESTS,
+        ratelimit_window=RATELIMIT_WINDOW,
+    ):
+        self.traffic = traffic
+        self.wiki_pages = wiki_pages
+        self.ratelimit = _RateLimitWindow(ratelimit_requests, ratelimit_window)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.reddit = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='fake-reddit', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def make_config(url):
+    """
+    Builds a config object for a bot talking to a FakeReddit, with fakeredis
+    in place of Redis, the way `build_bot()` would for the real thing.
+
+    :param url: String. The URL of the FakeReddit.
+    :return: Config.
+    """
+    # only needed for load tests, so not something to install tor_core with
+    import fakeredis
+
+    config = Config()
+    config.name = 'load_test'
+    config.bot_version = 'load_test'
+
+    config.redis = fakeredis.FakeStrictRedis()
+    config.redis.flushall()
+
+    config.http = TunedSession()
+    config.r = Reddit(
+        client_id='load_test',
+        client_secret='load_test',
+        username='load_test',
+        password='load_test',
+        user_agent='tor_core load test',
+        oauth_url=url,
+        reddit_url=url,
+        check_for_updates=False,
+        requestor_class=InstrumentedRequestor,
+        requestor_kwargs={'session': config.http},
+    )
+    return config
+
+
+class SampleBot(object):
+    """
+    A bot doing what u/transcribersofreddit does with every new post and
+    every reply in a single loop: posting a reply built from the wiki
+    formatting on each new partner post, and reading its inbox.
+    """
+
+    def __init__(self):
+        self.seen = RotatingBloomFilter(capacity=100000)
+        self.builder = None
+
+    def __call__(self, config):
+        if self.builder is None:
+            self.builder = PostBodyBuilder(config)
+
+        subreddit = config.r.subreddit('+'.join(config.subreddits_to_check))
+        for post in unseen(subreddit.new(limit=100), self.seen):
+            post.reply(self.builder.render(str(post.subreddit), post.url))
+
+        replies = list(config.r.inbox.unread(limit=100))
+        if replies:
+            config.r.inbox.mark_read(replies)
+
+
+def peak_rss():
+    """
+    :return: int; the most memory the process has used so far, in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_load_test(
+    bot=None,
+    posts_per_minute=60,
+    comments_per_minute=30,
+    seconds=60,
+    ratelimit_requests=RATELIMIT_REQUESTS,
+    ratelimit_window=RATELIMIT_WINDOW,
+):
+    """
+    Runs a bot's main loop with `run_loop()`, as `run_until_dead()` would,
+    against a FakeReddit generating the given traffic, and reports how well
+    it kept up.
+
+    This requests a shutdown of the process at the end, so run it in a
+    process of its own, e.g. with `python -m benchmarks.load_test`.
+
+    :param bot: the function run over and over, given the config object.
+        Defaults to a SampleBot.
+    :param posts_per_minute: int; new posts on the partner subreddits.
+    :param comments_per_minute: int; new replies in the bot's inbox.
+    :param seconds: float; how long to run for.
+    :param ratelimit_requests: int; the fake quota, in requests per
+        `ratelimit_window` seconds.
+    :param ratelimit_window: int.
+    :return: dict; the results.
+    """
+    traffic = TrafficGenerator(posts_per_minute, comments_per_minute)
+    reddit = FakeReddit(
+        traffic,
+        ratelimit_requests=ratelimit_requests,
+        ratelimit_window=ratelimit_window,
+    )
+    reddit.start()
+
+    config = make_config(reddit.url)
+    initialize(config)
+    logging.info(f'Load test against {reddit.url} for {seconds}s')
+
+    errors = []
+
+    def run_bot():
+        try:
+            run_loop(bot or SampleBot(), config)
+        except Exception as e:
+            errors.append(e)
+            logging.exception('The bot crashed')
+
+    thread = threading.Thread(target=run_bot, name='load-test-bot')
+    started = time.time()
+    traffic.started = started
+    thread.start()
+
+    thread.join(seconds)
+    # the bot may take a while to finish the iteration it's in, which would
+    # count towards neither the time taken nor the latency
+    elapsed = traffic.stop() - started
+    shutdown.request('load test finished')
+    thread.join()
+    reddit.stop()
+
+    generated = traffic.generated_posts + traffic.generated_comments
+    latency = traffic.latency.as_dict()
+    return {
+        'seconds': round(elapsed, 1),
+        'generated': generated,
+        'handled': traffic.handled,
+        'backlog': traffic.backlog,
+        'handled_per_minute': round(traffic.handled / elapsed * 60, 1),
+        'latency': {
+            key: round(latency[key], 3)
+            for key in ('mean', 'p50', 'p90', 'p99', 'max')
+        },
+        'api_calls': reddit.requests,
+        'api_calls_per_item': (
+            round(reddit.requests / traffic.handled, 2)
+            if traffic.handled else None
+        ),
+        'peak_rss_mb': round(peak_rss() / 1024 / 1024, 1),
+        'crashed': bool(errors),
+    }
@@ -0,0 +1,137 @@
+import re
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from tor_core.helpers import _
+
+# The content types of `Config.media`, and the snapshot fields holding their
+# formatting and whitelisted domains.
+_media_fields = (
+    ('video', 'video_formatting', 'video_domains'),
+    ('audio', 'audio_formatting', 'audio_domains'),
+    ('image', 'image_formatting', 'image_domains'),
+    ('other', 'other_formatting', None),
+)
+
+_markdown_link = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+
+# Everything worked out from one version of the config snapshot, keyed by
+# (snapshot version, perform_header_check). `bodies` maps (links allowed in
+# the header, content type) to the finished body.
+_Prepared = namedtuple('_Prepared', [
+    'key', 'domains', 'no_link_subs', 'bodies',
+])
+
+
+def strip_links(text):
+    """
+    Replaces markdown links with their text, for subreddits that don't allow
+    links in the header.
+
+    :param text: String.
+    :return: String.
+    """
+    return _markdown_link.sub(r'\1', text)
+
+
+class PostBodyBuilder(object):
+    """
+    Builds the body of the bot's post for a submission on a partner
+    subreddit: the header (with its links taken out on the subreddits in
+    `no_link_header_subs`, and left out entirely when header checks are off),
+    the formatting for the submission's content type, and the footer.
+
+    Those only depend on the configuration, so every possible body is built
+    once per config version and rendering a post is a couple of dictionary
+    lookups. Posts with the same subreddit variant and content type share
+    the same string.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._prepared = None
+
+    def _prepare(self):
+        snapshot = self.config.snapshot
+        header_check = self.config.perform_header_check
+        key = (snapshot.version, header_check)
+        prepared = self._prepared
+        if prepared is not None and prepared.key == key:
+            return prepared
+
+        domains = {}
+        for content_type, formatting_field, domain_field in _media_fields:
+            if domain_field:
+                for domain in getattr(snapshot, domain_field):
+                    domains.setdefault(domain.lower(), content_type)
+
+        header = snapshot.header if header_check else ''
+        header = header or ''
+        headers = {True: header, False: strip_links(header)}
+
+        bodies = {}
+        for links, variant in headers.items():
+            for content_type, formatting_field, domain_field in _media_fields:
+                formatting = getattr(snapshot, formatting_field) or ''
+                message = '\n\n'.join(p for p in (variant, formatting) if p)
+                bodies[links, content_type] = _(message)
+
+        prepared = _Prepared(
+            key=key,
+            domains=domains,
+            no_link_subs=frozenset(
+                sub.lower() for sub in snapshot.no_link_header_subs
+            ),
+            bodies=bodies,
+        )
+        # one reference assignment, like the snapshot itself
+        self._prepared = prepared
+        return prepared
+
+    @staticmethod
+    def _content_type(prepared, url):
+        host = (urlsplit(url).hostname or '').lower()
+        # try the host and then every domain above it, so that
+        # m.youtube.com matches youtube.com
+        while host:
+            content_type = prepared.domains.get(host)
+            if content_type:
+                return content_type
+            host = host.partition('.')[2]
+        return 'other'
+
+    def content_type(self, url):
+        """
+        :param url: String. The URL the submission links to.
+        :return: String. One of the keys of `Config.media`; `other` if the
+            domain isn't whitelisted.
+        """
+        return self._content_type(self._prepare(), url)
+
+    def render(self, subreddit, url):
+        """
+        :param subreddit: String. The name of the partner subreddit.
+        :param url: String. The URL the submission links to.
+        :return: String. The body of the post.
+        """
+        return self.render_batch(((subreddit, url),))[0]
+
+    def render_batch(self, posts):
+        """
+        Renders the bodies of many posts against the same config version.
+
+        :param posts: iterable of (subreddit name, url) tuples.
+        :return: list of strings, in the same order.
+        """
+        prepared = self._prepare()
+        bodies = prepared.bodies
+        no_link_subs = prepared.no_link_subs
+        content_type = self._content_type
+
+        return [
+            bodies[
+                subreddit.lower() not in no_link_subs,
+                content_type(prepared, url)
+            ]
+            for subreddit, url in posts
+        ]
@@ -0,0 +1,246 @@
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class LoopProfiler(object):
+    """
+    Profiles the iterations of a bot's main loop, writing what it finds to
+    `dump_dir`:
+
+        - every iteration slower than `slow_threshold` seconds (at most one
+          every `slow_dump_interval` seconds, so a struggling bot doesn't
+          fill the disk)
+        - everything since the last snapshot, every `snapshot_interval`
+          seconds
+        - everything since the last snapshot whenever `dump()` is called,
+          e.g. from SIGUSR1 or the heartbeat server's `/profile` endpoint
+
+    In `sample` mode, a background thread records the main loop's stack
+    every `sample_interval` seconds, and profiles are written as collapsed
+    stacks (`.folded`) that flamegraph.pl or speedscope can read. In
+    `cprofile` mode, every iteration runs under cProfile and profiles are
+    written as pstats files; this is exact but slows the bot down noticeably.
+    """
+
+    def __init__(
+        self,
+        dump_dir='profiles',
+        slow_threshold=None,
+        snapshot_interval=None,
+        mode='sample',
+        sample_interval=0.01,
+        slow_dump_interval=60,
+        name='bot',
+    ):
+        if mode not in ('sample', 'cprofile'):
+            raise ValueError(f'Unknown profiling mode {mode}')
+
+        self.dump_dir = dump_dir
+        self.slow_threshold = slow_threshold
+        self.snapshot_interval = snapshot_interval
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.slow_dump_interval = slow_dump_interval
+        self.name = name
+
+        # reentrant, since dump() may be called from a signal handler while
+        # the main thread holds it
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._target = None
+        self._sampler = None
+
+        # what has been collected in this iteration and since the last dump
+        self._iteration_samples = Counter()
+        self._samples = Counter()
+        self._stats = None
+
+        self._last_snapshot = time.monotonic()
+        self._last_slow_dump = 0
+
+    def start(self):
+        """
+        Starts profiling the calling thread.
+
+        :return: None.
+        """
+        os.makedirs(self.dump_dir, exist_ok=True)
+        self._target = threading.get_ident()
+
+        if self.mode == 'sample':
+            self._stop.clear()
+            self._sampler = threading.Thread(
+                target=self._sample, name='loop-profiler', daemon=True
+            )
+            self._sampler.start()
+
+        logging.info(f'Profiling main loop ({self.mode}) to {self.dump_dir}')
+
+    def stop(self):
+        """
+        Stops the sampler thread, if there is one.
+
+        :return: None.
+        """
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f'{code.co_name} '
+                    f'({os.path.basename(code.co_filename)}:'
+                    f'{code.co_firstlineno})'
+                )
+                frame = frame.f_back
+            stack = ';'.join(reversed(stack))
+
+            with self._lock:
+                self._iteration_samples[stack] += 1
+                self._samples[stack] += 1
+
+    @contextmanager
+    def iteration(self):
+        """
+        Context manager wrapped around each iteration of the main loop.
+        """
+        profile = None
+        if self.mode == 'cprofile':
+            profile = cProfile.Profile()
+        else:
+            with self._lock:
+                self._iteration_samples.clear()
+
+        started = time.monotonic()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            self._finish_iteration(time.monotonic() - started, profile)
+
+    def _finish_iteration(self, elapsed, profile):
+        if profile:
+            # dump() may be swapping the stats out from another thread
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+        now = time.monotonic()
+        slow = self.slow_threshold and elapsed > self.slow_threshold
+        if slow and now - self._last_slow_dump > self.slow_dump_interval:
+            self._last_slow_dump = now
+            path = self._write(
+                f'slow-{elapsed:.1f}s', self._iteration_samples, profile
+            )
+            logging.warning(
+                f'Main loop iteration took {elapsed:.1f}s; profile saved '
+                f'to {path}'
+            )
+
+        interval = self.snapshot_interval
+        if interval and now - self._last_snapshot > interval:
+            self.dump('snapshot')
+
+    def dump(self, reason='manual'):
+        """
+        Writes out everything collected since the last snapshot and starts
+        collecting afresh.
+
+        :param reason: String. Goes into the file name.
+        :return: String. The path of the written profile, or None if there
+            was nothing to write.
+        """
+        self._last_snapshot = time.monotonic()
+
+        with self._lock:
+            samples, self._samples = self._samples, Counter()
+            stats, self._stats = self._stats, None
+
+        if not samples and stats is None:
+            return None
+        return self._write(reason, samples, stats)
+
+    def _write(self, reason, samples, stats):
+        timestamp = time.strftime('%Y%m%dT%H%M%S')
+        base = os.path.join(self.dump_dir, f'{self.name}-{timestamp}-{reason}')
+
+        if self.mode == 'cprofile':
+            path = base + '.pstats'
+            if not isinstance(stats, pstats.Stats):
+                stats = pstats.Stats(stats)
+            stats.dump_stats(path)
+        else:
+            path = base + '.folded'
+            with self._lock:
+                lines = [f'{stack} {n}\n' for stack, n in samples.items()]
+            with open(path, 'w') as profile_file:
+                profile_file.writelines(lines)
+
+        return path
+
+
+def profiler_from_env(name='bot'):
+    """
+    Builds a LoopProfiler from environment variables, which turn on profiling
+    of `run_until_dead()` without touching the bot's code:
+
+        - `TOR_PROFILE_DIR`: the directory to write profiles to
+        - `TOR_PROFILE_SLOW_THRESHOLD`: the iteration time in seconds above
+          which an iteration's profile is saved
+        - `TOR_PROFILE_SNAPSHOT_INTERVAL`: seconds between regular snapshots
+        - `TOR_PROFILE_MODE`: `cprofile` to trade the low-overhead sampler
+          for exact call counts
+
+    :param name: String. The name of the bot, used in file names.
+    :return: LoopProfiler, or None if `TOR_PROFILE_DIR` isn't set.
+    """
+    dump_dir = os.getenv('TOR_PROFILE_DIR')
+    if not dump_dir:
+        return None
+
+    slow_threshold = os.getenv('TOR_PROFILE_SLOW_THRESHOLD')
+    snapshot_interval = os.getenv('TOR_PROFILE_SNAPSHOT_INTERVAL')
+    return LoopProfiler(
+        dump_dir=dump_dir,
+        slow_threshold=float(slow_threshold) if slow_threshold else None,
+        snapshot_interval=(
+            float(snapshot_interval) if snapshot_interval else None
+        ),
+        mode=os.getenv('TOR_PROFILE_MODE', 'sample'),
+        name=name,
+    )
+
+
+@contextmanager
+def profile_iteration(profiler):
+    """
+    Profiles one iteration of the main loop if there's a profiler.
+
+    :param profiler: LoopProfiler or None.
+    """
+    if profiler is None:
+        yield
+    else:
+        with profiler.iteration():
+            yield
@@ -0,0 +1,174 @@
+import json
+import logging
+import time
+import uuid
+
+from tor_core.config import thaw
+
+# Every section of the wiki-derived configuration lives in its own Redis hash
+# under this prefix. Each hash holds one JSON-encoded field per config
+# attribute plus the bookkeeping fields below.
+KEY_PREFIX = 'tor_config:'
+VERSION_KEY = KEY_PREFIX + 'version'
+LOCK_PREFIX = KEY_PREFIX + 'lock:'
+CHANNEL = KEY_PREFIX + 'updates'
+
+_VERSION_FIELD = '__version__'
+_UPDATED_FIELD = '__updated__'
+
+# how long a bot may spend refreshing a section from the wiki before somebody
+# else is allowed to try
+LOCK_TIMEOUT = 60
+
+# Delete the lock, but only if we're still the one holding it; it may have
+# timed out and been taken by another bot while we were at the wiki.
+# KEYS: lock key; ARGV: holder id
+_UNLOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _section_key(name):
+    return KEY_PREFIX + name
+
+
+def load_section(name, attributes, config, max_age=None):
+    """
+    Copies a section of the configuration from Redis onto the config object.
+
+    :param name: String. The name of the section.
+    :param attributes: Iterable of strings; the config attributes it holds.
+    :param config: the global config object.
+    :param max_age: int; seconds after which a stored section is considered
+        stale and ignored.
+    :return: bool; True if the section was found and applied.
+    """
+    stored = config.redis.hgetall(_section_key(name))
+    if not stored:
+        return False
+
+    stored = {k.decode(): v.decode() for k, v in stored.items()}
+    if max_age and time.time() - float(stored[_UPDATED_FIELD]) > max_age:
+        logging.debug(f'Shared config section {name} is stale')
+        return False
+
+    missing = [a for a in attributes if a not in stored]
+    if missing:
+        # written by a version of tor_core with different configuration
+        logging.debug(f'Shared config section {name} lacks {missing}')
+        return False
+
+    config.replace(**{a: json.loads(stored[a]) for a in attributes})
+
+    config.shared_config_versions[name] = int(stored[_VERSION_FIELD])
+    logging.debug(
+        f'Loaded shared config section {name} v{stored[_VERSION_FIELD]}'
+    )
+    return True
+
+
+def store_section(name, attributes, config):
+    """
+    Saves a section of the configuration to Redis and notifies every other bot
+    listening for changes.
+
+    :param name: String. The name of the section.
+    :param attributes: Iterable of strings; the config attributes it holds.
+    :param config: the global config object.
+    :return: int; the version stamp of the stored section.
+    """
+    version = config.redis.incr(VERSION_KEY)
+
+    mapping = {a: json.dumps(thaw(getattr(config, a))) for a in attributes}
+    mapping[_VERSION_FIELD] = version
+    mapping[_UPDATED_FIELD] = time.time()
+
+    key = _section_key(name)
+    pipe = config.redis.pipeline()
+    pipe.delete(key)
+    pipe.hmset(key, mapping)
+    pipe.publish(CHANNEL, f'{name}:{version}')
+    pipe.execute()
+
+    config.shared_config_versions[name] = version
+    logging.debug(f'Stored shared config section {name} v{version}')
+    return version
+
+
+def populate_shared_section(name, populate, attributes, config, refresh=False):
+    """
+    Loads a section of the configuration from Redis if another bot already
+    fetched it, or runs `populate` against the wiki and shares the result.
+
+    Only one bot at a time refreshes a section; the others wait for it to show
+    up in Redis instead of hitting the wiki themselves.
+
+    :param name: String. The name of the section.
+    :param populate: function; one of the `tor_core.initialize.populate_*`
+        functions, called with the config object.
+    :param attributes: Iterable of strings; the config attributes it sets.
+    :param config: the global config object.
+    :param refresh: bool; ignore what's in Redis and go to the wiki.
+    :return: None.
+    """
+    max_age = config.shared_config_max_age
+    if not refresh and load_section(name, attributes, config, max_age):
+        return
+
+    lock = LOCK_PREFIX + name
+    holder = f'{config.name}:{uuid.uuid4().hex}'
+    deadline = time.time() + LOCK_TIMEOUT
+
+    while not config.redis.set(lock, holder, nx=True, ex=LOCK_TIMEOUT):
+        if time.time() > deadline:
+            # whoever had the lock died on us; do it ourselves
+            break
+        time.sleep(0.5)
+        if not refresh and load_section(name, attributes, config, max_age):
+            return
+
+    try:
+        populate(config)
+        store_section(name, attributes, config)
+    finally:
+        config.redis.eval(_UNLOCK, 1, lock, holder)
+
+
+def listen_for_config_updates(config, sections):
+    """
+    Starts a background thread which applies sections refreshed by other bots
+    as soon as they are published.
+
+    :param config: the global config object.
+    :param sections: dict mapping the section name to a tuple of
+        (populate function, attributes), as in
+        `tor_core.initialize.config_sections`.
+    :return: the running PubSubWorkerThread.
+    """
+    def handle_update(message):
+        # anything escaping from here silently ends the listening thread
+        try:
+            name, version = message['data'].decode().rsplit(':', 1)
+            if name not in sections:
+                return
+            if int(version) <= config.shared_config_versions.get(name, 0):
+                # we're the ones who published it
+                return
+
+            _, attributes = sections[name]
+            if load_section(name, attributes, config):
+                logging.info(
+                    f'Picked up shared config section {name} v{version}'
+                )
+        except Exception as e:
+            logging.error(
+                f'Failed to apply shared config update {message["data"]}: '
+                f'{e}'
+            )
+
+    pubsub = config.redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(**{CHANNEL: handle_update})
+    return pubsub.run_in_thread(sleep_time=1, daemon=True)
@@ -0,0 +1,165 @@
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Cleanup hooks run in ascending `order`, and in the order they were
+# registered within the same `order`. The heartbeat goes last so that a bot
+# keeps showing up as alive until it's actually done.
+FIRST = 0
+DEFAULT_ORDER = 50
+LAST = 100
+
+
+class ShutdownCoordinator(object):
+    """
+    Coordinates a clean shutdown of the bot:
+
+        - `request()` (called from the SIGINT/SIGTERM handler) sets an event
+          which every `wait()` wakes up on, so no sleep holds up a shutdown
+        - work wrapped in `in_flight()` is given until a deadline to finish
+        - cleanup hooks added with `register()` run once, in order, whether
+          the bot stops cleanly, crashes or is interrupted twice
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._idle = threading.Condition()
+        self._in_flight = 0
+        self._hooks = []
+        self._finished = False
+        self._hurry = threading.Event()
+        self.reason = None
+
+    @property
+    def requested(self):
+        return self._event.is_set()
+
+    @property
+    def finishing(self):
+        """
+        Whether `finish()` has started draining and running the hooks.
+        """
+        return self._finished
+
+    def hurry(self):
+        """
+        Stops `drain()` from waiting any longer, so that the cleanup hooks run
+        straight away. Safe to call from a signal handler.
+
+        :return: None.
+        """
+        self._hurry.set()
+
+    def request(self, reason='requested'):
+        """
+        Asks everything to wind down. Safe to call from a signal handler.
+
+        :param reason: String. Logged, and kept as `self.reason`.
+        :return: None.
+        """
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def wait(self, seconds):
+        """
+        Sleeps for up to `seconds`, waking up early if a shutdown is
+        requested. Use this instead of `time.sleep()` anywhere a bot might
+        spend a while.
+
+        :param seconds: float.
+        :return: bool; True if a shutdown has been requested.
+        """
+        return self._event.wait(seconds)
+
+    @contextmanager
+    def in_flight(self):
+        """
+        Context manager marking a piece of work that `drain()` should wait
+        for.
+        """
+        with self._idle:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._in_flight -= 1
+                self._idle.notify_all()
+
+    def drain(self, timeout):
+        """
+        Waits for the work marked with `in_flight()` to finish.
+
+        :param timeout: float; seconds to wait at most.
+        :return: bool; True if nothing is left in flight.
+        """
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._hurry.is_set():
+                    logging.warning(
+                        f'Gave up waiting for {self._in_flight} pieces of '
+                        f'work to finish.'
+                    )
+                    return False
+                # in slices, since hurry() can't notify us from a signal
+                # handler without risking a deadlock on the condition
+                self._idle.wait(min(remaining, 0.1))
+        return True
+
+    def register(self, func, order=DEFAULT_ORDER, name=None):
+        """
+        Adds a function, called without arguments, to run on shutdown.
+
+        :param func: function; the cleanup hook.
+        :param order: int; hooks with a lower order run first. See `FIRST`,
+            `DEFAULT_ORDER` and `LAST`.
+        :param name: String. Used in log messages; defaults to the function's
+            name.
+        :return: func, so this can be used as a decorator.
+        """
+        name = name or getattr(func, '__name__', repr(func))
+        self._hooks.append((order, len(self._hooks), name, func))
+        return func
+
+    def run_hooks(self):
+        """
+        Runs every cleanup hook once, in order. A hook that raises is logged
+        and doesn't stop the others.
+
+        :return: None.
+        """
+        hooks, self._hooks = sorted(self._hooks), []
+        for _, _, name, func in hooks:
+            try:
+                func()
+            except Exception as e:
+                logging.error(f'Cleanup hook {name} failed: {e}')
+
+    def finish(self, timeout=10):
+        """
+        Drains in-flight work for up to `timeout` seconds, then runs the
+        cleanup hooks. Only the first call does anything.
+
+        :param timeout: float; seconds to give in-flight work.
+        :return: None.
+        """
+        if self._finished:
+            return
+        self._finished = True
+
+        self.request('finishing')
+        self.drain(timeout)
+        self.run_hooks()
+        logging.info(f'Shutdown complete ({self.reason}).')
+
+
+# shared by everything in the process
+shutdown = ShutdownCoordinator()
+
+# bots that never reach the end of `run_until_dead()` still get cleaned up
+atexit.register(shutdown.finish, 0)
@@ -0,0 +1,145 @@
+import logging
+import os
+import time
+
+from tor_core.config import ConfigSnapshot
+from tor_core.config import thaw
+from tor_core.state_store import decode
+from tor_core.state_store import encode
+
+# What the heartbeat reports while a bot starts up. A bot is `warm` while it
+# runs on the state handed over by the process it replaced and reloads the
+# configuration from Reddit in the background.
+STARTING = 'starting'
+LOADING_CONFIG = 'loading_config'
+WARM = 'warm'
+READY = 'ready'
+STOPPING = 'stopping'
+
+HANDOFF_PREFIX = 'tor_handoff:'
+
+# Handoffs older than this many seconds are ignored; the configuration on
+# Reddit may well have changed since.
+HANDOFF_MAX_AGE = 10 * 60
+
+
+def set_phase(config, phase):
+    """
+    Records the startup phase of the bot for the heartbeat.
+
+    :param config: the global config object.
+    :param phase: String. One of the phases above.
+    :return: None.
+    """
+    config.startup_phase = phase
+    config.startup_phases.append((phase, time.time()))
+    logging.info(f'Startup phase: {phase}')
+
+
+def register_warm_state(config, name, dump, restore):
+    """
+    Adds a cache or other piece of state of the bot to the handoff, so that
+    the next process starts with it. If this process was handed a copy of it,
+    it is restored straight away.
+
+    :param config: the global config object.
+    :param name: String. A name for the state, unique to the bot.
+    :param dump: function taking no arguments and returning the state as
+        something JSON can hold (plus sets and naive datetimes).
+    :param restore: function taking what `dump` returned.
+    :return: None.
+    """
+    config.warm_state[name] = (dump, restore)
+    if name in config.handoff_state:
+        restore(config.handoff_state.pop(name))
+
+
+def _handoff_key(config):
+    return HANDOFF_PREFIX + config.name
+
+
+def write_handoff(config):
+    """
+    Saves the warm state of the bot for the process replacing it: the
+    configuration loaded from Reddit, `last_post_scan_time` and everything
+    added with `register_warm_state()`. Goes to `config.handoff_file` if set,
+    otherwise to Redis; without either, nothing is handed over.
+
+    :param config: the global config object.
+    :return: None.
+    """
+    if not config.handoff_file and not config.require_redis:
+        logging.warning(
+            'Not handing over warm state: no handoff file and no Redis'
+        )
+        return
+
+    snapshot = config.snapshot._asdict()
+    del snapshot['version']
+
+    handoff = encode({
+        'written': time.time(),
+        'snapshot': {name: thaw(value) for name, value in snapshot.items()},
+        'last_post_scan_time': config.last_post_scan_time,
+        'warm_state': {
+            name: dump() for name, (dump, restore) in config.warm_state.items()
+        },
+    })
+
+    if config.handoff_file:
+        temporary = config.handoff_file + '.tmp'
+        with open(temporary, 'w') as handoff_file:
+            handoff_file.write(handoff)
+        # the next process never reads half a file
+        os.replace(temporary, config.handoff_file)
+    else:
+        config.redis.set(_handoff_key(config), handoff, ex=HANDOFF_MAX_AGE)
+
+    logging.info('Wrote warm state for the next process')
+
+
+def _read_handoff(config):
+    if config.handoff_file:
+        try:
+            with open(config.handoff_file) as handoff_file:
+                return handoff_file.read()
+        except OSError:
+            return None
+    if not config.require_redis:
+        return None
+
+    handoff = config.redis.get(_handoff_key(config))
+    return handoff.decode() if handoff else None
+
+
+def load_handoff(config):
+    """
+    Picks up the warm state left by `write_handoff()` in the previous
+    process, if there is a recent one.
+
+    :param config: the global config object.
+    :return: bool; whether the warm state was loaded.
+    """
+    text = _read_handoff(config)
+    if not text:
+        return False
+
+    handoff = decode(text)
+    age = time.time() - handoff['written']
+    if age > HANDOFF_MAX_AGE:
+        logging.info(f'Ignoring warm state from {age:.0f} seconds ago')
+        return False
+
+    snapshot = handoff['snapshot']
+    if set(snapshot) != set(ConfigSnapshot._fields) - {'version'}:
+        # written by a version of tor_core with different configuration
+        logging.info('Ignoring warm state from another version of tor_core')
+        return False
+
+    config.replace(**snapshot)
+    config.last_post_scan_time = handoff['last_post_scan_time']
+    # restored as the bot registers them, usually after build_bot()
+    config.handoff_state = handoff['warm_state']
+
+    logging.info(f'Loaded warm state from {age:.0f} seconds ago')
+    return True
@@ -0,0 +1,234 @@
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+
+from tor_core.shutdown import shutdown
+
+# Where bots keep their state between runs unless told otherwise.
+STATE_FILE = 'tor_state.db'
+
+# How often pending changes are written out, and how many may pile up before
+# they're written out early.
+FLUSH_INTERVAL = 1.0
+MAX_PENDING = 1000
+
+# The WAL is folded back into the database every this many flushes, so it
+# doesn't grow without bound.
+CHECKPOINT_EVERY = 100
+
+_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+_deleted = object()
+
+
+def _encode_default(value):
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.strftime(_DATETIME_FORMAT)}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f'Cannot store {type(value).__name__} in the state store')
+
+
+def _decode_hook(obj):
+    if '__datetime__' in obj:
+        return datetime.datetime.strptime(
+            obj['__datetime__'], _DATETIME_FORMAT
+        )
+    return obj
+
+
+def encode(value):
+    """
+    Serializes a value the way the state store keeps it: as JSON, with sets
+    and naive datetimes allowed as well.
+
+    :param value: the value to serialize.
+    :return: String.
+    """
+    return json.dumps(value, default=_encode_default)
+
+
+def decode(text):
+    """
+    The reverse of `encode()`.
+
+    :param text: String.
+    :return: the value.
+    """
+    return json.loads(text, object_hook=_decode_hook)
+
+
+class StateStore(object):
+    """
+    A small key-value store for state a bot wants to keep across restarts,
+    backed by a local SQLite database in WAL mode.
+
+    Everything is held in memory, so reads are free and `set()` only queues
+    the change. A background thread writes queued changes out every
+    `flush_interval` seconds, all of them in one transaction, so the database
+    always holds a consistent snapshot: after a crash, the bot gets back the
+    state as of the last flush, at most `flush_interval` seconds old.
+
+    Values can be anything JSON can hold, plus sets (which come back as
+    lists) and naive datetimes.
+    """
+
+    def __init__(
+        self,
+        path=STATE_FILE,
+        flush_interval=FLUSH_INTERVAL,
+        max_pending=MAX_PENDING,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # committed flushes survive the bot crashing; a power cut may roll
+        # back the last few, but can't corrupt the file
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS state '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+        )
+        self._db.commit()
+
+        self._lock = threading.Lock()
+        self._values = {
+            key: decode(value)
+            for key, value in self._db.execute('SELECT key, value FROM state')
+        }
+        self._pending = {}
+        self._flushes = 0
+
+        self._wake = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(
+            target=self._flush_periodically,
+            name='state-store',
+            daemon=True,
+        )
+        self._flusher.start()
+
+        logging.debug(f'Loaded {len(self._values)} keys from {path}')
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def set(self, key, value):
+        """
+        Stores a value. It is written to disk with the next flush.
+
+        :param key: String.
+        :param value: anything JSON can hold, a set or a naive datetime.
+        :return: None.
+        """
+        # encoding now means a bad value fails here rather than on the
+        # flusher thread, and later changes to a mutable value don't leak in
+        encoded = encode(value)
+        with self._lock:
+            self._values[key] = value
+            self._pending[key] = encoded
+            backlog = len(self._pending)
+
+        if backlog >= self.max_pending:
+            self._wake.set()
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+            self._pending[key] = _deleted
+
+    def flush(self):
+        """
+        Writes every pending change to disk in a single transaction.
+
+        :return: int; the number of changes written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        upserts = [(k, v) for k, v in pending.items() if v is not _deleted]
+        deletes = [(k,) for k, v in pending.items() if v is _deleted]
+
+        with self._db_lock:
+            try:
+                with self._db:
+                    self._db.executemany(
+                        'INSERT OR REPLACE INTO state (key, value) '
+                        'VALUES (?, ?)',
+                        upserts,
+                    )
+                    self._db.executemany(
+                        'DELETE FROM state WHERE key = ?', deletes
+                    )
+            except sqlite3.Error:
+                # try again with the next flush, unless they've been
+                # changed again since
+                with self._lock:
+                    for key, value in pending.items():
+                        self._pending.setdefault(key, value)
+                raise
+
+            self._flushes += 1
+            if self._flushes % CHECKPOINT_EVERY == 0:
+                self._db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+        return len(pending)
+
+    def _flush_periodically(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logging.error(f'Failed to write state to {self.path}: {e}')
+
+    def close(self):
+        """
+        Writes out pending changes and closes the database.
+
+        :return: None.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._flusher.join()
+
+        self.flush()
+        with self._db_lock:
+            self._db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            self._db.close()
+
+
+def open_state_store(config, path=STATE_FILE):
+    """
+    Opens the bot's state store as `config.state`, restores the state kept
+    on the config object itself (`last_post_scan_time`) and makes sure the
+    store is closed on shutdown.
+
+    :param config: the global config object.
+    :param path: String. The database file.
+    :return: StateStore.
+    """
+    config.state = StateStore(path)
+    shutdown.register(config.state.close, name='close state store')
+
+    if 'last_post_scan_time' in config.state:
+        config.last_post_scan_time = config.state.get('last_post_scan_time')
+
+    logging.info(f'State store at {path} opened')
+    return config.state
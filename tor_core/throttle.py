@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+
+import redis.exceptions
+
+from tor_core.shutdown import shutdown
+
+KEY_PREFIX = 'tor_throttle:'
+
+# A bot that hasn't asked for a token in this many seconds no longer counts
+# towards the shares of the others.
+ACTIVE_WINDOW = 60
+
+# The longest we wait before asking the bucket again, so that a change in the
+# other bots' demand is noticed.
+MAX_WAIT = 5
+
+# Takes `cost` tokens for a bot from the bucket shared by every bot using the
+# same OAuth client, if it can have them.
+#
+# Besides the shared bucket, every bot that asked in the last `window` seconds
+# has a bucket of its own, refilled at its fair share of `rate` (its weight
+# over the total weight of the active bots). A bot needs tokens in both to go
+# ahead, except that it may borrow from the shared bucket while that is at
+# least half full, i.e. while the others aren't using their shares.
+#
+# KEYS: bucket hash, active bots sorted set
+# ARGV: bot, weight, cost, rate (tokens/s), burst, now (s), window (s)
+# Returns 0 if the tokens were taken, or the milliseconds to wait otherwise.
+_TAKE = """
+local bot, weight, cost = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local rate, burst = tonumber(ARGV[4]), tonumber(ARGV[5])
+local now, window = tonumber(ARGV[6]), tonumber(ARGV[7])
+
+redis.call('zadd', KEYS[2], now, bot)
+redis.call('hset', KEYS[1], 'weight:' .. bot, weight)
+local gone = redis.call('zrangebyscore', KEYS[2], '-inf', now - window)
+for _, name in ipairs(gone) do
+    redis.call('hdel', KEYS[1], 'weight:' .. name,
+               'tokens:bot:' .. name, 'ts:bot:' .. name)
+end
+redis.call('zremrangebyscore', KEYS[2], '-inf', now - window)
+
+local total = 0
+for _, name in ipairs(redis.call('zrange', KEYS[2], 0, -1)) do
+    total = total + tonumber(redis.call('hget', KEYS[1], 'weight:' .. name))
+end
+local share = weight / total
+
+local function refill(field, fill_rate, cap)
+    local tokens = tonumber(redis.call('hget', KEYS[1], 'tokens:' .. field))
+    local ts = tonumber(redis.call('hget', KEYS[1], 'ts:' .. field))
+    if not tokens then
+        return cap, now
+    end
+    -- the clocks of different hosts may disagree a little; never go back
+    local stamp = math.max(now, ts)
+    return math.min(cap, tokens + (stamp - ts) * fill_rate), stamp
+end
+
+local own_rate = rate * share
+local shared, shared_ts = refill('bucket', rate, burst)
+local own, own_ts = refill('bot:' .. bot, own_rate,
+                           math.max(cost, burst * share))
+local spare = math.max(cost, burst / 2)
+
+local wait = 0
+if shared >= cost and own >= cost then
+    shared = shared - cost
+    own = own - cost
+elseif shared >= spare then
+    shared = shared - cost
+else
+    local own_wait = math.max((cost - shared) / rate,
+                              (cost - own) / own_rate)
+    wait = math.min(own_wait, (spare - shared) / rate)
+end
+
+redis.call('hset', KEYS[1], 'tokens:bucket', shared)
+redis.call('hset', KEYS[1], 'ts:bucket', shared_ts)
+redis.call('hset', KEYS[1], 'tokens:bot:' .. bot, own)
+redis.call('hset', KEYS[1], 'ts:bot:' .. bot, own_ts)
+redis.call('pexpire', KEYS[1], window * 1000)
+redis.call('pexpire', KEYS[2], window * 1000)
+return math.ceil(wait * 1000)
+"""
+
+
+class RedditThrottle(object):
+    """
+    A token bucket in Redis shared by every bot process using the same
+    Reddit OAuth client, which every Reddit API request draws a token from.
+
+    Reddit's rate limit applies to the OAuth client as a whole, but prawcore
+    only paces the requests of its own process; bots sharing credentials in
+    praw.ini run into `RATELIMIT` errors together. Drawing from one bucket
+    keeps them under `config.reddit_rate_limit` between them, and the bucket
+    is split between the bots making requests according to their
+    `config.throttle_weight`, so that a busy bot can't starve the others.
+
+    If Redis can't be reached, requests go ahead unthrottled.
+    """
+
+    def __init__(self, config):
+        """
+        :param config: the config object of the bot; its `r` must be set up
+            by the time the first request is made.
+        """
+        self.config = config
+        self._key = None
+        self._take = None
+        self._lock = threading.Lock()
+
+        self.granted = 0
+        self.waits = 0
+        self.waited = 0.0
+        self.errors = 0
+
+    def _script(self):
+        if self._take is None:
+            client_id = self.config.r.config.client_id
+            self._key = KEY_PREFIX + client_id
+            self._take = self.config.redis.register_script(_TAKE)
+        return self._take
+
+    def acquire(self, cost=1):
+        """
+        Waits until the bot may make `cost` more requests. Returns early if
+        the bot is shutting down.
+
+        :param cost: int; the number of requests about to be made.
+        :return: None.
+        """
+        if not self.config.require_redis:
+            return
+
+        while True:
+            try:
+                wait = self._script()(
+                    keys=[self._key, self._key + ':active'],
+                    args=[
+                        self.config.name,
+                        self.config.throttle_weight,
+                        cost,
+                        self.config.reddit_rate_limit,
+                        self.config.reddit_burst,
+                        time.time(),
+                        ACTIVE_WINDOW,
+                    ],
+                )
+            except redis.exceptions.RedisError as e:
+                logging.debug(f'Reddit throttle unavailable: {e}')
+                with self._lock:
+                    self.errors += 1
+                return
+
+            if not wait:
+                with self._lock:
+                    self.granted += 1
+                return
+
+            seconds = min(int(wait) / 1000, MAX_WAIT)
+            with self._lock:
+                self.waits += 1
+                self.waited += seconds
+            if shutdown.wait(seconds):
+                return
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'granted': self.granted,
+                'waits': self.waits,
+                'waited': round(self.waited, 3),
+                'errors': self.errors,
+            }
@@ -0,0 +1,261 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from slackclient.slackrequest import SlackRequest
+
+from tor_core.breaker import HTTPCircuitOpen
+from tor_core.breaker import get_breaker
+
+# Timeouts for establishing a connection and for waiting on the response.
+# Connecting should be fast; slightly above a multiple of 3 seconds so that a
+# single dropped SYN is retransmitted before we give up. The read timeout
+# matches prawcore's default.
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 16
+
+# Connections kept alive per host. PRAW talks to two hosts (www and oauth),
+# modchat to one, so this is plenty for a single-threaded bot.
+POOL_SIZE = 10
+
+# Parts of a URL path that vary per request. Collapsing them keeps the
+# latency counters down to one entry per endpoint.
+_path_patterns = [
+    (re.compile(r'/r/[^/]+'), '/r/{subreddit}'),
+    (re.compile(r'/(u|user)/[^/]+'), '/user/{name}'),
+    (re.compile(r'/comments/[^/]+(/[^/]*)?(/[^/]+)?'), '/comments/{id}'),
+    (re.compile(r'/by_id/[^/]+'), '/by_id/{fullname}'),
+]
+
+
+# Hosts with a circuit breaker of their own (see tor_core.breaker), so that
+# Slack having a bad day doesn't hold up requests to Reddit or vice versa
+_breaker_hosts = (
+    ('reddit.com', 'reddit'),
+    ('slack.com', 'slack'),
+)
+
+
+def breaker_for(url):
+    """
+    :param url: String. The full URL of a request.
+    :return: the CircuitBreaker guarding the host, or None.
+    """
+    host = urlsplit(url).hostname or ''
+    for domain, name in _breaker_hosts:
+        if host == domain or host.endswith('.' + domain):
+            return get_breaker(name)
+    return None
+
+
+def endpoint_name(method, url):
+    """
+    Reduces a request to the endpoint it hits, e.g. `GET /r/{subreddit}/new`.
+
+    :param method: String. The HTTP method.
+    :param url: String. The full URL of the request.
+    :return: String. The method and templated path.
+    """
+    path = urlsplit(url).path.rstrip('/') or '/'
+    for pattern, replacement in _path_patterns:
+        path = pattern.sub(replacement, path)
+    return f'{method.upper()} {path}'
+
+
+class LatencyCounter(object):
+    """
+    Running request count, response sizes and response times for one
+    endpoint. Percentiles are worked out from the most recent `window`
+    requests.
+    """
+
+    __slots__ = ('count', 'errors', 'bytes', 'total', 'max', 'recent')
+
+    def __init__(self, window=500):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds, failed=False, size=0):
+        self.count += 1
+        self.errors += failed
+        self.bytes += size
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, fraction):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+        }
+
+
+def pooled_adapter(pool_size=POOL_SIZE):
+    """
+    Builds the connection pool behind a TunedSession. Sessions given the same
+    adapter share its keep-alive connections.
+
+    :param pool_size: int; connections kept alive per host.
+    :return: HTTPAdapter.
+    """
+    # retries are prawcore's job; doing them here as well would multiply
+    # them and hide the failures from its back off
+    return HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=0,
+    )
+
+
+class TunedSession(requests.Session):
+    """
+    A requests session shared by everything in the bot that goes out over
+    HTTP: PRAW (through prawcore's requestor), modchat, and anything else
+    that asks for `config.http`.
+
+    Connections are pooled and kept alive, responses are gzipped, every
+    request gets separate connect and read timeouts, response times are
+    counted per endpoint, and requests to a host that keeps failing fail fast
+    until it recovers. Sessions given the same `adapter` share one pool of
+    connections.
+    """
+
+    def __init__(
+        self,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        pool_size=POOL_SIZE,
+        adapter=None,
+    ):
+        super().__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        self.latency = {}
+        self._latency_lock = threading.Lock()
+
+        adapter = adapter or pooled_adapter(pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+        self.headers['Accept-Encoding'] = 'gzip, deflate'
+
+    def request(self, method, url, *args, **kwargs):
+        # prawcore passes its own flat timeout with every request; ours is
+        # the one that applies
+        kwargs['timeout'] = self.timeout
+
+        breaker = breaker_for(url)
+        if breaker is not None and not breaker.allow():
+            raise HTTPCircuitOpen(breaker.name)
+
+        started = time.monotonic()
+        failed, size = True, 0
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            failed = response.status_code >= 500
+            size = len(response.content)
+            return response
+        finally:
+            self._record(endpoint_name(method, url),
+                         time.monotonic() - started, failed, size)
+            if breaker is not None and failed:
+                breaker.failure()
+            elif breaker is not None:
+                breaker.success()
+
+    def _record(self, endpoint, seconds, failed, size=0):
+        with self._latency_lock:
+            counter = self.latency.get(endpoint)
+            if counter is None:
+                counter = self.latency[endpoint] = LatencyCounter()
+            counter.add(seconds, failed, size)
+
+    def latency_report(self):
+        """
+        :return: dict; the counters of every endpoint, keyed by endpoint.
+        """
+        with self._latency_lock:
+            return {
+                endpoint: counter.as_dict()
+                for endpoint, counter in self.latency.items()
+            }
+
+
+class SessionSlackRequest(SlackRequest):
+    """
+    The Slack client's requester, sending its calls through our session
+    instead of opening a new connection for every message.
+    """
+
+    def __init__(self, session, proxies=None):
+        super().__init__(proxies=proxies)
+        self.session = session
+
+    def post_http_request(self, token, api_method, post_data,
+                          files=None, timeout=None, domain='slack.com'):
+        if post_data is not None and 'token' in post_data:
+            token = post_data['token']
+
+        headers = {
+            'user-agent': self.get_user_agent(),
+            'Authorization': f'Bearer {token}',
+        }
+
+        return self.session.post(
+            f'https://{domain}/api/{api_method}',
+            headers=headers,
+            data=post_data,
+            files=files,
+            proxies=self.proxies,
+        )
+
+
+def configure_http(config):
+    """
+    Creates the shared HTTP session from the timeouts and pool size set on
+    the config object.
+
+    :param config: the global config object.
+    :return: None.
+    """
+    config.http = TunedSession(
+        connect_timeout=config.http_connect_timeout,
+        read_timeout=config.http_read_timeout,
+        pool_size=config.http_pool_size,
+    )
+    logging.debug(f'HTTP session ready with timeouts {config.http.timeout}')
+
+
+def use_session_for_modchat(config):
+    """
+    Points the modchat client at the shared HTTP session.
+
+    :param config: the global config object.
+    :return: None.
+    """
+    server = config.modchat.server
+    requester = SessionSlackRequest(
+        config.http, proxies=server.api_requester.proxies
+    )
+    requester.custom_user_agent = server.api_requester.custom_user_agent
+    server.api_requester = requester
@@ -0,0 +1,124 @@
+import logging
+import time
+
+from tor_core.archive_schedule import HeapArchiveSchedule
+
+# /api/info takes at most 100 fullnames per request
+BATCH_SIZE = 100
+
+# A post is re-checked after a tenth of its age has passed again, so a post
+# five minutes old is checked every 30 seconds while a post ten hours old is
+# checked once an hour. Together with batching, this keeps the number of
+# polls well below one per pending post per check.
+AGE_FACTOR = 0.1
+MIN_INTERVAL = 30
+MAX_INTERVAL = 60 * 60
+
+# posts which haven't made it past the filter by then never will
+MAX_AGE = 24 * 60 * 60
+
+
+class PendingPosts(object):
+    """
+    Keeps track of posts from subreddits in `config.upvote_filter_subs` that
+    haven't reached their subreddit's score threshold yet, and re-checks
+    their scores in batches until they do.
+    """
+
+    def __init__(self, max_age=MAX_AGE):
+        """
+        :param max_age: int; seconds after which a post that still hasn't
+            reached its threshold is dropped.
+        """
+        self.max_age = max_age
+        self._posts = {}
+        # not about archiving, but the archive schedule is exactly the
+        # fullname -> due time heap we need: re-adding a post reschedules it
+        # and pop_due() hands back whatever needs checking, oldest first
+        self._schedule = HeapArchiveSchedule()
+
+    def __len__(self):
+        return len(self._posts)
+
+    def __contains__(self, fullname):
+        return fullname in self._posts
+
+    def track(self, post, config, now=None):
+        """
+        Starts watching a post if it's from an upvote-filtered subreddit and
+        doesn't have enough upvotes yet.
+
+        :param post: the submission object on the partner subreddit.
+        :param config: the global config object.
+        :param now: float; the current epoch time. Defaults to time.time().
+        :return: bool; True if the post is being held back, False if it can
+            be processed right away.
+        """
+        threshold = config.upvote_filter_subs.get(str(post.subreddit))
+        if threshold is None or post.score >= threshold:
+            return False
+
+        now = time.time() if now is None else now
+        self._posts[post.fullname] = (threshold, post.created_utc)
+        self._schedule.add(post.fullname, self._next_check(post, now))
+        return True
+
+    def refresh(self, config, now=None, limit=None):
+        """
+        Fetches the current scores of every post that is due for a check.
+
+        :param config: the global config object.
+        :param now: float; the current epoch time. Defaults to time.time().
+        :param limit: int; the maximum number of posts to check, to bound
+            the time spent in one loop iteration.
+        :return: list of submission objects which have now reached their
+            threshold and are no longer tracked.
+        """
+        now = time.time() if now is None else now
+        due = self._schedule.pop_due(now=now, limit=limit or len(self))
+        passed = []
+
+        for start in range(0, len(due), BATCH_SIZE):
+            batch = due[start:start + BATCH_SIZE]
+            try:
+                fetched = list(config.r.info(batch))
+            except Exception as e:
+                # the posts are off the schedule by now; put back everything
+                # not checked yet so they get another go, and hand over the
+                # ones that already passed
+                logging.warning(f'Failed to check upvote-filtered posts: {e}')
+                for fullname in due[start:]:
+                    self._schedule.add(fullname, now + MIN_INTERVAL)
+                break
+            found = set()
+
+            for post in fetched:
+                found.add(post.fullname)
+                threshold, created_utc = self._posts[post.fullname]
+
+                if post.score >= threshold:
+                    del self._posts[post.fullname]
+                    passed.append(post)
+                elif now - created_utc > self.max_age:
+                    del self._posts[post.fullname]
+                else:
+                    self._schedule.add(
+                        post.fullname, self._next_check(post, now)
+                    )
+
+            # anything Reddit didn't return has been deleted
+            for fullname in set(batch) - found:
+                del self._posts[fullname]
+
+        if due:
+            logging.debug(
+                f'Checked {len(due)} upvote-filtered posts, {len(passed)} '
+                f'passed, {len(self)} still pending'
+            )
+        return passed
+
+    @staticmethod
+    def _next_check(post, now):
+        age = max(now - post.created_utc, 0)
+        interval = min(max(age * AGE_FACTOR, MIN_INTERVAL), MAX_INTERVAL)
+        return now + interval
@@ -0,0 +1,233 @@
+import re
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+# Parsers for the configuration kept on the r/ToR wiki.
+#
+# Every parser works through the page line by line, whatever the line endings,
+# and never gives up on a whole page because of one bad line: lines that
+# can't be parsed are skipped and reported as WikiParseErrors in the `errors`
+# list passed in, so that the caller can log them and carry on with the rest.
+
+ArchiveTimes = namedtuple('ArchiveTimes', ['default', 'subreddits'])
+
+_markdown_link = re.compile(r'\]\(\s*<?([^)\s>]+)>?[^)]*\)')
+
+
+class WikiParseError(ValueError):
+    """
+    A line of a wiki page that couldn't be parsed.
+    """
+
+    def __init__(self, lineno, line, reason):
+        super().__init__(f'line {lineno}: {reason}: {line!r}')
+        self.lineno = lineno
+        self.line = line
+        self.reason = reason
+
+
+def iter_lines(text):
+    """
+    Yields the stripped, non-empty lines of a wiki page along with their line
+    numbers. Handles `\\n` and `\\r\\n` alike.
+
+    :param text: String or None. The content of the wiki page.
+    :return: generator of (line number, line) tuples.
+    """
+    if not text:
+        return
+
+    # splitlines() is the one copy of the page we make, and it's done in C
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if line:
+            yield lineno, line
+
+
+def _report(errors, lineno, line, reason):
+    if errors is not None:
+        errors.append(WikiParseError(lineno, line, reason))
+
+
+def parse_list(text, errors=None):
+    """
+    Parses a page with one entry per line, e.g. the list of subreddits.
+
+    :param text: String or None. The content of the wiki page.
+    :param errors: list to collect WikiParseErrors in. Unused here, but
+        accepted so that every parser can be called the same way.
+    :return: list of strings.
+    """
+    return [line for _, line in iter_lines(text)]
+
+
+def _parse_pair(lineno, line, errors):
+    name, sep, value = line.partition(',')
+    name = name.strip()
+    if not sep or not name:
+        _report(errors, lineno, line, 'expected `subreddit,number`')
+        return None
+
+    try:
+        return name, int(value)
+    except ValueError:
+        _report(errors, lineno, line, 'not a number')
+        return None
+
+
+def parse_thresholds(text, errors=None):
+    """
+    Parses a page of `subreddit,number` lines, such as the upvote filter.
+
+    :param text: String or None. The content of the wiki page.
+    :param errors: list to collect WikiParseErrors in.
+    :return: dict mapping subreddit names to ints.
+    """
+    thresholds = {}
+    if not text:
+        return thresholds
+
+    for lineno, line in enumerate(text.splitlines(), 1):
+        # the happy path, kept cheap since these pages can get long
+        try:
+            name, value = line.split(',')
+            name = name.strip()
+            if name:
+                thresholds[name] = int(value)
+                continue
+        except ValueError:
+            pass
+
+        line = line.strip()
+        if line:
+            pair = _parse_pair(lineno, line, errors)
+            if pair:
+                thresholds[pair[0]] = pair[1]
+
+    return thresholds
+
+
+def parse_archive_times(text, errors=None):
+    """
+    Parses the archive time page: the default archive time on the first line,
+    followed by `subreddit,number` overrides. Subreddit names are lowercased.
+
+    :param text: String or None. The content of the wiki page.
+    :param errors: list to collect WikiParseErrors in.
+    :return: ArchiveTimes; `default` is None if the first line is missing or
+        not a number.
+    """
+    lines = iter_lines(text)
+    default = None
+
+    for lineno, line in lines:
+        try:
+            default = int(line)
+        except ValueError:
+            _report(errors, lineno, line, 'default archive time not a number')
+        break
+
+    subreddits = {}
+    for lineno, line in lines:
+        pair = _parse_pair(lineno, line, errors)
+        if pair:
+            subreddits[pair[0].lower()] = pair[1]
+
+    return ArchiveTimes(default, subreddits)
+
+
+def parse_urls(text, errors=None):
+    """
+    Parses a page listing one URL per line, such as the useful GIFs. Lines
+    may be bare URLs, list items or markdown links; headings are skipped.
+    Duplicates are dropped.
+
+    :param text: String or None. The content of the wiki page.
+    :param errors: list to collect WikiParseErrors in.
+    :return: list of URL strings, in the order they first appear.
+    """
+    urls = []
+    seen = set()
+
+    for lineno, line in iter_lines(text):
+        if line.startswith('#'):
+            continue
+
+        link = _markdown_link.search(line)
+        if link:
+            url = link.group(1)
+        else:
+            url = line.lstrip('*-+ ').strip('<>')
+
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            _report(errors, lineno, line, 'not a URL')
+            continue
+
+        if url not in seen:
+            seen.add(url)
+            urls.append(url)
+
+    return urls
+
+
+def _split_domains(chunks):
+    return [d for d in map(str.strip, ','.join(chunks).split(',')) if d]
+
+
+def parse_domains(text, errors=None):
+    """
+    Parses the domain whitelist page, made up of sections separated by `---`
+    which look like this, with the list allowed to span several lines:
+
+        video: [youtube.com, youtu.be, vimeo.com]
+
+    :param text: String or None. The content of the wiki page.
+    :param errors: list to collect WikiParseErrors in.
+    :return: dict mapping the section name (`video`, `audio`, `images`) to
+        its list of domains.
+    """
+    domains = {}
+    section = None
+    chunks = None
+    lineno = 0
+
+    def close_section():
+        domains.setdefault(section, []).extend(_split_domains(chunks))
+
+    for lineno, line in iter_lines(text):
+        if line.startswith('---'):
+            if chunks is not None:
+                _report(errors, lineno, line, f'unclosed list in {section}')
+                close_section()
+            section, chunks = None, None
+            continue
+
+        if chunks is None:
+            if section is not None:
+                _report(errors, lineno, line, f'text after {section} list')
+                continue
+
+            name, sep, line = line.partition('[')
+            name = name.strip().rstrip(':').strip().lower()
+            if not sep or not name:
+                _report(errors, lineno, name + sep + line,
+                        'expected `name: [domains]`')
+                continue
+            section, chunks = name, []
+
+        if ']' in line:
+            line, _, trailing = line.partition(']')
+            if trailing.strip():
+                _report(errors, lineno, trailing, 'text after the list')
+            chunks.append(line)
+            close_section()
+            chunks = None
+        else:
+            chunks.append(line)
+
+    if chunks is not None:
+        _report(errors, lineno, section, f'unclosed list in {section}')
+        close_section()
+
+    return domains
@@ -0,0 +1,296 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+
+import redis.exceptions
+
+from tor_core.shutdown import shutdown
+
+KEY_PREFIX = 'tor_queue:'
+
+# every entry carries a single field holding the fullname of the post
+_FIELD = b'fullname'
+
+
+class WorkQueue(object):
+    """
+    A queue of post fullnames shared by any number of bot processes, built on
+    a Redis stream with a consumer group.
+
+    Every entry is handed to exactly one consumer. It stays pending until that
+    consumer acknowledges it; entries left pending for longer than
+    `claim_idle` seconds (because the consumer crashed or the handler raised)
+    are claimed by the next consumer to look for work, up to `max_retries`
+    times. After that they are moved to the `<queue>:dead` stream for a human
+    to look at.
+
+    Stream commands are sent with `execute_command()` because the redis client
+    we're pinned to predates them; Redis itself needs to be 5.0 or newer.
+    """
+
+    def __init__(
+        self,
+        name,
+        config,
+        group='workers',
+        consumer=None,
+        claim_idle=60,
+        max_retries=5,
+        maxlen=100000,
+    ):
+        """
+        :param name: string; the name of the queue.
+        :param config: the global config object.
+        :param group: string; the consumer group. Every group sees every
+            entry, so use a different group for each kind of work.
+        :param consumer: string; the name of this consumer within the group.
+            Defaults to something unique to this process.
+        :param claim_idle: int; seconds before a pending entry is considered
+            abandoned and is handed to another consumer.
+        :param max_retries: int; deliveries before an entry is given up on.
+        :param maxlen: int; the approximate number of entries to keep in the
+            stream, so it doesn't grow forever.
+        """
+        self.config = config
+        self.key = KEY_PREFIX + name
+        self.dead_key = self.key + ':dead'
+        self.group = group
+        self.consumer = consumer or (
+            f'{config.name}:{socket.gethostname()}:{os.getpid()}'
+        )
+        self.claim_idle = claim_idle
+        self.max_retries = max_retries
+        self.maxlen = maxlen
+
+        self._group_created = False
+
+    def _ensure_group(self):
+        if self._group_created:
+            return
+
+        try:
+            self.config.redis.execute_command(
+                'XGROUP', 'CREATE', self.key, self.group, '0', 'MKSTREAM'
+            )
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_created = True
+
+    def push(self, *fullnames):
+        """
+        Adds posts to the queue.
+
+        :param fullnames: strings; the fullnames of the posts, e.g. `t3_abc`.
+        :return: None.
+        """
+        self._ensure_group()
+
+        pipe = self.config.redis.pipeline(transaction=False)
+        for fullname in fullnames:
+            pipe.execute_command(
+                'XADD', self.key, 'MAXLEN', '~', self.maxlen, '*',
+                _FIELD, fullname
+            )
+        pipe.execute()
+
+    def claim(self, count=10, block=1000):
+        """
+        Takes new entries off the queue for this consumer.
+
+        :param count: int; the maximum number of entries to take.
+        :param block: int; milliseconds to wait for new entries if there
+            aren't any. None to return immediately.
+        :return: list of (entry id, fullname) tuples.
+        """
+        self._ensure_group()
+
+        args = ['XREADGROUP', 'GROUP', self.group, self.consumer,
+                'COUNT', count]
+        if block is not None:
+            args += ['BLOCK', block]
+        args += ['STREAMS', self.key, '>']
+
+        response = self.config.redis.execute_command(*args)
+        if not response:
+            return []
+
+        _, entries = response[0]
+        return _parse_entries(entries)
+
+    def reclaim(self, count=10):
+        """
+        Takes over entries that another consumer left pending for too long.
+        Entries that have already been delivered `max_retries` times are
+        moved to the dead letter stream instead.
+
+        :param count: int; the maximum number of pending entries to look at.
+        :return: list of (entry id, fullname) tuples.
+        """
+        self._ensure_group()
+
+        pending = self.config.redis.execute_command(
+            'XPENDING', self.key, self.group, '-', '+', count
+        )
+
+        idle_ms = self.claim_idle * 1000
+        stale = [
+            (entry_id, deliveries)
+            for entry_id, _, idle, deliveries in pending
+            if idle >= idle_ms
+        ]
+        if not stale:
+            return []
+
+        dead = [e for e, deliveries in stale if deliveries >= self.max_retries]
+        if dead:
+            self._bury(dead)
+
+        retry = [e for e, deliveries in stale if deliveries < self.max_retries]
+        if not retry:
+            return []
+
+        entries = self.config.redis.execute_command(
+            'XCLAIM', self.key, self.group, self.consumer, idle_ms, *retry
+        )
+        claimed = _parse_entries(entries)
+        if claimed:
+            logging.info(
+                f'Reclaimed {len(claimed)} abandoned entries from {self.key}'
+            )
+        return claimed
+
+    def ack(self, *entry_ids):
+        """
+        Marks entries as done so they won't be handed out again.
+
+        :param entry_ids: the ids returned by `claim()` or `reclaim()`.
+        :return: None.
+        """
+        if entry_ids:
+            self.config.redis.execute_command(
+                'XACK', self.key, self.group, *entry_ids
+            )
+
+    def _bury(self, entry_ids):
+        pipe = self.config.redis.pipeline(transaction=False)
+        for entry_id in entry_ids:
+            pipe.execute_command('XRANGE', self.key, entry_id, entry_id)
+        found = [entry for result in pipe.execute() for entry in result]
+
+        pipe = self.config.redis.pipeline()
+        for _, fullname in _parse_entries(found):
+            pipe.execute_command('XADD', self.dead_key, '*', _FIELD, fullname)
+        pipe.execute_command('XACK', self.key, self.group, *entry_ids)
+        pipe.execute()
+
+        logging.error(
+            f'Gave up on {len(entry_ids)} entries from {self.key} after '
+            f'{self.max_retries} attempts'
+        )
+
+
+def _parse_entries(entries):
+    parsed = []
+    for entry_id, fields in entries or []:
+        if fields is None:
+            # trimmed off the stream while it was pending
+            continue
+        fields = dict(zip(fields[::2], fields[1::2]))
+        parsed.append((entry_id, fields[_FIELD].decode()))
+    return parsed
+
+
+def queue_worker(name, handler, batch_size=10, **queue_kwargs):
+    """
+    Builds a function suitable for `run_until_dead()` that works through the
+    named queue, calling `handler(config, fullname)` for every post. Entries
+    are acknowledged once the handler returns; if it raises, the entry is left
+    for a later retry. Once a shutdown is requested, the rest of the batch is
+    left for another worker to reclaim.
+
+    Any extra keyword arguments are passed on to `WorkQueue`.
+
+    :param name: string; the name of the queue.
+    :param handler: function; called with the config object and a fullname.
+    :param batch_size: int; the number of entries to take at a time.
+    :return: function; the job to give to `run_until_dead()`.
+    """
+    queue = None
+
+    def work(config):
+        nonlocal queue
+        if queue is None:
+            queue = WorkQueue(name, config, **queue_kwargs)
+
+        for entry_id, fullname in (
+            queue.reclaim(batch_size) or queue.claim(batch_size)
+        ):
+            if shutdown.requested:
+                break
+            try:
+                with shutdown.in_flight():
+                    handler(config, fullname)
+            except Exception as e:
+                logging.error(f'Failed to process {fullname}: {e}')
+                continue
+            queue.ack(entry_id)
+
+    return work
+
+
+def _consume(build, name, handler, queue_kwargs):
+    # imported here so the module can be imported without PRAW around
+    from tor_core.helpers import run_until_dead
+
+    build()
+    run_until_dead(queue_worker(name, handler, **queue_kwargs))
+
+
+def run_consumer_pool(build, name, handler, processes=None, **queue_kwargs):
+    """
+    Starts a number of worker processes which all consume the named queue, and
+    waits for them to finish. Each process builds its own bot so that it has
+    its own Reddit session and Redis connection.
+
+    Example:
+
+        run_consumer_pool(
+            lambda: build_bot('tor_ocr', __version__),
+            'ocr', process_post, processes=4
+        )
+
+    :param build: function; called without arguments in every worker process
+        to set up the bot, usually a wrapper around `build_bot()`.
+    :param name: string; the name of the queue.
+    :param handler: function; called with the config object and a fullname.
+    :param processes: int; the number of worker processes. Defaults to the
+        number of CPUs.
+    :return: None.
+    """
+    processes = processes or multiprocessing.cpu_count()
+
+    workers = [
+        multiprocessing.Process(
+            target=_consume,
+            args=(build, name, handler, queue_kwargs),
+            name=f'{name}-worker-{i}',
+        )
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # CTRL+C reaches the workers directly; they shut themselves down through
+    # run_until_dead() and we just wait for them. SIGTERM is usually only sent
+    # to us, so pass it on.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(
+        signal.SIGTERM,
+        lambda signum, frame: [worker.terminate() for worker in workers]
+    )
+
+    for worker in workers:
+        worker.join()